@@ -1,6 +1,8 @@
 from abc import ABC, abstractmethod
+from collections import defaultdict
 from typing import Dict, List, Optional
 import asyncio
+import uuid
 
 from models.models import (
     Document,
@@ -10,36 +12,231 @@ from models.models import (
     QueryResult,
     QueryWithEmbedding,
 )
-from services.chunks import get_document_chunks
-from services.openai import get_embeddings
+from datastore.upsert_manifest import (
+    DocumentManifest,
+    UpsertManifest,
+    chunk_hash,
+    document_hash,
+    get_upsert_manifest,
+)
+from datastore.upsert_pipeline import run_upsert_pipeline
+from services.chunks import create_all_document_chunks, embed_document_chunks
+from services.metrics import time_stage
+from services.mmr import diversify_result, mmr_candidates
+from services.query_embeddings import get_query_embeddings
+
+
+class ChunkObserver(ABC):
+    """
+    Sees the chunks written to a datastore and the deletes made to it, e.g. to keep a
+    secondary index of the chunks in sync with the datastore.
+    """
+
+    @abstractmethod
+    async def chunks_written(self, chunks: Dict[str, List[DocumentChunk]]) -> None:
+        """
+        Called with a dict from document id to the chunks written, once they are written.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def chunks_deleted(self, chunk_ids: Dict[str, List[str]]) -> None:
+        """
+        Called with a dict from document id to the ids of the chunks deleted, once they are deleted.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def deleted(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> None:
+        """
+        Called with the arguments of a delete of documents, by ids, filter, or everything, once it is done.
+        """
+        raise NotImplementedError
 
 
 class DataStore(ABC):
+    _upsert_manifest: Optional[UpsertManifest] = None
+    _upsert_manifest_loaded = False
+    _chunk_observers: List[ChunkObserver] = []
+
+    @property
+    def upsert_manifest(self) -> Optional[UpsertManifest]:
+        """
+        The manifest of the chunks written for each document, created from UPSERT_MANIFEST on first use.
+        None if incremental upserts are disabled.
+        """
+        if not self._upsert_manifest_loaded:
+            self._upsert_manifest = get_upsert_manifest()
+            self._upsert_manifest_loaded = True
+        return self._upsert_manifest
+
+    @upsert_manifest.setter
+    def upsert_manifest(self, manifest: Optional[UpsertManifest]) -> None:
+        self._upsert_manifest = manifest
+        self._upsert_manifest_loaded = True
+
+    def add_chunk_observer(self, observer: ChunkObserver) -> None:
+        """
+        Notify an observer of every chunk written to the datastore and every delete.
+        """
+        self._chunk_observers = [*self._chunk_observers, observer]
+
     async def upsert(
         self, documents: List[Document], chunk_token_size: Optional[int] = None
     ) -> List[str]:
         """
         Takes in a list of documents and inserts them into the database.
         First deletes all the existing vectors with the document id (if necessary, depends on the vector db), then inserts the new ones.
+        Large requests are split into groups of documents that are deleted, chunked, embedded and inserted in a pipeline.
+        If an upsert manifest is configured, only the chunks that changed since the last upsert are written instead.
         Return a list of document ids.
         """
-        # Delete any existing vectors for documents with the input document ids
-        await asyncio.gather(
-            *[
-                self.delete(
-                    filter=DocumentMetadataFilter(
-                        document_id=document.id,
-                    ),
-                    delete_all=False,
-                )
-                for document in documents
-                if document.id
-            ]
+        if self.upsert_manifest is not None:
+            return await self._incremental_upsert(
+                documents, chunk_token_size, self.upsert_manifest
+            )
+
+        # Delete, chunk, embed and write the documents in a pipeline, so that the stages overlap
+        return await run_upsert_pipeline(
+            documents,
+            chunk_token_size,
+            delete=self.delete_documents,
+            write=self._write_chunks,
+        )
+
+    async def _incremental_upsert(
+        self,
+        documents: List[Document],
+        chunk_token_size: Optional[int],
+        manifest: UpsertManifest,
+    ) -> List[str]:
+        """
+        Upserts documents using the manifest of what was last written for them: unchanged documents
+        are skipped, and only the new or changed chunks of the other documents are embedded and written.
+        Chunks that are still there keep their ids, and chunks that are gone are deleted.
+        Documents not in the manifest, or stored by a provider that can't delete single chunks,
+        are rewritten in full.
+        """
+        # Every document needs an id to be tracked, and the last document wins if an id is repeated
+        docs_by_id: Dict[str, Document] = {}
+        for doc in documents:
+            doc_id = doc.id or str(uuid.uuid4())
+            docs_by_id[doc_id] = doc.copy(update={"id": doc_id})
+
+        doc_hashes = {
+            doc_id: document_hash(doc.text, doc.metadata, chunk_token_size)
+            for doc_id, doc in docs_by_id.items()
+        }
+        old_manifests = await manifest.get_many(list(docs_by_id))
+        changed_docs = [
+            doc
+            for doc_id, doc in docs_by_id.items()
+            if doc_id not in old_manifests
+            or old_manifests[doc_id].document_hash != doc_hashes[doc_id]
+        ]
+        if not changed_docs:
+            return list(docs_by_id)
+
+        chunks = await create_all_document_chunks(changed_docs, chunk_token_size)
+        supports_chunk_deletes = (
+            type(self)._delete_chunks is not DataStore._delete_chunks
+        )
+
+        rewritten_doc_ids: List[str] = []
+        chunks_to_write: Dict[str, List[DocumentChunk]] = {}
+        chunk_ids_to_delete: Dict[str, List[str]] = {}
+        new_manifests: Dict[str, DocumentManifest] = {}
+        for doc in changed_docs:
+            doc_id = doc.id
+            doc_chunks = chunks.get(doc_id, [])
+            hashes = [chunk_hash(chunk) for chunk in doc_chunks]
+            old_manifest = old_manifests.get(doc_id)
+
+            if old_manifest is None or not supports_chunk_deletes:
+                rewritten_doc_ids.append(doc_id)
+                chunks_to_write[doc_id] = doc_chunks
+            else:
+                # Match the new chunks to the old chunks with the same content, which keep their ids
+                old_ids_by_hash: Dict[str, List[str]] = defaultdict(list)
+                for old_id, old_hash in old_manifest.chunks.items():
+                    old_ids_by_hash[old_hash].append(old_id)
+                kept_ids = set()
+                new_chunks = []
+                for chunk, content_hash in zip(doc_chunks, hashes):
+                    if old_ids_by_hash[content_hash]:
+                        chunk.id = old_ids_by_hash[content_hash].pop(0)
+                        kept_ids.add(chunk.id)
+                    else:
+                        new_chunks.append(chunk)
+
+                # Give the other chunks ids that were not used by the old chunks,
+                # so that writing them never overwrites a chunk that is kept
+                used_ids = set(old_manifest.chunks)
+                i = 0
+                for chunk in new_chunks:
+                    while f"{doc_id}_{i}" in used_ids:
+                        i += 1
+                    chunk.id = f"{doc_id}_{i}"
+                    used_ids.add(chunk.id)
+
+                if new_chunks:
+                    chunks_to_write[doc_id] = new_chunks
+                deleted_ids = [
+                    old_id for old_id in old_manifest.chunks if old_id not in kept_ids
+                ]
+                if deleted_ids:
+                    chunk_ids_to_delete[doc_id] = deleted_ids
+
+            new_manifests[doc_id] = DocumentManifest(
+                document_hash=doc_hashes[doc_id],
+                chunks={
+                    chunk.id: content_hash
+                    for chunk, content_hash in zip(doc_chunks, hashes)
+                },
+            )
+
+        # Documents that are rewritten in full are deleted first, as before
+        await self.delete_documents(rewritten_doc_ids)
+
+        await embed_document_chunks(
+            [chunk for doc_chunks in chunks_to_write.values() for chunk in doc_chunks]
         )
+        chunks_to_write = {
+            doc_id: doc_chunks
+            for doc_id, doc_chunks in chunks_to_write.items()
+            if doc_chunks
+        }
+        if chunks_to_write:
+            await self._write_chunks(chunks_to_write)
+
+        # The chunks that are gone are deleted after the new ones are written,
+        # so that a document is never missing from query results in between
+        if chunk_ids_to_delete:
+            with time_stage("provider_delete"):
+                chunks_deleted = await self._delete_chunks(chunk_ids_to_delete)
+            for observer in self._chunk_observers:
+                await observer.chunks_deleted(chunk_ids_to_delete)
+            if not chunks_deleted:
+                # Rewrite these documents in full on their next upsert, which removes the leftover chunks
+                for doc_id in chunk_ids_to_delete:
+                    del new_manifests[doc_id]
+                await manifest.delete_many(list(chunk_ids_to_delete))
+
+        await manifest.set_many(new_manifests)
 
-        chunks = get_document_chunks(documents, chunk_token_size)
+        return list(docs_by_id)
 
-        return await self._upsert(chunks)
+    async def _write_chunks(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        with time_stage("provider_upsert"):
+            document_ids = await self._upsert(chunks)
+        for observer in self._chunk_observers:
+            await observer.chunks_written(chunks)
+        return document_ids
 
     @abstractmethod
     async def _upsert(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
@@ -56,13 +253,33 @@ class DataStore(ABC):
         """
         # get a list of of just the queries from the Query list
         query_texts = [query.query for query in queries]
-        query_embeddings = get_embeddings(query_texts)
+        query_embeddings = await get_query_embeddings(query_texts)
         # hydrate the queries with embeddings
+        # Diversified queries fetch more candidates, with their embeddings, to pick from
         queries_with_embeddings = [
             QueryWithEmbedding(**query.dict(), embedding=embedding)
+            if not query.diversity
+            else QueryWithEmbedding(
+                **query.dict(exclude={"top_k"}),
+                top_k=mmr_candidates(query.top_k or 0),
+                embedding=embedding,
+                include_embeddings=True,
+            )
             for query, embedding in zip(queries, query_embeddings)
         ]
-        return await self._query(queries_with_embeddings)
+        with time_stage("provider_query"):
+            results = await self._query(queries_with_embeddings)
+        if not any(query.diversity for query in queries):
+            return results
+        with time_stage("mmr"):
+            return [
+                diversify_result(result, query.copy(update={"top_k": original.top_k}))
+                if original.diversity
+                else result
+                for original, query, result in zip(
+                    queries, queries_with_embeddings, results
+                )
+            ]
 
     @abstractmethod
     async def _query(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
@@ -71,7 +288,6 @@ class DataStore(ABC):
         """
         raise NotImplementedError
 
-    @abstractmethod
     async def delete(
         self,
         ids: Optional[List[str]] = None,
@@ -83,4 +299,83 @@ class DataStore(ABC):
         Multiple parameters can be used at once.
         Returns whether the operation was successful.
         """
+        # Forget what was written for the deleted documents before deleting them,
+        # so that a failed delete can only cause a full rewrite on the next upsert
+        manifest = self.upsert_manifest
+        if manifest is not None:
+            if delete_all:
+                await manifest.clear()
+            else:
+                if ids:
+                    await manifest.delete_many(ids)
+                if filter is not None:
+                    filters = filter.dict(exclude_none=True)
+                    if set(filters) == {"document_id"}:
+                        await manifest.delete_many([filters["document_id"]])
+                    elif filters:
+                        # Any other filter can match chunks of any document
+                        await manifest.clear()
+
+        with time_stage("provider_delete"):
+            deleted = await self._delete(ids=ids, filter=filter, delete_all=delete_all)
+        for observer in self._chunk_observers:
+            await observer.deleted(ids=ids, filter=filter, delete_all=delete_all)
+        return deleted
+
+    @abstractmethod
+    async def _delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        """
+        Removes vectors by ids, filter, or everything in the datastore.
+        Multiple parameters can be used at once.
+        Returns whether the operation was successful.
+        """
+        raise NotImplementedError
+
+    async def delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the vectors of the given documents, e.g. before they are upserted again.
+        Returns whether the operation was successful.
+        """
+        if not document_ids:
+            return True
+
+        manifest = self.upsert_manifest
+        if manifest is not None:
+            await manifest.delete_many(document_ids)
+
+        with time_stage("provider_delete"):
+            deleted = await self._delete_documents(document_ids)
+        for observer in self._chunk_observers:
+            await observer.deleted(ids=document_ids)
+        return deleted
+
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the vectors of the given documents.
+        Providers override this with a single set-based delete. By default each document is
+        deleted with its own document_id filter.
+        Returns whether the operation was successful.
+        """
+        results = await asyncio.gather(
+            *[
+                self._delete(
+                    filter=DocumentMetadataFilter(document_id=document_id),
+                    delete_all=False,
+                )
+                for document_id in document_ids
+            ]
+        )
+        return all(results)
+
+    async def _delete_chunks(self, chunk_ids: Dict[str, List[str]]) -> bool:
+        """
+        Removes single chunks by id, given as a dictionary from document id to the ids of its chunks to remove.
+        Optional: providers that implement it get incremental upserts that only rewrite the chunks that changed.
+        Returns whether the operation was successful.
+        """
         raise NotImplementedError
@@ -0,0 +1,121 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, TypeVar
+
+# Read environment variables for the blocking provider calls
+DATASTORE_EXECUTOR_THREADS = int(
+    os.environ.get("DATASTORE_EXECUTOR_THREADS", 32)
+)  # The number of threads shared by the blocking calls of every provider
+DATASTORE_MAX_CONCURRENCY = int(
+    os.environ.get("DATASTORE_MAX_CONCURRENCY", 8)
+)  # The default number of blocking calls a provider runs at once, overridden by <PROVIDER>_MAX_CONCURRENCY
+
+# Providers whose clients are not safe to use from several threads at once
+SERIAL_PROVIDERS = {"chroma", "postgres"}
+
+T = TypeVar("T")
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _get_thread_pool() -> ThreadPoolExecutor:
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=DATASTORE_EXECUTOR_THREADS, thread_name_prefix="datastore"
+        )
+    return _thread_pool
+
+
+def shutdown_thread_pool() -> None:
+    """
+    Shut down the threads used for blocking provider calls, if they were started.
+    """
+    global _thread_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+
+
+def get_max_concurrency(provider: str) -> int:
+    """
+    Return the number of blocking calls a provider may run at once.
+
+    Args:
+        provider: The name of the provider, e.g. pinecone.
+
+    Returns:
+        The value of <PROVIDER>_MAX_CONCURRENCY if set, otherwise 1 for providers whose
+        clients are not thread safe and DATASTORE_MAX_CONCURRENCY for the others.
+    """
+    default = 1 if provider in SERIAL_PROVIDERS else DATASTORE_MAX_CONCURRENCY
+    return max(1, int(os.environ.get(f"{provider.upper()}_MAX_CONCURRENCY", default)))
+
+
+class BlockingExecutor:
+    """
+    Runs the blocking calls of a provider SDK on the shared thread pool, so that they don't
+    block the event loop and the calls made with asyncio.gather really run in parallel.
+
+    At most max_concurrency calls of the provider run at once, the others wait for their
+    turn on the event loop without holding a thread.
+    """
+
+    def __init__(self, provider: str, max_concurrency: Optional[int] = None):
+        self.provider = provider
+        self.max_concurrency = (
+            max_concurrency
+            if max_concurrency is not None
+            else get_max_concurrency(provider)
+        )
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Asyncio primitives are bound to the loop they are first used on
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return self._semaphore
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """
+        Call a blocking function on the thread pool and wait for its result.
+
+        Args:
+            func: The blocking function, e.g. a method of the provider client.
+            *args: The positional arguments of the function.
+            **kwargs: The keyword arguments of the function.
+
+        Returns:
+            The return value of the function. Its exceptions are raised as is.
+        """
+        async with self._get_semaphore():
+            # Keep the context variables of the caller, like asyncio.to_thread
+            context = contextvars.copy_context()
+            call = functools.partial(context.run, func, *args, **kwargs)
+            return await asyncio.get_running_loop().run_in_executor(
+                _get_thread_pool(), call
+            )
+
+
+_executors: Dict[str, BlockingExecutor] = {}
+
+
+def get_blocking_executor(provider: str) -> BlockingExecutor:
+    """
+    Return the executor of a provider, shared by all its clients so that they share its limit.
+
+    Args:
+        provider: The name of the provider, e.g. pinecone.
+
+    Returns:
+        The executor of the provider.
+    """
+    if provider not in _executors:
+        _executors[provider] = BlockingExecutor(provider)
+    return _executors[provider]
@@ -1,8 +1,16 @@
 from datastore.datastore import DataStore
+from datastore.middleware import apply_middleware
 import os
 
 
 async def get_datastore() -> DataStore:
+    """
+    Create the datastore selected by DATASTORE, wrapped in the middleware selected by DATASTORE_MIDDLEWARE.
+    """
+    return apply_middleware(await get_provider_datastore())
+
+
+async def get_provider_datastore() -> DataStore:
     datastore = os.environ.get("DATASTORE")
     assert datastore is not None
 
@@ -56,6 +64,10 @@ async def get_datastore() -> DataStore:
             from datastore.providers.analyticdb_datastore import AnalyticDBDataStore
 
             return AnalyticDBDataStore()
+        case "local":
+            from datastore.providers.local_datastore import LocalDataStore
+
+            return LocalDataStore()
         case "pigro":
             from datastore.providers.pigro_datastore import PigroDataStore
 
@@ -63,5 +75,5 @@ async def get_datastore() -> DataStore:
         case _:
             raise ValueError(
                 f"Unsupported vector database: {datastore}. "
-                f"Try one of the following: llama, pinecone, weaviate, milvus, zilliz, redis, or qdrant"
+                f"Try one of the following: llama, pinecone, weaviate, milvus, zilliz, redis, qdrant, or local"
             )
\ No newline at end of file
@@ -0,0 +1,448 @@
+import asyncio
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from datastore.datastore import ChunkObserver
+from models.models import (
+    DocumentChunk,
+    DocumentChunkMetadata,
+    DocumentChunkWithScore,
+    DocumentMetadataFilter,
+)
+from services.date import to_unix_timestamp
+
+# Read environment variables for the lexical index
+LEXICAL_INDEX_PATH = os.environ.get("LEXICAL_INDEX_PATH", "lexical_index.sqlite3")
+BM25_K1 = float(os.environ.get("BM25_K1", 1.2))
+BM25_B = float(os.environ.get("BM25_B", 0.75))
+
+# The number of postings compressed together in a block
+BLOCK_SIZE = 128
+
+# Words, and codes made of words joined by punctuation such as ABC-123 or v1.2.3
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./:#]\w+)*")
+TOKEN_SEPARATORS = re.compile(r"[-./:#]")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split a text into lowercase terms. A code such as ABC-123 is kept whole, so that an
+    exact match ranks first, and its parts are added as well.
+    """
+    terms = []
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        term = match.group()
+        terms.append(term)
+        if TOKEN_SEPARATORS.search(term):
+            terms.extend(TOKEN_SEPARATORS.split(term))
+    return terms
+
+
+class PostingList:
+    """
+    The documents that contain a term, by increasing document number, and the frequency of
+    the term in each.
+
+    Full blocks of BLOCK_SIZE postings are compressed: the document numbers are stored as
+    offsets from the first one of the block, in the smallest unsigned type that holds them,
+    and the frequencies as bytes. Each block keeps its last document number and its largest
+    frequency, so that a search can skip the blocks that can't matter.
+    """
+
+    __slots__ = ["firsts", "lasts", "max_tfs", "offsets", "tfs", "tail_docs", "tail_tfs"]
+
+    def __init__(self):
+        self.firsts: List[int] = []
+        self.lasts: List[int] = []
+        self.max_tfs: List[int] = []
+        self.offsets: List[np.ndarray] = []
+        self.tfs: List[np.ndarray] = []
+        self.tail_docs: List[int] = []
+        self.tail_tfs: List[int] = []
+
+    def __len__(self) -> int:
+        return BLOCK_SIZE * len(self.firsts) + len(self.tail_docs)
+
+    @property
+    def max_tf(self) -> int:
+        return max(self.max_tfs + self.tail_tfs, default=0)
+
+    def append(self, doc: int, tf: int) -> None:
+        self.tail_docs.append(doc)
+        self.tail_tfs.append(min(tf, 255))
+        if len(self.tail_docs) == BLOCK_SIZE:
+            first, last = self.tail_docs[0], self.tail_docs[-1]
+            offsets = np.array(self.tail_docs, dtype=np.int64) - first
+            for dtype in [np.uint8, np.uint16, np.uint32]:
+                if last - first <= np.iinfo(dtype).max:
+                    break
+            self.firsts.append(first)
+            self.lasts.append(last)
+            self.max_tfs.append(max(self.tail_tfs))
+            self.offsets.append(offsets.astype(dtype))
+            self.tfs.append(np.array(self.tail_tfs, dtype=np.uint8))
+            self.tail_docs, self.tail_tfs = [], []
+
+    def decode(self, blocks: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the document numbers and frequencies of the given blocks, and of the
+        postings not yet in a block, or of every posting.
+        """
+        if blocks is None:
+            blocks = range(len(self.firsts))
+        docs = [self.firsts[i] + self.offsets[i].astype(np.int64) for i in blocks]
+        tfs = [self.tfs[i] for i in blocks]
+        docs.append(np.array(self.tail_docs, dtype=np.int64))
+        tfs.append(np.array(self.tail_tfs, dtype=np.uint8))
+        return np.concatenate(docs), np.concatenate(tfs).astype(np.float32)
+
+    def blocks_containing(self, docs: np.ndarray) -> List[int]:
+        """
+        Return the blocks whose range of document numbers holds any of the sorted docs.
+        """
+        if not self.firsts:
+            return []
+        # The only block that can hold a document is the first one that ends after it
+        positions = np.searchsorted(np.array(self.lasts), docs)
+        inside = positions < len(self.firsts)
+        positions, docs = positions[inside], docs[inside]
+        inside = docs >= np.array(self.firsts)[positions]
+        return np.unique(positions[inside]).tolist()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(offsets.nbytes + tfs.nbytes for offsets, tfs in zip(self.offsets, self.tfs))
+
+
+class BM25Index:
+    """
+    An in-memory inverted index of chunks, ranked by BM25.
+
+    Chunks are numbered in the order they are added, so that postings are appended in
+    order. Deleted chunks are tombstoned, and skipped when the postings are scored.
+
+    Searches use MaxScore: the terms of a query are scored from the one with the highest
+    possible contribution down. Once the best scores found so far can't be reached by a
+    chunk that only contains the remaining terms, these terms are only looked up for the
+    chunks already found, decoding only the blocks of postings that may contain them.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self.clear()
+
+    def clear(self) -> None:
+        self.postings: Dict[str, PostingList] = {}
+        self.chunk_ids: List[str] = []
+        self.metadata: List[Optional[DocumentChunkMetadata]] = []
+        self.created_at: List[Optional[int]] = []
+        self.numbers: Dict[str, int] = {}
+        self.lengths = np.zeros(0, dtype=np.float32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.total_length = 0.0
+
+    @property
+    def size(self) -> int:
+        return len(self.numbers)
+
+    @property
+    def deleted(self) -> int:
+        return len(self.chunk_ids) - len(self.numbers)
+
+    def add(self, chunk_id: str, text: str, metadata: DocumentChunkMetadata) -> None:
+        if chunk_id in self.numbers:
+            self.remove([chunk_id])
+        number = len(self.chunk_ids)
+        if number == len(self.alive):
+            capacity = max(1024, 2 * number)
+            self.lengths = np.concatenate([self.lengths, np.zeros(capacity - number, np.float32)])
+            self.alive = np.concatenate([self.alive, np.zeros(capacity - number, bool)])
+        terms = tokenize(text)
+        counts: Dict[str, int] = {}
+        for term in terms:
+            counts[term] = counts.get(term, 0) + 1
+        for term, count in counts.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = PostingList()
+            postings.append(number, count)
+        self.chunk_ids.append(chunk_id)
+        self.metadata.append(metadata)
+        self.created_at.append(
+            to_unix_timestamp(metadata.created_at) if metadata.created_at else None
+        )
+        self.numbers[chunk_id] = number
+        self.lengths[number] = len(terms)
+        self.alive[number] = True
+        self.total_length += len(terms)
+
+    def remove(self, chunk_ids: Sequence[str]) -> None:
+        for chunk_id in chunk_ids:
+            number = self.numbers.pop(chunk_id, None)
+            if number is not None:
+                self.alive[number] = False
+                self.metadata[number] = None
+                self.total_length -= float(self.lengths[number])
+
+    def matching(self, filter: DocumentMetadataFilter) -> List[str]:
+        """
+        Return the ids of the chunks that match a metadata filter.
+        """
+        return [
+            self.chunk_ids[number]
+            for number in self.numbers.values()
+            if self._matches(number, filter)
+        ]
+
+    def _matches(self, number: int, filter: DocumentMetadataFilter) -> bool:
+        metadata = self.metadata[number]
+        if metadata is None:
+            return False
+        for field in ["document_id", "source", "source_id", "author"]:
+            value = getattr(filter, field)
+            if value is not None and getattr(metadata, field) != value:
+                return False
+        if filter.start_date or filter.end_date:
+            created_at = self.created_at[number]
+            if created_at is None:
+                return False
+            if filter.start_date and created_at < to_unix_timestamp(filter.start_date):
+                return False
+            if filter.end_date and created_at > to_unix_timestamp(filter.end_date):
+                return False
+        return True
+
+    def search(
+        self, query: str, top_k: int, filter: Optional[DocumentMetadataFilter] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Find the chunks with the highest BM25 score for a query.
+
+        Args:
+            query: The text of the query.
+            top_k: The number of chunks to return.
+            filter: A metadata filter the chunks must match, if any. The chunks that match
+                are picked from every chunk that contains a term, without MaxScore.
+
+        Returns:
+            The (chunk id, score) pairs of the best chunks, best first.
+        """
+        n = self.size
+        if n == 0 or top_k <= 0:
+            return []
+        average_length = max(self.total_length / n, 1.0)
+        # Posting lists keep the deleted chunks until a rebuild, count them in the idf too
+        numbered = len(self.chunk_ids)
+        terms = [
+            (term, self.postings[term]) for term in set(tokenize(query)) if term in self.postings
+        ]
+        bounds = []
+        for term, postings in terms:
+            idf = math.log(1 + (numbered - len(postings) + 0.5) / (len(postings) + 0.5))
+            # The contribution grows with the frequency and shrinks with the length
+            max_tf = postings.max_tf
+            bound = idf * max_tf * (self.k1 + 1) / (max_tf + self.k1 * (1 - self.b))
+            bounds.append((bound, idf, postings))
+        bounds.sort(key=lambda item: -item[0])
+        remaining = [sum(bound for bound, _, _ in bounds[i:]) for i in range(len(bounds))]
+
+        docs = np.zeros(0, dtype=np.int64)
+        scores = np.zeros(0, dtype=np.float32)
+        for i, (_, idf, postings) in enumerate(bounds):
+            threshold = (
+                -np.inf
+                if filter is not None or len(scores) < top_k
+                else np.partition(scores, -top_k)[-top_k]
+            )
+            if remaining[i] < threshold:
+                # No new chunk can make the top k, only score the chunks that still can
+                keep = scores + remaining[i] >= threshold
+                docs, scores = docs[keep], scores[keep]
+                term_docs, tfs = postings.decode(postings.blocks_containing(docs))
+                if len(term_docs):
+                    positions = np.searchsorted(term_docs, docs).clip(max=len(term_docs) - 1)
+                    tf = np.where(term_docs[positions] == docs, tfs[positions], 0)
+                    scores = scores + idf * self._saturation(tf, docs, average_length)
+                continue
+            term_docs, tfs = postings.decode()
+            alive = self.alive[term_docs]
+            term_docs, tfs = term_docs[alive], tfs[alive]
+            term_scores = idf * self._saturation(tfs, term_docs, average_length)
+            merged, inverse = np.unique(np.concatenate([docs, term_docs]), return_inverse=True)
+            scores = np.bincount(
+                inverse, weights=np.concatenate([scores, term_scores]), minlength=len(merged)
+            ).astype(np.float32)
+            docs = merged
+
+        order = np.argsort(-scores, kind="stable")
+        results = []
+        for position in order:
+            number = int(docs[position])
+            if filter is not None and not self._matches(number, filter):
+                continue
+            results.append((self.chunk_ids[number], float(scores[position])))
+            if len(results) == top_k:
+                break
+        return results
+
+    def _saturation(
+        self, tfs: np.ndarray, docs: np.ndarray, average_length: float
+    ) -> np.ndarray:
+        lengths = self.lengths[docs]
+        return tfs * (self.k1 + 1) / (
+            tfs + self.k1 * (1 - self.b + self.b * lengths / average_length)
+        )
+
+
+class LexicalIndex(ChunkObserver):
+    """
+    A BM25 index of the chunks written to a datastore, kept in sync with it as a chunk observer.
+
+    The texts and metadata of the chunks are stored on local disk in SQLite, and the
+    inverted index is rebuilt from them in memory on start, and when more of its chunks
+    are deleted than alive. Like the upsert manifest, the index has to see every write and
+    delete made to the datastore, so it must only be used with a single writer.
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, "
+            "document_id TEXT, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS chunks_document_id ON chunks (document_id)"
+        )
+        self._conn.commit()
+        self.index = BM25Index()
+        self._rebuild()
+        if self.index.size:
+            logger.info(f"Loaded {self.index.size} chunks into the lexical index from {path}")
+
+    def _rebuild(self) -> None:
+        index = BM25Index(self.index.k1, self.index.b)
+        for id, text, metadata in self._conn.execute(
+            "SELECT id, text, metadata FROM chunks ORDER BY rowid"
+        ):
+            index.add(id, text, DocumentChunkMetadata.parse_raw(metadata))
+        self.index = index
+
+    def _add(self, chunks: List[DocumentChunk]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, document_id, text, metadata) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (chunk.id, chunk.metadata.document_id, chunk.text, chunk.metadata.json())
+                    for chunk in chunks
+                ],
+            )
+            self._conn.commit()
+            for chunk in chunks:
+                self.index.add(chunk.id, chunk.text, chunk.metadata)
+
+    def _remove(self, chunk_ids: List[str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE id = ?", [(chunk_id,) for chunk_id in chunk_ids]
+            )
+            self._conn.commit()
+            self.index.remove(chunk_ids)
+            if self.index.deleted > max(self.index.size, 1000):
+                self._rebuild()
+
+    def _chunk_ids(
+        self,
+        document_ids: Optional[List[str]],
+        filter: Optional[DocumentMetadataFilter],
+    ) -> List[str]:
+        chunk_ids = []
+        with self._lock:
+            # Stay well under SQLite's limit on the number of query parameters
+            document_ids = document_ids or []
+            for i in range(0, len(document_ids), 500):
+                batch = document_ids[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                chunk_ids.extend(
+                    id
+                    for id, in self._conn.execute(
+                        f"SELECT id FROM chunks WHERE document_id IN ({placeholders})", batch
+                    )
+                )
+            if filter is not None and filter.dict(exclude_none=True):
+                chunk_ids.extend(self.index.matching(filter))
+        return chunk_ids
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.commit()
+            self.index.clear()
+
+    def _search(
+        self, query: str, top_k: int, filter: Optional[DocumentMetadataFilter]
+    ) -> List[DocumentChunkWithScore]:
+        with self._lock:
+            matches = self.index.search(query, top_k, filter)
+            if not matches:
+                return []
+            placeholders = ",".join("?" * len(matches))
+            rows = {
+                id: (text, metadata)
+                for id, text, metadata in self._conn.execute(
+                    f"SELECT id, text, metadata FROM chunks WHERE id IN ({placeholders})",
+                    [id for id, _ in matches],
+                )
+            }
+        return [
+            DocumentChunkWithScore(
+                id=id,
+                text=rows[id][0],
+                metadata=DocumentChunkMetadata.parse_raw(rows[id][1]),
+                score=score,
+            )
+            for id, score in matches
+            if id in rows
+        ]
+
+    async def search(
+        self, query: str, top_k: int, filter: Optional[DocumentMetadataFilter] = None
+    ) -> List[DocumentChunkWithScore]:
+        """
+        Return the chunks with the highest BM25 score for a query, best first.
+        """
+        return await asyncio.to_thread(self._search, query, top_k, filter)
+
+    async def chunks_written(self, chunks: Dict[str, List[DocumentChunk]]) -> None:
+        await asyncio.to_thread(
+            self._add, [chunk for doc_chunks in chunks.values() for chunk in doc_chunks]
+        )
+
+    async def chunks_deleted(self, chunk_ids: Dict[str, List[str]]) -> None:
+        await asyncio.to_thread(
+            self._remove, [id for doc_chunk_ids in chunk_ids.values() for id in doc_chunk_ids]
+        )
+
+    async def deleted(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> None:
+        if delete_all:
+            await asyncio.to_thread(self._clear)
+            return
+        chunk_ids = await asyncio.to_thread(self._chunk_ids, ids, filter)
+        if chunk_ids:
+            await asyncio.to_thread(self._remove, chunk_ids)
@@ -0,0 +1,317 @@
+import heapq
+import math
+import os
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from datastore.local.index import VectorIndex
+
+
+class HNSWIndex(VectorIndex):
+    """
+    A Hierarchical Navigable Small World graph (Malkov and Yashunin, 2016) over the rows of
+    a matrix of normalized vectors, where similarity is the inner product.
+
+    The neighbor lists are kept in arrays rather than Python objects. Layer 0 is a
+    (capacity, 2 * m) matrix of row ids padded with -1. The few nodes that reach the upper
+    layers get one row per layer in a second (capacity, m) matrix, starting at upper_start.
+
+    Inserts are incremental and deletes are tombstones: deleted nodes stay in the graph to
+    keep it connected, but are never returned.
+    """
+
+    file_name = "hnsw.npz"
+
+    def __init__(
+        self,
+        m: int = 16,
+        ef_construction: int = 200,
+        ef_search: int = 64,
+        seed: int = 0,
+    ):
+        self.m = m
+        self.m0 = 2 * m
+        self.ef_construction = max(ef_construction, m)
+        self.ef_search = ef_search
+        self.level_multiplier = 1 / math.log(m)
+        self._rng = np.random.default_rng(seed)
+        # Taken for each insert, so that searches wait for one node rather than a whole add
+        self._lock = threading.Lock()
+        self._add_lock = threading.Lock()
+        self.clear()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def clear(self) -> None:
+        self._size = 0
+        self.entry_point = -1
+        self.max_level = -1
+        self.levels = np.zeros(0, dtype=np.int8)
+        self.deleted = np.zeros(0, dtype=bool)
+        self.links0 = np.zeros((0, self.m0), dtype=np.int32)
+        self.counts0 = np.zeros(0, dtype=np.int32)
+        self.upper_start = np.zeros(0, dtype=np.int64)
+        self.upper_links = np.zeros((0, self.m), dtype=np.int32)
+        self.upper_counts = np.zeros(0, dtype=np.int32)
+        self._upper_size = 0
+
+    def _reserve(self, size: int) -> None:
+        capacity = len(self.levels)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+
+        def grow(array: np.ndarray, fill: int) -> np.ndarray:
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[: self._size] = array[: self._size]
+            return grown
+
+        self.levels = grow(self.levels, 0)
+        self.deleted = grow(self.deleted, False)
+        self.links0 = grow(self.links0, -1)
+        self.counts0 = grow(self.counts0, 0)
+        self.upper_start = grow(self.upper_start, -1)
+
+    def _reserve_upper(self, size: int) -> None:
+        capacity = len(self.upper_counts)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 64)
+        links = np.full((capacity, self.m), -1, dtype=np.int32)
+        links[: self._upper_size] = self.upper_links[: self._upper_size]
+        counts = np.zeros(capacity, dtype=np.int32)
+        counts[: self._upper_size] = self.upper_counts[: self._upper_size]
+        self.upper_links = links
+        self.upper_counts = counts
+
+    def _neighbors(self, node: int, level: int) -> np.ndarray:
+        if level == 0:
+            return self.links0[node, : self.counts0[node]]
+        row = self.upper_start[node] + level - 1
+        return self.upper_links[row, : self.upper_counts[row]]
+
+    def _set_neighbors(self, node: int, level: int, neighbors: Sequence[int]) -> None:
+        if level == 0:
+            links, counts, row = self.links0, self.counts0, node
+        else:
+            links, counts = self.upper_links, self.upper_counts
+            row = int(self.upper_start[node]) + level - 1
+        links[row, : len(neighbors)] = neighbors
+        links[row, len(neighbors) :] = -1
+        counts[row] = len(neighbors)
+
+    def _search_layer(
+        self,
+        vectors: np.ndarray,
+        query: np.ndarray,
+        entry_points: List[Tuple[float, int]],
+        ef: int,
+        level: int,
+        deleted: Optional[np.ndarray] = None,
+    ) -> List[Tuple[float, int]]:
+        """
+        Best-first search of one layer of the graph.
+
+        Args:
+            vectors: The normalized vectors.
+            query: The normalized query.
+            entry_points: The (similarity, node) pairs the search starts from.
+            ef: The number of nodes to return, the breadth of the search.
+            level: The layer to search.
+            deleted: A mask of the nodes to traverse but not return, if any.
+
+        Returns:
+            Up to ef (similarity, node) pairs, in no particular order.
+        """
+        limit = len(vectors)
+        visited = {node for _, node in entry_points}
+        candidates = [(-similarity, node) for similarity, node in entry_points]
+        heapq.heapify(candidates)
+        results = [
+            (similarity, node)
+            for similarity, node in entry_points
+            if deleted is None or not deleted[node]
+        ]
+        heapq.heapify(results)
+        while len(results) > ef:
+            heapq.heappop(results)
+
+        while candidates:
+            negative_similarity, node = heapq.heappop(candidates)
+            if len(results) >= ef and -negative_similarity < results[0][0]:
+                break
+            neighbors = [
+                neighbor
+                for neighbor in self._neighbors(node, level).tolist()
+                if neighbor not in visited and neighbor < limit
+            ]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            # Score all the new neighbors of the node at once
+            similarities = (vectors[neighbors] @ query).tolist()
+            for similarity, neighbor in zip(similarities, neighbors):
+                if len(results) < ef or similarity > results[0][0]:
+                    heapq.heappush(candidates, (-similarity, neighbor))
+                    if deleted is None or not deleted[neighbor]:
+                        heapq.heappush(results, (similarity, neighbor))
+                        if len(results) > ef:
+                            heapq.heappop(results)
+        return results
+
+    def _select_neighbors(
+        self, vectors: np.ndarray, candidates: List[Tuple[float, int]], m: int
+    ) -> List[int]:
+        """
+        The neighbor selection heuristic of HNSW: a candidate is kept only if it is closer
+        to the new node than to any neighbor kept so far, so that links spread out in
+        different directions instead of all pointing into the nearest cluster.
+        """
+        candidates = sorted(candidates, reverse=True)
+        if len(candidates) <= m:
+            return [node for _, node in candidates]
+        nodes = [node for _, node in candidates]
+        candidate_vectors = vectors[nodes]
+        # The similarities between the candidates, computed once
+        between = candidate_vectors @ candidate_vectors.T
+        selected: List[int] = []
+        for i, (similarity, _) in enumerate(candidates):
+            if all(between[i, j] < similarity for j in selected):
+                selected.append(i)
+                if len(selected) == m:
+                    break
+        return [nodes[i] for i in selected]
+
+    def _connect(self, vectors: np.ndarray, node: int, neighbor: int, level: int) -> None:
+        # Add a backlink from a neighbor, pruning its list with the heuristic if it is full
+        m = self.m0 if level == 0 else self.m
+        neighbors = self._neighbors(neighbor, level).tolist()
+        if len(neighbors) < m:
+            self._set_neighbors(neighbor, level, neighbors + [node])
+            return
+        neighbors.append(node)
+        similarities = (vectors[neighbors] @ vectors[neighbor]).tolist()
+        self._set_neighbors(
+            neighbor,
+            level,
+            self._select_neighbors(vectors, list(zip(similarities, neighbors)), m),
+        )
+
+    def _insert(self, vectors: np.ndarray, node: int) -> None:
+        level = int(-math.log(1.0 - self._rng.random()) * self.level_multiplier)
+        self.levels[node] = level
+        if level > 0:
+            self._reserve_upper(self._upper_size + level)
+            self.upper_start[node] = self._upper_size
+            self._upper_size += level
+
+        if self.entry_point < 0:
+            self.entry_point = node
+            self.max_level = level
+            return
+
+        query = vectors[node]
+        entry = [(float(vectors[self.entry_point] @ query), self.entry_point)]
+        # Greedy descent through the layers above the level of the new node
+        for layer in range(self.max_level, level, -1):
+            entry = [max(self._search_layer(vectors, query, entry, 1, layer))]
+        for layer in range(min(level, self.max_level), -1, -1):
+            candidates = self._search_layer(
+                vectors, query, entry, self.ef_construction, layer
+            )
+            neighbors = self._select_neighbors(vectors, candidates, self.m)
+            self._set_neighbors(node, layer, neighbors)
+            for neighbor in neighbors:
+                self._connect(vectors, node, neighbor, layer)
+            entry = candidates
+
+        if level > self.max_level:
+            self.entry_point = node
+            self.max_level = level
+
+    def add(self, vectors: np.ndarray, start: int) -> None:
+        with self._add_lock:
+            with self._lock:
+                if start != self._size:
+                    raise ValueError(f"Expected rows from {self._size}, got {start}")
+                end = len(vectors)
+                self._reserve(end)
+            for node in range(start, end):
+                with self._lock:
+                    self._insert(vectors, node)
+                    self._size = node + 1
+
+    def remove(self, rows: Sequence[int]) -> None:
+        with self._lock:
+            rows = [row for row in rows if row < self._size]
+            self.deleted[rows] = True
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        queries: np.ndarray,
+        top_k: Sequence[int],
+        ef_search: Optional[int] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        # The entry point and its level change together when a node reaches a new layer
+        with self._lock:
+            entry_point, max_level = self.entry_point, self.max_level
+            deleted = self.deleted
+        results: List[List[Tuple[int, float]]] = []
+        for query, k in zip(queries, top_k):
+            if entry_point < 0 or k <= 0:
+                results.append([])
+                continue
+            ef = max(ef_search or self.ef_search, k)
+            entry = [(float(vectors[entry_point] @ query), entry_point)]
+            for layer in range(max_level, 0, -1):
+                entry = [max(self._search_layer(vectors, query, entry, 1, layer))]
+            nearest = self._search_layer(vectors, query, entry, ef, 0, deleted)
+            results.append(
+                [(node, similarity) for similarity, node in sorted(nearest, reverse=True)[:k]]
+            )
+        return results
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            size = self._size
+            temporary_path = f"{path}.tmp"
+            with open(temporary_path, "wb") as f:
+                np.savez(
+                    f,
+                    params=np.array(
+                        [self.m, self.ef_construction, size, self.entry_point, self.max_level]
+                    ),
+                    levels=self.levels[:size],
+                    deleted=self.deleted[:size],
+                    links0=self.links0[:size],
+                    counts0=self.counts0[:size],
+                    upper_start=self.upper_start[:size],
+                    upper_links=self.upper_links[: self._upper_size],
+                    upper_counts=self.upper_counts[: self._upper_size],
+                )
+            os.replace(temporary_path, path)
+
+    def load(self, path: str) -> bool:
+        with np.load(path) as saved:
+            m, ef_construction, size, entry_point, max_level = saved["params"].tolist()
+            if m != self.m or ef_construction != self.ef_construction:
+                return False
+            with self._lock:
+                self.clear()
+                self._size = size
+                self.entry_point = entry_point
+                self.max_level = max_level
+                self.levels = saved["levels"]
+                self.deleted = saved["deleted"]
+                self.links0 = saved["links0"]
+                self.counts0 = saved["counts0"]
+                self.upper_start = saved["upper_start"]
+                self.upper_links = saved["upper_links"]
+                self.upper_counts = saved["upper_counts"]
+                self._upper_size = len(self.upper_counts)
+        return True
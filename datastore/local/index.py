@@ -0,0 +1,141 @@
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Read environment variables for the index of the local datastore
+LOCAL_DATASTORE_INDEX = os.environ.get(
+    "LOCAL_DATASTORE_INDEX", "exact"
+)  # "exact", "hnsw", "ivfpq", "int8" or "binary"
+LOCAL_HNSW_M = int(os.environ.get("LOCAL_HNSW_M", 16))
+LOCAL_HNSW_EF_CONSTRUCTION = int(os.environ.get("LOCAL_HNSW_EF_CONSTRUCTION", 200))
+LOCAL_HNSW_EF_SEARCH = int(os.environ.get("LOCAL_HNSW_EF_SEARCH", 64))
+LOCAL_IVFPQ_NLIST = int(os.environ.get("LOCAL_IVFPQ_NLIST", 1024))
+LOCAL_IVFPQ_M = int(os.environ.get("LOCAL_IVFPQ_M", 64))
+LOCAL_IVFPQ_NPROBE = int(os.environ.get("LOCAL_IVFPQ_NPROBE", 16))
+LOCAL_IVFPQ_RERANK = int(os.environ.get("LOCAL_IVFPQ_RERANK", 4))
+LOCAL_IVFPQ_TRAIN_ROWS = int(os.environ.get("LOCAL_IVFPQ_TRAIN_ROWS", 50000))
+LOCAL_QUANTIZED_RESCORE = int(os.environ.get("LOCAL_QUANTIZED_RESCORE", 10))
+
+
+class VectorIndex(ABC):
+    """
+    An approximate nearest neighbor index over the rows of the matrix of a LocalVectorStore.
+
+    The index doesn't hold the vectors, they are passed to each call, and it identifies
+    them by row. Rows are added in order and never move, deleted rows are tombstoned.
+    """
+
+    # The name of the file the index is saved to, in the directory of the store
+    file_name = ""
+
+    @property
+    @abstractmethod
+    def size(self) -> int:
+        """
+        The number of rows added to the index, deleted or not.
+        """
+        raise NotImplementedError
+
+    @property
+    def ready(self) -> bool:
+        """
+        Whether the index can answer searches. Until then the store uses the exact search.
+        """
+        return True
+
+    @abstractmethod
+    def add(self, vectors: np.ndarray, start: int) -> None:
+        """
+        Add the rows of vectors from start on. start must be the current size of the index.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def remove(self, rows: Sequence[int]) -> None:
+        """
+        Tombstone rows, so that searches no longer return them.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def search(
+        self, vectors: np.ndarray, queries: np.ndarray, top_k: Sequence[int]
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Find the approximate nearest rows of each query, by cosine similarity.
+
+        Args:
+            vectors: The normalized vectors of the store. Rows beyond its length are ignored.
+            queries: The normalized query embeddings, one row per query.
+            top_k: The number of rows to return for each query.
+
+        Returns:
+            For each query, the (row, score) pairs of its nearest rows, best first.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self) -> None:
+        """
+        Remove every row from the index.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save(self, path: str) -> None:
+        """
+        Write the index to a file, atomically.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def load(self, path: str) -> bool:
+        """
+        Replace the index with the one saved in a file.
+
+        Returns:
+            False if the file was written with other parameters and can't be used.
+        """
+        raise NotImplementedError
+
+
+def create_vector_index(kind: str = LOCAL_DATASTORE_INDEX) -> Optional[VectorIndex]:
+    """
+    Create the index selected by LOCAL_DATASTORE_INDEX, or None for exact search only.
+    """
+    match kind:
+        case "exact":
+            return None
+        case "hnsw":
+            from datastore.local.hnsw import HNSWIndex
+
+            return HNSWIndex(
+                m=LOCAL_HNSW_M,
+                ef_construction=LOCAL_HNSW_EF_CONSTRUCTION,
+                ef_search=LOCAL_HNSW_EF_SEARCH,
+            )
+        case "ivfpq":
+            from datastore.local.ivfpq import IVFPQIndex
+
+            return IVFPQIndex(
+                nlist=LOCAL_IVFPQ_NLIST,
+                m=LOCAL_IVFPQ_M,
+                nprobe=LOCAL_IVFPQ_NPROBE,
+                rerank=LOCAL_IVFPQ_RERANK,
+                train_rows=LOCAL_IVFPQ_TRAIN_ROWS,
+            )
+        case "int8":
+            from datastore.local.quantized import Int8Index
+
+            return Int8Index(rescore=LOCAL_QUANTIZED_RESCORE)
+        case "binary":
+            from datastore.local.quantized import BinaryIndex
+
+            return BinaryIndex(rescore=LOCAL_QUANTIZED_RESCORE)
+        case _:
+            raise ValueError(
+                f"Unsupported local datastore index: {kind}. "
+                f"Try one of the following: exact, hnsw, ivfpq, int8, or binary"
+            )
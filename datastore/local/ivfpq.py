@@ -0,0 +1,311 @@
+import math
+import os
+import threading
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from datastore.local.index import VectorIndex
+
+# The number of codewords of each subquantizer, so that a code fits in a byte
+CODEBOOK_SIZE = 256
+# The number of k-means iterations used to train the quantizers
+TRAIN_ITERATIONS = 20
+# The number of rows encoded at a time
+ENCODE_BLOCK_ROWS = 16384
+
+
+def _assign(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Find the nearest centroid of each point, by Euclidean distance, for several sets at once.
+
+    Args:
+        data: The points, with shape (sets, points, dimension).
+        centroids: The centroids of each set, with shape (sets, centroids, dimension).
+
+    Returns:
+        The index of the nearest centroid of each point, with shape (sets, points).
+    """
+    num_sets, n, _ = data.shape
+    k = centroids.shape[1]
+    # |x - c|^2 = |x|^2 - 2 x.c + |c|^2, where |x|^2 doesn't change the nearest centroid
+    half_norms = 0.5 * np.einsum("skd,skd->sk", centroids, centroids)[:, None, :]
+    transposed = centroids.transpose(0, 2, 1)
+    block = max(1, (1 << 24) // (num_sets * k))
+    assignments = np.empty((num_sets, n), dtype=np.int64)
+    for start in range(0, n, block):
+        end = min(n, start + block)
+        scores = np.matmul(data[:, start:end], transposed) - half_norms
+        assignments[:, start:end] = scores.argmax(axis=2)
+    return assignments
+
+
+def _kmeans(data: np.ndarray, k: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Lloyd's k-means, run on several sets of points at once.
+
+    Args:
+        data: The points, with shape (sets, points, dimension).
+        k: The number of centroids of each set, at most the number of points.
+        rng: The random generator used to pick the initial centroids.
+
+    Returns:
+        The centroids, with shape (sets, k, dimension).
+    """
+    num_sets, n, _ = data.shape
+    centroids = data[:, rng.choice(n, k, replace=False)].copy()
+    for _ in range(TRAIN_ITERATIONS):
+        assignments = _assign(data, centroids)
+        for i in range(num_sets):
+            counts = np.bincount(assignments[i], minlength=k)
+            order = np.argsort(assignments[i], kind="stable")
+            filled = np.flatnonzero(counts)
+            starts = (np.cumsum(counts) - counts)[filled]
+            sums = np.add.reduceat(data[i, order], starts, axis=0)
+            centroids[i, filled] = sums / counts[filled, None]
+            # Move the empty clusters to random points
+            empty = np.flatnonzero(counts == 0)
+            if len(empty):
+                centroids[i, empty] = data[i, rng.choice(n, len(empty))]
+    return centroids
+
+
+class IVFPQIndex(VectorIndex):
+    """
+    An inverted file index with product quantization (Jégou et al., 2011), which keeps a
+    few bytes per vector in memory instead of the vector itself.
+
+    A coarse quantizer splits the vectors into nlist lists by k-means. The residual of each
+    vector to the centroid of its list is split into m subvectors, and each subvector is
+    replaced by the index of its nearest codeword in a codebook of 256, so that a vector is
+    stored as m bytes. A query scans the nprobe lists with the nearest centroids, and scores
+    the codes with a table of the similarities between the query and every codeword, looked
+    up once per byte. The rerank * top_k best candidates are then scored again exactly
+    against the full vectors, which only reads their rows of the memory-mapped matrix.
+
+    The quantizers are trained on a sample of the vectors once train_rows have been added.
+    Until then the index isn't ready and the store keeps using the exact search.
+    """
+
+    file_name = "ivfpq.npz"
+
+    def __init__(
+        self,
+        nlist: int = 1024,
+        m: int = 64,
+        nprobe: int = 16,
+        rerank: int = 4,
+        train_rows: int = 50000,
+        seed: int = 0,
+    ):
+        self.nlist = nlist
+        self.m = m
+        self.nprobe = nprobe
+        self.rerank = rerank
+        self.train_rows = max(train_rows, 1)
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self.clear()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def ready(self) -> bool:
+        return self._trained
+
+    def clear(self) -> None:
+        self._trained = False
+        self._size = 0
+        self.deleted = np.zeros(0, dtype=bool)
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.codebooks = np.zeros((self.m, 0, 0), dtype=np.float32)
+        self._lists: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._counts = np.zeros(0, dtype=np.int64)
+
+    @property
+    def memory_bytes(self) -> int:
+        """
+        The memory held by the codes and row ids of the lists and by the quantizers.
+        """
+        return (
+            sum(rows.nbytes + codes.nbytes for rows, codes in self._lists)
+            + self.deleted.nbytes
+            + self.centroids.nbytes
+            + self.codebooks.nbytes
+        )
+
+    def _pad(self, vectors: np.ndarray) -> np.ndarray:
+        # Split the vectors into m subvectors, padded with zeros to a multiple of m
+        dimension = vectors.shape[1]
+        subdimension = math.ceil(dimension / self.m)
+        padded = np.zeros((len(vectors), self.m * subdimension), dtype=np.float32)
+        padded[:, :dimension] = vectors
+        return padded.reshape(len(vectors), self.m, subdimension)
+
+    def _train(self, vectors: np.ndarray) -> None:
+        n = len(vectors)
+        sample_rows = np.sort(self._rng.choice(n, min(n, self.train_rows), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+        logger.info(f"Training an IVF-PQ index on {len(sample)} vectors")
+        centroids = _kmeans(sample[None], min(self.nlist, len(sample)), self._rng)[0]
+        residuals = sample - centroids[_assign(sample[None], centroids[None])[0]]
+        subvectors = self._pad(residuals).transpose(1, 0, 2)
+        self.codebooks = _kmeans(
+            np.ascontiguousarray(subvectors),
+            min(CODEBOOK_SIZE, len(sample)),
+            self._rng,
+        )
+        self.centroids = centroids
+        self._lists = [
+            (np.zeros(0, dtype=np.int32), np.zeros((0, self.m), dtype=np.uint8))
+            for _ in range(len(centroids))
+        ]
+        self._counts = np.zeros(len(centroids), dtype=np.int64)
+
+    def _encode(self, vectors: np.ndarray, start: int, end: int) -> None:
+        for block_start in range(start, end, ENCODE_BLOCK_ROWS):
+            block_end = min(end, block_start + ENCODE_BLOCK_ROWS)
+            block = np.asarray(vectors[block_start:block_end], dtype=np.float32)
+            lists = _assign(block[None], self.centroids[None])[0]
+            subvectors = self._pad(block - self.centroids[lists]).transpose(1, 0, 2)
+            codes = _assign(np.ascontiguousarray(subvectors), self.codebooks).T
+            codes = codes.astype(np.uint8)
+            rows = np.arange(block_start, block_end, dtype=np.int32)
+            order = np.argsort(lists, kind="stable")
+            targets, starts = np.unique(lists[order], return_index=True)
+            for target, group in zip(targets, np.split(order, starts[1:])):
+                self._append(int(target), rows[group], codes[group])
+
+    def _append(self, target: int, rows: np.ndarray, codes: np.ndarray) -> None:
+        list_rows, list_codes = self._lists[target]
+        count = int(self._counts[target])
+        size = count + len(rows)
+        if size > len(list_rows):
+            # Searches keep reading the old arrays, which hold the same first rows
+            capacity = max(size, 2 * len(list_rows), 16)
+            grown_rows = np.zeros(capacity, dtype=np.int32)
+            grown_rows[:count] = list_rows[:count]
+            grown_codes = np.zeros((capacity, self.m), dtype=np.uint8)
+            grown_codes[:count] = list_codes[:count]
+            list_rows, list_codes = grown_rows, grown_codes
+            self._lists[target] = (list_rows, list_codes)
+        list_rows[count:size] = rows
+        list_codes[count:size] = codes
+        self._counts[target] = size
+
+    def add(self, vectors: np.ndarray, start: int) -> None:
+        with self._lock:
+            if start != self._size:
+                raise ValueError(f"Expected rows from {self._size}, got {start}")
+            end = len(vectors)
+            if end > len(self.deleted):
+                deleted = np.zeros(max(end, 2 * len(self.deleted), 1024), dtype=bool)
+                deleted[: self._size] = self.deleted[: self._size]
+                self.deleted = deleted
+            if not self._trained and end >= self.train_rows:
+                self._train(vectors[:end])
+                self._encode(vectors, 0, end)
+                self._trained = True
+            elif self._trained:
+                self._encode(vectors, start, end)
+            self._size = end
+
+    def remove(self, rows: Sequence[int]) -> None:
+        with self._lock:
+            rows = [row for row in rows if row < self._size]
+            self.deleted[rows] = True
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        queries: np.ndarray,
+        top_k: Sequence[int],
+        nprobe: Optional[int] = None,
+        rerank: Optional[int] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        if not self._trained:
+            return [[] for _ in top_k]
+        counts = self._counts.copy()
+        lists = self._lists
+        deleted = self.deleted
+        limit = len(vectors)
+        rerank = self.rerank if rerank is None else rerank
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        subvector_rows = np.arange(self.m)
+
+        coarse_scores = np.asarray(queries, dtype=np.float32) @ self.centroids.T
+        probes = np.argpartition(-coarse_scores, nprobe - 1, axis=1)[:, :nprobe]
+        # The similarities between each subvector of each query and every codeword
+        tables = np.einsum("qmd,mkd->qmk", self._pad(queries), self.codebooks)
+
+        results: List[List[Tuple[int, float]]] = []
+        for i, k in enumerate(top_k):
+            probed = [target for target in probes[i].tolist() if counts[target]]
+            if k <= 0 or not probed:
+                results.append([])
+                continue
+            rows = np.concatenate([lists[target][0][: counts[target]] for target in probed])
+            codes = np.concatenate([lists[target][1][: counts[target]] for target in probed])
+            scores = np.repeat(coarse_scores[i, probed], counts[probed])
+            scores += tables[i][subvector_rows, codes].sum(axis=1)
+            scores[deleted[rows] | (rows >= limit)] = -np.inf
+
+            candidates = min(len(rows), k * rerank if rerank > 0 else k)
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            top = top[scores[top] != -np.inf]
+            rows, scores = rows[top], scores[top]
+            if rerank > 0 and len(rows):
+                # Read the candidates from the full vectors in row order
+                order = np.argsort(rows)
+                rows = rows[order]
+                scores = vectors[rows] @ queries[i]
+            best = np.argsort(-scores)[:k]
+            results.append(
+                [(int(row), float(score)) for row, score in zip(rows[best], scores[best])]
+            )
+        return results
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            temporary_path = f"{path}.tmp"
+            with open(temporary_path, "wb") as f:
+                np.savez(
+                    f,
+                    params=np.array([self.nlist, self.m, self._size, int(self._trained)]),
+                    deleted=self.deleted[: self._size],
+                    centroids=self.centroids,
+                    codebooks=self.codebooks,
+                    counts=self._counts,
+                    rows=np.concatenate(
+                        [rows[:count] for (rows, _), count in zip(self._lists, self._counts)]
+                        or [np.zeros(0, dtype=np.int32)]
+                    ),
+                    codes=np.concatenate(
+                        [codes[:count] for (_, codes), count in zip(self._lists, self._counts)]
+                        or [np.zeros((0, self.m), dtype=np.uint8)]
+                    ),
+                )
+            os.replace(temporary_path, path)
+
+    def load(self, path: str) -> bool:
+        with np.load(path) as saved:
+            nlist, m, size, trained = saved["params"].tolist()
+            if nlist != self.nlist or m != self.m:
+                return False
+            with self._lock:
+                self.clear()
+                self._size = size
+                self.deleted = saved["deleted"]
+                self.centroids = saved["centroids"]
+                self.codebooks = saved["codebooks"]
+                if trained:
+                    self._counts = saved["counts"]
+                    bounds = np.cumsum(self._counts)[:-1]
+                    self._lists = list(
+                        zip(np.split(saved["rows"], bounds), np.split(saved["codes"], bounds))
+                    )
+                    self._trained = True
+        return True
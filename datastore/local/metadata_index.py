@@ -0,0 +1,235 @@
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# The number of unsorted dates kept before they are merged into the sorted column
+MIN_DATES_TAIL = 4096
+
+
+class RowList:
+    """
+    A growable sorted array of rows, appended to in increasing order.
+
+    Reads take a view of the rows appended so far, which later appends don't change: the
+    array is replaced rather than resized when it grows.
+    """
+
+    def __init__(self):
+        self._rows = np.zeros(4, dtype=np.int64)
+        self._count = 0
+
+    def extend(self, rows: Sequence[int]) -> None:
+        size = self._count + len(rows)
+        if size > len(self._rows):
+            grown = np.zeros(max(size, 2 * len(self._rows)), dtype=np.int64)
+            grown[: self._count] = self._rows[: self._count]
+            self._rows = grown
+        self._rows[self._count : size] = rows
+        self._count = size
+
+    def view(self) -> np.ndarray:
+        rows = self._rows
+        return rows[: min(self._count, len(rows))]
+
+
+class SortedDates:
+    """
+    The rows with a date, sorted by date so that a range is found by binary search.
+
+    New dates go to an unsorted tail, merged into the sorted arrays once it holds an
+    eighth of them, so that adding n dates costs O(n log n) overall. Each part is a tuple
+    replaced at once, so that searches read consistent arrays without a lock.
+    """
+
+    def __init__(self):
+        empty = np.zeros(0, dtype=np.int64)
+        self._sorted = (empty, empty)
+        self._tail = (empty, empty, 0)
+
+    def add(self, rows: Sequence[int], dates: Sequence[int]) -> None:
+        tail_dates, tail_rows, count = self._tail
+        size = count + len(rows)
+        if size > len(tail_dates):
+            capacity = max(size, 2 * len(tail_dates), 1024)
+            tail_dates = np.concatenate([tail_dates[:count], np.zeros(capacity - count, np.int64)])
+            tail_rows = np.concatenate([tail_rows[:count], np.zeros(capacity - count, np.int64)])
+        tail_dates[count:size] = dates
+        tail_rows[count:size] = rows
+        self._tail = (tail_dates, tail_rows, size)
+
+        sorted_dates, sorted_rows = self._sorted
+        if size >= max(MIN_DATES_TAIL, len(sorted_dates) // 8):
+            dates = np.concatenate([sorted_dates, tail_dates[:size]])
+            rows = np.concatenate([sorted_rows, tail_rows[:size]])
+            order = np.argsort(dates, kind="stable")
+            self._sorted = (dates[order], rows[order])
+            empty = np.zeros(0, dtype=np.int64)
+            self._tail = (empty, empty, 0)
+
+    def _bounds(
+        self, dates: np.ndarray, start: Optional[float], end: Optional[float]
+    ) -> Tuple[int, int]:
+        low = 0 if start is None else int(np.searchsorted(dates, math.ceil(start), "left"))
+        high = (
+            len(dates)
+            if end is None
+            else int(np.searchsorted(dates, math.floor(end), "right"))
+        )
+        return low, high
+
+    def estimate(self, start: Optional[float], end: Optional[float]) -> int:
+        """
+        Return an upper bound of the number of rows dated between start and end, in O(log n).
+        """
+        low, high = self._bounds(self._sorted[0], start, end)
+        return high - low + self._tail[2]
+
+    def range(self, start: Optional[float], end: Optional[float]) -> np.ndarray:
+        """
+        Return the rows dated between start and end included, sorted by row.
+        """
+        # Read the tail before the sorted arrays, a merge in between only duplicates rows
+        tail_dates, tail_rows, count = self._tail
+        tail_dates, tail_rows = tail_dates[:count], tail_rows[:count]
+        dates, rows = self._sorted
+        low, high = self._bounds(dates, start, end)
+        in_tail = np.ones(count, dtype=bool)
+        if start is not None:
+            in_tail &= tail_dates >= start
+        if end is not None:
+            in_tail &= tail_dates <= end
+        return np.unique(np.concatenate([rows[low:high], tail_rows[in_tail]]))
+
+
+class MetadataIndex:
+    """
+    An inverted index of the metadata of the rows of a LocalVectorStore: for each
+    categorical field, the sorted list of the rows of each value, and the rows sorted by
+    created_at. Deleted rows stay in the index, the store drops them from the candidates.
+    """
+
+    def __init__(self, fields: Sequence[str]):
+        self.fields = list(fields)
+        self.clear()
+
+    def clear(self) -> None:
+        self._postings: Dict[str, Dict[Any, RowList]] = {field: {} for field in self.fields}
+        self._dates = SortedDates()
+
+    def add(self, start: int, metadata: Sequence[Dict[str, Any]]) -> None:
+        """
+        Index the metadata of the rows from start on.
+        """
+        for field, postings in self._postings.items():
+            groups: Dict[Any, List[int]] = {}
+            for row, row_metadata in enumerate(metadata, start):
+                value = row_metadata.get(field)
+                if value is not None:
+                    groups.setdefault(value, []).append(row)
+            for value, rows in groups.items():
+                postings.setdefault(value, RowList()).extend(rows)
+        dated = [
+            (row, int(row_metadata["created_at_ts"]))
+            for row, row_metadata in enumerate(metadata, start)
+            if row_metadata.get("created_at_ts") is not None
+        ]
+        if dated:
+            rows, dates = zip(*dated)
+            self._dates.add(rows, dates)
+
+    def add_columns(
+        self,
+        start: int,
+        codes: Dict[str, Tuple[Sequence[Any], np.ndarray]],
+        created_at_ts: np.ndarray,
+    ) -> None:
+        """
+        Index the rows from start on from factorized metadata columns, as read from a
+        snapshot, grouping the rows of each value with a sort rather than row by row.
+
+        Args:
+            start: The first row of the columns.
+            codes: For each field, its distinct values and the code of each row, -1 for None.
+            created_at_ts: The created_at timestamp of each row, NaN for rows without a date.
+        """
+        for field, postings in self._postings.items():
+            values, field_codes = codes[field]
+            # Slices of a memory-mapped array are slow to take one by one
+            field_codes = np.asarray(field_codes)
+            order = np.argsort(field_codes, kind="stable")
+            bounds = np.searchsorted(field_codes[order], np.arange(-1, len(values) + 1))
+            for code, value in enumerate(values):
+                rows = order[bounds[code + 1] : bounds[code + 2]]
+                if len(rows):
+                    postings.setdefault(value, RowList()).extend(rows + start)
+        dated = np.flatnonzero(~np.isnan(created_at_ts))
+        if len(dated):
+            self._dates.add(dated + start, created_at_ts[dated].astype(np.int64))
+
+    def rows(self, field: str, value: Any) -> np.ndarray:
+        """
+        Return the sorted rows whose field has the given value.
+        """
+        postings = self._postings[field].get(value)
+        return postings.view() if postings is not None else np.zeros(0, dtype=np.int64)
+
+    def match(
+        self,
+        values: Dict[str, Any],
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+        dates: Optional[np.ndarray] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Find the rows that match every given field value and a date range.
+
+        The row lists of the fields and of the date range are intersected from the
+        shortest, by binary search of its rows in the longer lists, so that the cost
+        follows the most selective part of the filter. The date range is found in the
+        sorted dates when it is the shortest, or else checked against the dates of the
+        remaining rows.
+
+        Args:
+            values: The value each field must have, fields set to None are ignored.
+            start_ts: The earliest created_at timestamp, if any.
+            end_ts: The latest created_at timestamp, if any.
+            dates: The created_at_ts column of the store, NaN for rows without a date.
+
+        Returns:
+            The sorted matching rows, or None if nothing is filtered.
+        """
+        lists: List[Tuple[int, np.ndarray]] = []
+        for field, value in values.items():
+            if value is not None:
+                rows = self.rows(field, value)
+                lists.append((len(rows), rows))
+        dated = start_ts is not None or end_ts is not None
+        if not lists and not dated:
+            return None
+
+        lists.sort(key=lambda item: item[0])
+        if dated and (not lists or self._dates.estimate(start_ts, end_ts) < lists[0][0]):
+            # The date range is narrower than any field, start from its rows
+            matches = self._dates.range(start_ts, end_ts)
+            dated = False
+        else:
+            matches = lists.pop(0)[1]
+        for _, rows in lists:
+            if not len(matches):
+                break
+            # Look the rows of the shorter list up in the longer one, both are sorted
+            positions = np.searchsorted(rows, matches).clip(max=len(rows) - 1)
+            matches = matches[rows[positions] == matches] if len(rows) else rows
+        if dated and len(matches):
+            assert dates is not None
+            matches = matches[matches < len(dates)]
+            row_dates = dates[matches]
+            # Rows without a date never match a date range, NaN compares false
+            keep = ~np.isnan(row_dates)
+            if start_ts is not None:
+                keep &= row_dates >= start_ts
+            if end_ts is not None:
+                keep &= row_dates <= end_ts
+            matches = matches[keep]
+        return matches
@@ -0,0 +1,242 @@
+import os
+import threading
+from abc import abstractmethod
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from datastore.local.index import VectorIndex
+
+# The number of codes scored at a time, which bounds the memory used by a scan
+SCAN_BLOCK_ROWS = 8192
+
+# The number of bits set in each byte
+POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
+
+
+class QuantizedIndex(VectorIndex):
+    """
+    A flat index of compact codes of the vectors. A search scans every code to find the
+    rescore * top_k best candidates of each query, then scores the candidates again
+    exactly against the full vectors, which only reads their rows of the memory-mapped
+    matrix.
+
+    The codes are kept in columns that grow by doubling, like the metadata of the store.
+    Subclasses define the codes and how a query scores them.
+    """
+
+    def __init__(self, rescore: int = 10):
+        self.rescore = rescore
+        self._lock = threading.Lock()
+        self.clear()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def memory_bytes(self) -> int:
+        """
+        The memory held by the codes of the rows added so far.
+        """
+        return sum(
+            column[: self._size].nbytes for column in self._columns.values()
+        ) + self._size * self.deleted.itemsize
+
+    def clear(self) -> None:
+        self._size = 0
+        self.deleted = np.zeros(0, dtype=bool)
+        self._columns: Dict[str, np.ndarray] = {}
+
+    @abstractmethod
+    def _encode(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Compute the code columns of a block of normalized vectors.
+        """
+        raise NotImplementedError
+
+    def _prepare(self, queries: np.ndarray) -> np.ndarray:
+        """
+        Convert the normalized queries to the form _score takes, once per search.
+        """
+        return queries
+
+    @abstractmethod
+    def _score(self, columns: Dict[str, np.ndarray], queries: np.ndarray) -> np.ndarray:
+        """
+        Estimate the cosine similarities of the queries to a block of codes.
+
+        Returns:
+            The estimates, with shape (queries, rows).
+        """
+        raise NotImplementedError
+
+    def _reserve(self, size: int, columns: Dict[str, np.ndarray]) -> None:
+        capacity = len(self.deleted)
+        if size <= capacity and self._columns:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+
+        def grow(column: np.ndarray, like: np.ndarray) -> np.ndarray:
+            grown = np.zeros((capacity,) + like.shape[1:], dtype=like.dtype)
+            grown[: self._size] = column[: self._size]
+            return grown
+
+        deleted = grow(self.deleted, self.deleted)
+        # Searches keep reading the old columns, which hold the same first rows
+        self._columns = {
+            name: grow(self._columns.get(name, like), like) for name, like in columns.items()
+        }
+        self.deleted = deleted
+
+    def add(self, vectors: np.ndarray, start: int) -> None:
+        with self._lock:
+            if start != self._size:
+                raise ValueError(f"Expected rows from {self._size}, got {start}")
+            end = len(vectors)
+            for block_start in range(start, end, SCAN_BLOCK_ROWS):
+                block_end = min(end, block_start + SCAN_BLOCK_ROWS)
+                codes = self._encode(np.asarray(vectors[block_start:block_end]))
+                self._reserve(block_end, codes)
+                for name, column in codes.items():
+                    self._columns[name][block_start:block_end] = column
+                self._size = block_end
+
+    def remove(self, rows: Sequence[int]) -> None:
+        with self._lock:
+            rows = [row for row in rows if row < self._size]
+            self.deleted[rows] = True
+
+    def search(
+        self,
+        vectors: np.ndarray,
+        queries: np.ndarray,
+        top_k: Sequence[int],
+        rescore: Optional[int] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        size = min(self._size, len(vectors))
+        columns = self._columns
+        deleted = self.deleted
+        rescore = self.rescore if rescore is None else rescore
+        n = len(top_k)
+        k = max(top_k, default=0)
+        if k == 0 or size == 0:
+            return [[] for _ in range(n)]
+        candidates = k * rescore if rescore > 0 else k
+
+        # The first pass keeps the running best candidates of every query over the codes
+        prepared = self._prepare(queries)
+        best_scores = np.zeros((n, 0), dtype=np.float32)
+        best_rows = np.zeros((n, 0), dtype=np.int64)
+        for start in range(0, size, SCAN_BLOCK_ROWS):
+            end = min(size, start + SCAN_BLOCK_ROWS)
+            scores = self._score(
+                {name: column[start:end] for name, column in columns.items()}, prepared
+            ).astype(np.float32)
+            scores[:, deleted[start:end]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, end), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_scores.shape[1] > candidates:
+                top = np.argpartition(best_scores, -candidates, axis=1)[:, -candidates:]
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+                best_rows = np.take_along_axis(best_rows, top, axis=1)
+
+        results: List[List[Tuple[int, float]]] = []
+        for i in range(n):
+            found = best_scores[i] != -np.inf
+            rows, scores = best_rows[i, found], best_scores[i, found]
+            if rescore > 0 and len(rows):
+                # Read the candidates from the full vectors in row order
+                rows = np.sort(rows)
+                scores = vectors[rows] @ queries[i]
+            best = np.argsort(-scores)[: top_k[i]]
+            results.append(
+                [(int(row), float(score)) for row, score in zip(rows[best], scores[best])]
+            )
+        return results
+
+    def save(self, path: str) -> None:
+        with self._lock:
+            temporary_path = f"{path}.tmp"
+            with open(temporary_path, "wb") as f:
+                np.savez(
+                    f,
+                    deleted=self.deleted[: self._size],
+                    **{name: column[: self._size] for name, column in self._columns.items()},
+                )
+            os.replace(temporary_path, path)
+
+    def load(self, path: str) -> bool:
+        with np.load(path) as saved:
+            with self._lock:
+                self.clear()
+                self.deleted = saved["deleted"]
+                self._columns = {
+                    name: saved[name] for name in saved.files if name != "deleted"
+                }
+                self._size = len(self.deleted)
+        return True
+
+
+class Int8Index(QuantizedIndex):
+    """
+    Scalar quantization of each vector to int8, with one float32 scale per vector, which
+    stores a vector in a quarter of the memory of float32.
+    """
+
+    file_name = "int8.npz"
+
+    def _encode(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return {"codes": codes, "scales": scales.astype(np.float32)}
+
+    def _score(self, columns: Dict[str, np.ndarray], queries: np.ndarray) -> np.ndarray:
+        return (queries @ columns["codes"].T.astype(np.float32)) * columns["scales"]
+
+
+class BinaryIndex(QuantizedIndex):
+    """
+    Binary quantization of each vector to the signs of its components, one bit per
+    dimension, which stores a vector in 1/32 of the memory of float32. Codes are compared
+    by Hamming distance, counting the differing bits of 64 bit words at a time.
+    """
+
+    file_name = "binary.npz"
+
+    def _encode(self, vectors: np.ndarray) -> Dict[str, np.ndarray]:
+        return {"bits": pack_signs(vectors)}
+
+    def _prepare(self, queries: np.ndarray) -> np.ndarray:
+        return pack_signs(queries)
+
+    def _score(self, columns: Dict[str, np.ndarray], queries: np.ndarray) -> np.ndarray:
+        bits = columns["bits"]
+        distances = popcount(bits[None, :, :] ^ queries[:, None, :]).sum(
+            axis=2, dtype=np.int32
+        )
+        # The fraction of differing bits estimates the angle between the vectors
+        return np.cos(np.pi * distances / (64 * bits.shape[1]))
+
+
+def pack_signs(vectors: np.ndarray) -> np.ndarray:
+    """
+    Pack the signs of the components of vectors into 64 bit words, padded with zeros.
+    """
+    words = -(-vectors.shape[1] // 64)
+    signs = np.zeros((len(vectors), 64 * words), dtype=bool)
+    signs[:, : vectors.shape[1]] = vectors > 0
+    return np.packbits(signs, axis=1).view(np.uint64)
+
+
+def popcount(words: np.ndarray) -> np.ndarray:
+    """
+    Count the bits set in each 64 bit word.
+    """
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(words)
+    # NumPy before 2.0 has no popcount, count the bits of each byte with a table
+    counts = POPCOUNT[words.view(np.uint8)]
+    return counts.reshape(words.shape + (8,)).sum(axis=-1, dtype=np.uint8)
@@ -0,0 +1,247 @@
+import heapq
+import itertools
+import json
+import multiprocessing
+import os
+import threading
+import zlib
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from datastore.local.index import create_vector_index
+from datastore.local.vector_store import LocalVectorStore, Match
+
+SHARDS_FILE = "shards.json"
+
+
+def shard_of(key: str, shards: int) -> int:
+    """
+    Return the shard that owns a key, the same in every process and on every start.
+    """
+    return zlib.crc32(key.encode("utf-8")) % shards
+
+
+def _serve_shard(path: str, connection: Connection) -> None:
+    # Runs in a worker process: answers calls to the store of one shard until told to stop
+    store = LocalVectorStore(path, index=create_vector_index())
+    while True:
+        request = connection.recv()
+        if request is None:
+            break
+        method, args = request
+        try:
+            attribute = getattr(store, method)
+            result = attribute(*args) if callable(attribute) else attribute
+            connection.send((True, result))
+        except Exception as e:
+            connection.send((False, e))
+    store.close()
+    connection.close()
+
+
+class ShardedVectorStore:
+    """
+    A LocalVectorStore partitioned across worker processes, so that searches use several
+    cores instead of one Python process.
+
+    Each worker owns the store of one shard, in its own directory, and the rows of a
+    document all go to the shard picked by a hash of its document_id. The searches of a
+    batch of queries are sent to every shard at once, and the top k matches of each shard
+    are merged with a heap. Calls to a shard go through a pipe that carries one call at a
+    time, so that concurrent calls run in parallel on different shards.
+
+    The number of shards of a directory is fixed when it is created, since it decides
+    which shard holds each document.
+    """
+
+    def __init__(self, path: str, shards: int):
+        os.makedirs(path, exist_ok=True)
+        shards_path = os.path.join(path, SHARDS_FILE)
+        if os.path.exists(shards_path):
+            with open(shards_path) as f:
+                saved_shards = json.load(f)["shards"]
+            if saved_shards != shards:
+                raise ValueError(
+                    f"The local datastore {path} has {saved_shards} shards, not {shards}"
+                )
+        else:
+            with open(shards_path, "w") as f:
+                json.dump({"shards": shards}, f)
+
+        self.path = path
+        self.shards = shards
+        # Fork isn't safe once the server runs threads, start the workers from scratch
+        context = multiprocessing.get_context("spawn")
+        self._connections: List[Connection] = []
+        self._processes = []
+        self._locks = [threading.Lock() for _ in range(shards)]
+        for shard in range(shards):
+            connection, worker_connection = context.Pipe()
+            process = context.Process(
+                target=_serve_shard,
+                args=(os.path.join(path, f"shard-{shard}"), worker_connection),
+                name=f"local datastore shard {shard}",
+                daemon=True,
+            )
+            process.start()
+            worker_connection.close()
+            self._connections.append(connection)
+            self._processes.append(process)
+        logger.info(f"Started {shards} shards of the local datastore {path}")
+
+    def _scatter(self, calls: Dict[int, Tuple[str, Tuple[Any, ...]]]) -> Dict[int, Any]:
+        """
+        Send calls to several shards before waiting for any, and return their results.
+        """
+        shards = sorted(calls)
+        # Take the locks in order, so that concurrent scatters can't deadlock
+        sent = []
+        try:
+            for shard in shards:
+                self._locks[shard].acquire()
+                sent.append(shard)
+                self._connections[shard].send(calls[shard])
+        except BaseException:
+            for shard in sent:
+                self._locks[shard].release()
+            raise
+
+        results: Dict[int, Any] = {}
+        error: Optional[BaseException] = None
+        for shard in shards:
+            try:
+                # Every reply is read even after an error, or it would answer the next call
+                ok, result = self._connections[shard].recv()
+                if ok:
+                    results[shard] = result
+                else:
+                    error = error or result
+            except BaseException as e:
+                error = error or e
+            finally:
+                self._locks[shard].release()
+        if error is not None:
+            raise error
+        return results
+
+    def _broadcast(self, method: str, *args: Any) -> List[Any]:
+        results = self._scatter({shard: (method, args) for shard in range(self.shards)})
+        return [results[shard] for shard in range(self.shards)]
+
+    def _route(self, keys: Sequence[str]) -> Dict[int, List[int]]:
+        # The positions of the keys owned by each shard
+        positions: Dict[int, List[int]] = {}
+        for position, key in enumerate(keys):
+            positions.setdefault(shard_of(key, self.shards), []).append(position)
+        return positions
+
+    @property
+    def count(self) -> int:
+        """
+        The number of rows that are not deleted, over every shard.
+        """
+        return sum(self._broadcast("count"))
+
+    def add(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        texts: Sequence[str],
+        metadata: Sequence[Dict[str, Any]],
+    ) -> None:
+        """
+        Add rows to the shards that own their documents, see LocalVectorStore.add.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        routes = self._route(
+            [row.get("document_id") or id for id, row in zip(ids, metadata)]
+        )
+        self._scatter(
+            {
+                shard: (
+                    "add",
+                    (
+                        [ids[i] for i in positions],
+                        vectors[positions],
+                        [texts[i] for i in positions],
+                        [metadata[i] for i in positions],
+                    ),
+                )
+                for shard, positions in routes.items()
+            }
+        )
+
+    def query(
+        self,
+        queries: np.ndarray,
+        top_k: Sequence[int],
+        filters: Sequence[Optional[Dict[str, Any]]],
+        include_vectors: Sequence[bool],
+    ) -> List[List[Match]]:
+        """
+        Search every shard and merge their matches, see LocalVectorStore.query.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        found = self._broadcast(
+            "query", queries, list(top_k), list(filters), list(include_vectors)
+        )
+        return [
+            list(
+                itertools.islice(
+                    heapq.merge(
+                        *[shard_found[i] for shard_found in found],
+                        key=lambda match: -match.score,
+                    ),
+                    top_k[i],
+                )
+            )
+            for i in range(len(top_k))
+        ]
+
+    def delete_ids(self, ids: Sequence[str]) -> None:
+        """
+        Delete rows by id, in every shard since an id doesn't tell its document.
+        """
+        self._broadcast("delete_ids", list(ids))
+
+    def delete_documents(self, document_ids: Sequence[str]) -> None:
+        """
+        Delete every row of the given documents, in the shards that own them.
+        """
+        routes = self._route(document_ids)
+        self._scatter(
+            {
+                shard: ("delete_documents", ([document_ids[i] for i in positions],))
+                for shard, positions in routes.items()
+            }
+        )
+
+    def delete_matching(self, filter: Dict[str, Any]) -> None:
+        """
+        Delete every row that matches a filter, in every shard.
+        """
+        self._broadcast("delete_matching", filter)
+
+    def clear(self) -> None:
+        """
+        Delete every row of every shard.
+        """
+        self._broadcast("clear")
+
+    def close(self) -> None:
+        """
+        Stop the worker processes.
+        """
+        for shard, connection in enumerate(self._connections):
+            with self._locks[shard]:
+                try:
+                    connection.send(None)
+                except OSError:
+                    pass
+        for process in self._processes:
+            process.join(timeout=10)
+        for connection in self._connections:
+            connection.close()
@@ -0,0 +1,169 @@
+import json
+import os
+import shutil
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# The file that names the latest complete snapshot of a store directory
+SNAPSHOT_FILE = "snapshot.json"
+# The prefix of the directories that hold the snapshots
+SNAPSHOT_PREFIX = "snapshot-"
+
+# The numeric columns of a snapshot, saved as .npy files that are memory-mapped on load
+ARRAY_COLUMNS = ["alive", "text_offsets", "text_lengths", "created_at_ts"]
+
+
+class Snapshot:
+    """
+    The rows of a LocalVectorStore up to a position of its log.
+
+    The numeric columns are kept as they are in the store, and the other columns are
+    factorized into their distinct values and an int32 code per row, -1 for None, so that
+    the columns are read back with a few vectorized operations instead of row by row.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        log_size: int,
+        ids: List[str],
+        arrays: Dict[str, np.ndarray],
+        codes: Dict[str, Tuple[List[Any], np.ndarray]],
+    ):
+        self.size = size
+        self.log_size = log_size
+        self.ids = ids
+        self.arrays = arrays
+        self.codes = codes
+
+    def column(self, field: str) -> np.ndarray:
+        """
+        Return a factorized column as an object array.
+        """
+        values, codes = self.codes[field]
+        # Code -1 picks the None appended after the values
+        lookup = np.empty(len(values) + 1, dtype=object)
+        lookup[: len(values)] = values
+        return lookup[codes]
+
+
+def factorize(column: Sequence[Any]) -> Tuple[List[Any], np.ndarray]:
+    """
+    Split a column into its distinct values, in order of first appearance, and the int32
+    code of the value of each row, -1 for None.
+    """
+    positions: Dict[Any, int] = {}
+    codes = np.full(len(column), -1, dtype=np.int32)
+    for row, value in enumerate(column):
+        if value is not None:
+            codes[row] = positions.setdefault(value, len(positions))
+    return list(positions), codes
+
+
+def _fsync(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_snapshot(
+    path: str,
+    size: int,
+    log_size: int,
+    ids: List[str],
+    arrays: Dict[str, np.ndarray],
+    columns: Dict[str, np.ndarray],
+) -> str:
+    """
+    Write a snapshot to a new directory of a store directory, without making it current.
+
+    Args:
+        path: The store directory.
+        size: The number of rows of the snapshot.
+        log_size: The size of the log that the rows were read from.
+        ids: The id of each row.
+        arrays: The numeric columns of ARRAY_COLUMNS.
+        columns: The object columns, factorized before they are written.
+
+    Returns:
+        The name of the snapshot directory.
+    """
+    name = f"{SNAPSHOT_PREFIX}{log_size:016d}"
+    directory = os.path.join(path, name)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+    files = []
+    for column, array in arrays.items():
+        files.append(os.path.join(directory, f"{column}.npy"))
+        np.save(files[-1], array)
+    values = {}
+    for field, column in columns.items():
+        values[field], codes = factorize(column)
+        files.append(os.path.join(directory, f"{field}.npy"))
+        np.save(files[-1], codes)
+    files.append(os.path.join(directory, "values.json"))
+    with open(files[-1], "w") as f:
+        json.dump({"size": size, "log_size": log_size, "ids": ids, "values": values}, f)
+    for file in files:
+        _fsync(file)
+    _fsync(directory)
+    return name
+
+
+def publish_snapshot(path: str, name: str) -> None:
+    """
+    Make a snapshot written by write_snapshot the current one, and delete the older ones.
+    """
+    temporary_path = os.path.join(path, f"{SNAPSHOT_FILE}.tmp")
+    with open(temporary_path, "w") as f:
+        json.dump({"directory": name}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, os.path.join(path, SNAPSHOT_FILE))
+    _fsync(path)
+    for entry in os.listdir(path):
+        if entry.startswith(SNAPSHOT_PREFIX) and entry != name:
+            shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+
+def remove_snapshots(path: str) -> None:
+    """
+    Delete every snapshot of a store directory.
+    """
+    pointer = os.path.join(path, SNAPSHOT_FILE)
+    if os.path.exists(pointer):
+        os.remove(pointer)
+    for entry in os.listdir(path):
+        if entry.startswith(SNAPSHOT_PREFIX):
+            shutil.rmtree(os.path.join(path, entry), ignore_errors=True)
+
+
+def read_snapshot(path: str, fields: Sequence[str]) -> Optional[Snapshot]:
+    """
+    Read the current snapshot of a store directory, if there is one.
+
+    The numeric columns are memory-mapped copy-on-write, so that they are paged in as they
+    are used, and can still be changed in memory.
+    """
+    pointer = os.path.join(path, SNAPSHOT_FILE)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer) as f:
+        directory = os.path.join(path, json.load(f)["directory"])
+    with open(os.path.join(directory, "values.json")) as f:
+        saved = json.load(f)
+    arrays = {
+        column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode="c")
+        for column in ARRAY_COLUMNS
+    }
+    codes = {
+        field: (
+            saved["values"][field],
+            np.load(os.path.join(directory, f"{field}.npy"), mmap_mode="r"),
+        )
+        for field in fields
+    }
+    return Snapshot(saved["size"], saved["log_size"], saved["ids"], arrays, codes)
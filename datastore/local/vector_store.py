@@ -0,0 +1,800 @@
+import json
+import math
+import os
+import shutil
+import threading
+from typing import Any, BinaryIO, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+
+from datastore.local.index import VectorIndex
+from datastore.local.metadata_index import MetadataIndex
+from datastore.local.snapshot import (
+    publish_snapshot,
+    read_snapshot,
+    remove_snapshots,
+    write_snapshot,
+)
+
+# The number of rows scored at a time, which bounds the memory used by a search
+SEARCH_BLOCK_ROWS = int(os.environ.get("LOCAL_DATASTORE_BLOCK_ROWS", 65536))
+# The number of rows added to the index after which it is saved again
+INDEX_SAVE_ROWS = int(os.environ.get("LOCAL_INDEX_SAVE_ROWS", 10000))
+# The number of rows matching a filter up to which they are searched exactly, rather than
+# filtering the results of the index
+PREFILTER_MAX_ROWS = int(os.environ.get("LOCAL_PREFILTER_MAX_ROWS", 65536))
+# Whether writes wait for the log and files to be fsynced, concurrent writes share an fsync
+WAL_FSYNC = os.environ.get("LOCAL_WAL_FSYNC", "true").lower() == "true"
+# The number of seconds between two checks for a snapshot, 0 disables the snapshots
+SNAPSHOT_INTERVAL = float(os.environ.get("LOCAL_SNAPSHOT_INTERVAL", 300))
+# The number of bytes appended to the log since the last snapshot that makes a new one worth it
+SNAPSHOT_LOG_BYTES = int(os.environ.get("LOCAL_SNAPSHOT_LOG_BYTES", 16 * 1024 * 1024))
+
+# The metadata columns kept for every row
+METADATA_FIELDS = ["document_id", "source", "source_id", "url", "created_at", "author"]
+# The metadata fields a filter can match
+FILTER_FIELDS = ["document_id", "source", "source_id", "author"]
+
+VECTORS_FILE = "vectors.f32"
+TEXTS_FILE = "texts.bin"
+ROWS_FILE = "rows.jsonl"
+META_FILE = "meta.json"
+
+
+class Match(NamedTuple):
+    """
+    A row found by a search, with what a result needs, so that it can leave the process.
+    """
+
+    score: float
+    id: str
+    text: str
+    metadata: Dict[str, Any]
+    vector: Optional[List[float]]
+
+
+class LocalVectorStore:
+    """
+    A nearest neighbor store kept in a directory on the local disk.
+
+    The embeddings are normalized and appended to a float32 matrix that is memory-mapped
+    rather than loaded, the texts to a byte file read by offset. The ids and metadata are
+    held in columns in memory, and every write is recorded in an append-only log of the
+    added and deleted rows, which is fsynced before the write returns. Concurrent writes
+    wait for the same fsync, so that its cost is shared. Deleted rows are tombstoned rather
+    than removed from the matrix, and their space is only reclaimed by clear.
+
+    A background thread snapshots the columns every SNAPSHOT_INTERVAL seconds once
+    SNAPSHOT_LOG_BYTES were appended to the log. On start the columns are memory-mapped
+    from the latest snapshot, and only the entries of the log written after it are replayed.
+
+    An approximate index can answer the queries instead of the exact search. It is saved
+    next to the files every INDEX_SAVE_ROWS added rows, and brought up to date with the
+    rows added since on start. A metadata index finds the rows that match a filter without
+    a scan, and the queries with a filter search these rows exactly when there are at most
+    PREFILTER_MAX_ROWS of them, or else filter the results of the approximate index.
+
+    Writes are serialized with a lock. Searches don't take it, they only read the rows
+    that existed when they started, which writes never change except to tombstone them.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        block_rows: int = SEARCH_BLOCK_ROWS,
+        index: Optional[VectorIndex] = None,
+        snapshot_interval: float = SNAPSHOT_INTERVAL,
+    ):
+        self.path = path
+        self.block_rows = block_rows
+        self.index: Optional[VectorIndex] = None
+        self._unsaved_index_rows = 0
+        self.dimension: Optional[int] = None
+        self.size = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._files: Dict[str, BinaryIO] = {}
+        self._log_size = 0
+        self._synced_log_size = 0
+        self._snapshot_log_size = 0
+        # Incremented by clear, so that a snapshot taken before it isn't published after it
+        self._generation = 0
+        self._closed = threading.Event()
+        self._vectors: Optional[np.ndarray] = None
+        self._texts: Optional[np.ndarray] = None
+        self._capacity = 0
+        self._alive = np.zeros(0, dtype=bool)
+        self._columns: Dict[str, np.ndarray] = {}
+        self._text_offsets = np.zeros(0, dtype=np.int64)
+        self._text_lengths = np.zeros(0, dtype=np.int64)
+        self._ids: List[str] = []
+        self._rows_by_id: Dict[str, int] = {}
+        self.metadata = MetadataIndex(FILTER_FIELDS)
+        os.makedirs(path, exist_ok=True)
+        self._load()
+        if index is not None:
+            self._attach_index(index)
+        if snapshot_interval > 0:
+            threading.Thread(
+                target=self._snapshot_periodically,
+                args=(snapshot_interval,),
+                name=f"snapshot {path}",
+                daemon=True,
+            ).start()
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @property
+    def count(self) -> int:
+        """
+        The number of rows that are not deleted.
+        """
+        return len(self._rows_by_id)
+
+    def _reserve(self, size: int) -> None:
+        # Grow the columns by doubling, so that appending n rows costs O(n) overall
+        if size <= self._capacity:
+            return
+        capacity = max(size, 2 * self._capacity, 1024)
+
+        def grow(column: np.ndarray, fill: Any) -> np.ndarray:
+            grown = np.full(capacity, fill, dtype=column.dtype)
+            grown[: self.size] = column[: self.size]
+            return grown
+
+        self._alive = grow(self._alive, False)
+        self._text_offsets = grow(self._text_offsets, 0)
+        self._text_lengths = grow(self._text_lengths, 0)
+        for field in METADATA_FIELDS:
+            self._columns[field] = grow(
+                self._columns.get(field, np.zeros(0, dtype=object)), None
+            )
+        self._columns["created_at_ts"] = grow(
+            self._columns.get("created_at_ts", np.zeros(0, dtype=np.float64)), np.nan
+        )
+        self._capacity = capacity
+
+    def _append_rows(
+        self,
+        ids: Sequence[str],
+        metadata: Sequence[Dict[str, Any]],
+        text_offsets: Sequence[int],
+        text_lengths: Sequence[int],
+    ) -> None:
+        start = self.size
+        end = start + len(ids)
+        self._reserve(end)
+        self._alive[start:end] = True
+        self._text_offsets[start:end] = text_offsets
+        self._text_lengths[start:end] = text_lengths
+        for field in METADATA_FIELDS:
+            self._columns[field][start:end] = [row.get(field) for row in metadata]
+        self._columns["created_at_ts"][start:end] = [
+            np.nan if row.get("created_at_ts") is None else row["created_at_ts"]
+            for row in metadata
+        ]
+        for row, id in enumerate(ids, start):
+            previous = self._rows_by_id.get(id)
+            if previous is not None:
+                # Adding an id again replaces its row
+                self._tombstone([previous])
+            self._rows_by_id[id] = row
+        self.metadata.add(start, metadata)
+        self._ids.extend(ids)
+        self.size = end
+
+    def _tombstone(self, rows: Sequence[int]) -> None:
+        for row in rows:
+            if not self._alive[row]:
+                continue
+            self._alive[row] = False
+            if self.index is not None:
+                self.index.remove([row])
+            id = self._ids[row]
+            if self._rows_by_id.get(id) == row:
+                del self._rows_by_id[id]
+
+    def _map(self) -> None:
+        # Map the rows that exist, the files may be longer after a crash
+        if self.dimension is None or self.size == 0:
+            self._vectors = None
+        else:
+            self._vectors = np.memmap(
+                self._file(VECTORS_FILE),
+                dtype=np.float32,
+                mode="r",
+                shape=(self.size, self.dimension),
+            )
+        text_size = (
+            int(self._text_offsets[self.size - 1] + self._text_lengths[self.size - 1])
+            if self.size
+            else 0
+        )
+        if text_size == 0:
+            self._texts = None
+        else:
+            self._texts = np.memmap(
+                self._file(TEXTS_FILE), dtype=np.uint8, mode="r", shape=(text_size,)
+            )
+
+    def _file_size(self, name: str) -> int:
+        path = self._file(name)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _load_snapshot(self) -> int:
+        try:
+            snapshot = read_snapshot(self.path, METADATA_FIELDS)
+        except Exception as e:
+            logger.warning(f"Failed to read the snapshot of {self.path}, error: {e}")
+            return 0
+        if snapshot is None:
+            return 0
+        if (
+            self.dimension is None
+            or snapshot.log_size > self._file_size(ROWS_FILE)
+            or snapshot.size * self.dimension * 4 > self._file_size(VECTORS_FILE)
+        ):
+            logger.warning(f"Ignoring a snapshot of {self.path} newer than its files")
+            return 0
+
+        size = snapshot.size
+        self._alive = snapshot.arrays["alive"]
+        self._text_offsets = snapshot.arrays["text_offsets"]
+        self._text_lengths = snapshot.arrays["text_lengths"]
+        self._columns = {field: snapshot.column(field) for field in METADATA_FIELDS}
+        self._columns["created_at_ts"] = snapshot.arrays["created_at_ts"]
+        self._ids = snapshot.ids
+        alive_rows = np.flatnonzero(self._alive)
+        self._rows_by_id = dict(zip([self._ids[row] for row in alive_rows], alive_rows.tolist()))
+        self.metadata.add_columns(0, snapshot.codes, snapshot.arrays["created_at_ts"])
+        self.size = self._capacity = size
+        return snapshot.log_size
+
+    def _replay(self, offset: int) -> int:
+        # Apply the entries of the log from offset on, and return where the last complete one ends
+        log_size = offset
+        if not os.path.exists(self._file(ROWS_FILE)):
+            return log_size
+        vectors_size = self._file_size(VECTORS_FILE)
+        texts_size = self._file_size(TEXTS_FILE)
+        with open(self._file(ROWS_FILE), "rb") as f:
+            f.seek(offset)
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last line of the log is incomplete after a crash
+                    logger.warning(f"Ignoring an incomplete entry in {self.path}")
+                    break
+                if entry["op"] == "add":
+                    # The log may reach the disk before the files it refers to
+                    end = (self.size + len(entry["ids"])) * (self.dimension or 0) * 4
+                    text_end = entry["text_offsets"][-1] + entry["text_lengths"][-1]
+                    if end > vectors_size or text_end > texts_size:
+                        logger.warning(f"Ignoring an incomplete entry in {self.path}")
+                        break
+                    self._append_rows(
+                        entry["ids"],
+                        entry["metadata"],
+                        entry["text_offsets"],
+                        entry["text_lengths"],
+                    )
+                elif entry["op"] == "delete":
+                    self._tombstone(entry["rows"])
+                log_size += len(line)
+        return log_size
+
+    def _load(self) -> None:
+        if os.path.exists(self._file(META_FILE)):
+            with open(self._file(META_FILE)) as f:
+                self.dimension = json.load(f)["dimension"]
+
+        self._snapshot_log_size = self._load_snapshot()
+        log_size = self._replay(self._snapshot_log_size)
+        if log_size > self._snapshot_log_size:
+            logger.info(
+                f"Replayed {log_size - self._snapshot_log_size} bytes of the log of {self.path}"
+            )
+
+        # Drop whatever was written after the last complete entry of the log
+        self._truncate(ROWS_FILE, log_size)
+        self._log_size = self._synced_log_size = log_size
+        if self.dimension is not None:
+            self._truncate(VECTORS_FILE, self.size * self.dimension * 4)
+        if self.size:
+            self._truncate(
+                TEXTS_FILE,
+                int(self._text_offsets[self.size - 1] + self._text_lengths[self.size - 1]),
+            )
+        self._map()
+        if self.size:
+            logger.info(f"Loaded {self.count} vectors from {self.path}")
+
+    def _attach_index(self, index: VectorIndex) -> None:
+        path = self._file(index.file_name)
+        if os.path.exists(path):
+            try:
+                loaded = index.load(path)
+            except Exception as e:
+                logger.warning(f"Failed to load the index {path}, error: {e}")
+                loaded = False
+            # The store may have lost the rows of an incomplete write that the index has
+            if not loaded or index.size > self.size:
+                index.clear()
+        if index.size < self.size and self._vectors is not None:
+            logger.info(f"Indexing {self.size - index.size} vectors of {self.path}")
+            self._unsaved_index_rows += self.size - index.size
+            index.add(self._vectors, index.size)
+        index.remove(np.flatnonzero(~self._alive[: self.size]))
+        self.index = index
+        self._save_index(force=False)
+
+    def _save_index(self, force: bool) -> None:
+        if self.index is None:
+            return
+        if force or self._unsaved_index_rows >= INDEX_SAVE_ROWS:
+            self.index.save(self._file(self.index.file_name))
+            self._unsaved_index_rows = 0
+
+    def save_index(self) -> None:
+        """
+        Save the index, so that the next start doesn't index the rows added since it was last saved.
+        """
+        with self._lock:
+            self._save_index(force=True)
+
+    def snapshot(self) -> bool:
+        """
+        Snapshot the columns, so that the next start only replays the log written after it.
+
+        The columns are copied under the lock, which only blocks writes for the time of the
+        copy, and are written and fsynced to a new snapshot directory without it.
+
+        Returns:
+            Whether a snapshot was published.
+        """
+        with self._snapshot_lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> bool:
+        with self._lock:
+            size = self.size
+            log_size = self._log_size
+            generation = self._generation
+            if size == 0 or log_size == self._snapshot_log_size:
+                return False
+            arrays = {
+                "alive": self._alive[:size].copy(),
+                "text_offsets": self._text_offsets[:size].copy(),
+                "text_lengths": self._text_lengths[:size].copy(),
+                "created_at_ts": self._columns["created_at_ts"][:size].copy(),
+            }
+            columns = {field: self._columns[field][:size].copy() for field in METADATA_FIELDS}
+            ids = self._ids[:size]
+
+        # The snapshot must not get ahead of the log and files on disk
+        self._sync(log_size)
+        name = write_snapshot(self.path, size, log_size, ids, arrays, columns)
+        with self._lock:
+            if generation != self._generation:
+                # The store was cleared in the meantime
+                shutil.rmtree(self._file(name), ignore_errors=True)
+                return False
+            publish_snapshot(self.path, name)
+            self._snapshot_log_size = log_size
+            self._save_index(force=True)
+        logger.info(f"Saved a snapshot of {size} rows of {self.path}")
+        return True
+
+    def _snapshot_periodically(self, interval: float) -> None:
+        while not self._closed.wait(interval):
+            if self._log_size - self._snapshot_log_size < SNAPSHOT_LOG_BYTES:
+                continue
+            try:
+                self.snapshot()
+            except Exception as e:
+                logger.error(f"Failed to snapshot {self.path}, error: {e}")
+
+    def close(self) -> None:
+        """
+        Stop the snapshots and close the files of the store.
+        """
+        self._closed.set()
+        with self._lock, self._sync_lock:
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+
+    def _truncate(self, name: str, size: int) -> None:
+        path = self._file(name)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            os.truncate(path, size)
+
+    def _append(self, name: str, data: bytes) -> None:
+        f = self._files.get(name)
+        if f is None:
+            f = self._files[name] = open(self._file(name), "ab", buffering=0)
+        f.write(data)
+
+    def _append_log(self, entry: Dict[str, Any]) -> None:
+        line = (json.dumps(entry) + "\n").encode("utf-8")
+        self._append(ROWS_FILE, line)
+        self._log_size += len(line)
+
+    def _sync(self, log_size: int) -> None:
+        """
+        Wait until the log is on disk up to log_size, with the vectors and texts it refers to.
+
+        A caller that finds an fsync under way waits for it, and the next fsync covers every
+        write appended in between, so that concurrent writers share fsyncs.
+        """
+        if not WAL_FSYNC:
+            return
+        with self._sync_lock:
+            if self._synced_log_size >= log_size:
+                return
+            # Appends finish before _log_size covers them, so this covers whole writes
+            synced_log_size = self._log_size
+            for f in list(self._files.values()):
+                os.fsync(f.fileno())
+            self._synced_log_size = synced_log_size
+
+    def add(
+        self,
+        ids: Sequence[str],
+        vectors: np.ndarray,
+        texts: Sequence[str],
+        metadata: Sequence[Dict[str, Any]],
+    ) -> None:
+        """
+        Append rows to the store, replacing the rows that have the same ids.
+
+        Args:
+            ids: The unique id of each row.
+            vectors: The embeddings, one row per id. They are normalized before they are stored.
+            texts: The text of each row.
+            metadata: The metadata of each row, with the keys of METADATA_FIELDS and created_at_ts,
+                the unix timestamp of created_at.
+        """
+        if len(ids) == 0:
+            return
+        vectors = normalize(np.asarray(vectors, dtype=np.float32))
+        encoded = [text.encode("utf-8") for text in texts]
+        with self._lock:
+            if self.dimension is None:
+                self.dimension = int(vectors.shape[1])
+                with open(self._file(META_FILE), "w") as f:
+                    json.dump({"dimension": self.dimension}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+            elif vectors.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Expected embeddings of dimension {self.dimension}, got {vectors.shape[1]}"
+                )
+
+            text_start = (
+                int(self._text_offsets[self.size - 1] + self._text_lengths[self.size - 1])
+                if self.size
+                else 0
+            )
+            lengths = [len(text) for text in encoded]
+            offsets = np.cumsum([text_start] + lengths[:-1]).tolist()
+
+            # Write the vectors and texts before the log entry that makes them visible
+            self._append(VECTORS_FILE, vectors.tobytes())
+            self._append(TEXTS_FILE, b"".join(encoded))
+            self._append_log(
+                {
+                    "op": "add",
+                    "ids": list(ids),
+                    "metadata": list(metadata),
+                    "text_offsets": offsets,
+                    "text_lengths": lengths,
+                }
+            )
+            start = self.size
+            self._append_rows(ids, metadata, offsets, lengths)
+            self._map()
+            if self.index is not None:
+                self.index.add(self._vectors, start)
+                self._unsaved_index_rows += len(ids)
+                self._save_index(force=False)
+            log_size = self._log_size
+        self._sync(log_size)
+
+    def delete_rows(self, rows: Sequence[int]) -> None:
+        """
+        Delete rows by position.
+        """
+        with self._lock:
+            rows = [int(row) for row in rows if self._alive[row]]
+            if not rows:
+                return
+            self._append_log({"op": "delete", "rows": rows})
+            self._tombstone(rows)
+            log_size = self._log_size
+        self._sync(log_size)
+
+    def delete_ids(self, ids: Sequence[str]) -> None:
+        """
+        Delete rows by id.
+        """
+        self.delete_rows([self._rows_by_id[id] for id in ids if id in self._rows_by_id])
+
+    def delete_matching(self, filter: Dict[str, Any]) -> None:
+        """
+        Delete every row that matches a filter, given as the arguments of filter_rows.
+        """
+        rows = self.filter_rows(**filter)
+        if rows is not None:
+            self.delete_rows(rows.tolist())
+
+    def delete_documents(self, document_ids: Sequence[str]) -> None:
+        """
+        Delete every row of the given documents.
+        """
+        rows: List[int] = []
+        for document_id in document_ids:
+            rows.extend(self.metadata.rows("document_id", document_id).tolist())
+        self.delete_rows(rows)
+
+    def clear(self) -> None:
+        """
+        Delete every row and the files that hold them.
+        """
+        with self._lock, self._sync_lock:
+            remove_snapshots(self.path)
+            # Searches don't take the lock and may still read the memory maps of the old
+            # files, which would fault if the files were truncated under them. Swap in new
+            # empty files instead, the old ones go away with their last map. The log goes
+            # first, so that it never refers to vectors or texts that are gone.
+            for f in self._files.values():
+                f.close()
+            self._files = {}
+            for name in [ROWS_FILE, VECTORS_FILE, TEXTS_FILE]:
+                temporary_path = f"{self._file(name)}.tmp"
+                open(temporary_path, "wb").close()
+                os.replace(temporary_path, self._file(name))
+            self._generation += 1
+            self._log_size = self._synced_log_size = self._snapshot_log_size = 0
+            self.size = 0
+            self._capacity = 0
+            self._alive = np.zeros(0, dtype=bool)
+            self._columns = {}
+            self._text_offsets = np.zeros(0, dtype=np.int64)
+            self._text_lengths = np.zeros(0, dtype=np.int64)
+            self._ids = []
+            self._rows_by_id = {}
+            self.metadata.clear()
+            self._map()
+            if self.index is not None:
+                self.index.clear()
+                self._save_index(force=True)
+
+    def filter_rows(
+        self,
+        document_id: Optional[str] = None,
+        source: Optional[str] = None,
+        source_id: Optional[str] = None,
+        author: Optional[str] = None,
+        start_ts: Optional[float] = None,
+        end_ts: Optional[float] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Return the sorted rows that match a metadata filter, or None if nothing is filtered.
+        """
+        alive = self._alive
+        rows = self.metadata.match(
+            {
+                "document_id": document_id,
+                "source": source,
+                "source_id": source_id,
+                "author": author,
+            },
+            start_ts,
+            end_ts,
+            self._columns.get("created_at_ts"),
+        )
+        if rows is None:
+            return None
+        rows = rows[rows < len(alive)]
+        return rows[alive[rows]]
+
+    def search(
+        self,
+        queries: np.ndarray,
+        top_k: Sequence[int],
+        filters: Sequence[Optional[np.ndarray]],
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        Find the rows with the highest cosine similarity to each query.
+
+        The queries without a filter are answered by the index if there is one, or else
+        scored all at once with a matrix multiplication, a block of rows at a time, keeping
+        the running top k of each query with argpartition. A query with a filter scores the
+        rows it matches, unless there are more than PREFILTER_MAX_ROWS of them and the index
+        can answer it: the index is then asked for enough results that top k of them should
+        match the filter, and the rows are scored if too few do.
+
+        Args:
+            queries: The query embeddings, one row per query.
+            top_k: The number of rows to return for each query.
+            filters: For each query, the sorted rows it may return, or None for every row.
+
+        Returns:
+            For each query, the (row, score) pairs of its nearest rows, best first.
+        """
+        vectors = self._vectors
+        n = len(top_k)
+        if n == 0 or vectors is None:
+            return [[] for _ in range(n)]
+        queries = normalize(np.asarray(queries, dtype=np.float32))
+        index = self.index if self.index is not None and self.index.ready else None
+        results: List[List[Tuple[int, float]]] = [[] for _ in range(n)]
+
+        unfiltered = [i for i in range(n) if filters[i] is None]
+        if unfiltered:
+            search = index.search if index is not None else self._exact_search
+            found = search(vectors, queries[unfiltered], [top_k[i] for i in unfiltered])
+            for i, query_results in zip(unfiltered, found):
+                results[i] = query_results
+
+        for i in range(n):
+            rows = filters[i]
+            if rows is None or top_k[i] <= 0:
+                continue
+            # The filter may match rows added after the search started
+            rows = rows[: np.searchsorted(rows, len(vectors))]
+            if index is not None and len(rows) > PREFILTER_MAX_ROWS:
+                results[i] = self._postfiltered_search(
+                    index, vectors, queries[i], top_k[i], rows
+                )
+            else:
+                results[i] = self._prefiltered_search(vectors, queries[i], top_k[i], rows)
+        return results
+
+    def query(
+        self,
+        queries: np.ndarray,
+        top_k: Sequence[int],
+        filters: Sequence[Optional[Dict[str, Any]]],
+        include_vectors: Sequence[bool],
+    ) -> List[List[Match]]:
+        """
+        Search like search, with filters given as the arguments of filter_rows, and return
+        the matches with their id, text and metadata rather than their rows.
+
+        Args:
+            queries: The query embeddings, one row per query.
+            top_k: The number of matches to return for each query.
+            filters: For each query, the arguments of filter_rows, or None for every row.
+            include_vectors: For each query, whether to return the vectors of the matches.
+
+        Returns:
+            For each query, its best matches, best first.
+        """
+        found = self.search(
+            queries,
+            top_k,
+            [self.filter_rows(**filter) if filter else None for filter in filters],
+        )
+        results = []
+        for matches, include_vector in zip(found, include_vectors):
+            results.append(
+                [
+                    Match(
+                        score,
+                        *self.get_row(row),
+                        self.get_vector(row).tolist() if include_vector else None,
+                    )
+                    for row, score in matches
+                ]
+            )
+        return results
+
+    def _exact_search(
+        self, vectors: np.ndarray, queries: np.ndarray, top_k: Sequence[int]
+    ) -> List[List[Tuple[int, float]]]:
+        size = len(vectors)
+        alive = self._alive
+        n = len(top_k)
+        k = max(top_k, default=0)
+        if k == 0:
+            return [[] for _ in range(n)]
+
+        best_scores = np.zeros((n, 0), dtype=np.float32)
+        best_rows = np.zeros((n, 0), dtype=np.int64)
+        for start in range(0, size, self.block_rows):
+            end = min(size, start + self.block_rows)
+            scores = queries @ vectors[start:end].T
+            scores[:, ~alive[start:end]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, end), scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, rows], axis=1)
+            if best_scores.shape[1] > k:
+                top = np.argpartition(best_scores, -k, axis=1)[:, -k:]
+                best_scores = np.take_along_axis(best_scores, top, axis=1)
+                best_rows = np.take_along_axis(best_rows, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        return [
+            [
+                (int(row), float(score))
+                for row, score in zip(best_rows[i, : top_k[i]], best_scores[i, : top_k[i]])
+                if score != -np.inf
+            ]
+            for i in range(n)
+        ]
+
+    def _prefiltered_search(
+        self, vectors: np.ndarray, query: np.ndarray, k: int, rows: np.ndarray
+    ) -> List[Tuple[int, float]]:
+        # Score only the rows that match, a block of rows at a time
+        best_scores = np.zeros(0, dtype=np.float32)
+        best_rows = np.zeros(0, dtype=np.int64)
+        for start in range(0, len(rows), self.block_rows):
+            block = rows[start : start + self.block_rows]
+            best_scores = np.concatenate([best_scores, vectors[block] @ query])
+            best_rows = np.concatenate([best_rows, block])
+            if len(best_scores) > k:
+                top = np.argpartition(best_scores, -k)[-k:]
+                best_scores, best_rows = best_scores[top], best_rows[top]
+        order = np.argsort(-best_scores)[:k]
+        return [
+            (int(row), float(score)) for row, score in zip(best_rows[order], best_scores[order])
+        ]
+
+    def _postfiltered_search(
+        self,
+        index: VectorIndex,
+        vectors: np.ndarray,
+        query: np.ndarray,
+        k: int,
+        rows: np.ndarray,
+    ) -> List[Tuple[int, float]]:
+        # Ask for enough results that about twice k of them should match the filter
+        selectivity = len(rows) / max(self.count, 1)
+        candidates = min(len(vectors), math.ceil(2 * k / selectivity))
+        found = index.search(vectors, query[None], [candidates])[0]
+        found_rows = np.array([row for row, _ in found], dtype=np.int64)
+        positions = np.searchsorted(rows, found_rows).clip(max=len(rows) - 1)
+        matches = [pair for pair, match in zip(found, rows[positions] == found_rows) if match]
+        if len(matches) < min(k, len(rows)):
+            return self._prefiltered_search(vectors, query, k, rows)
+        return matches[:k]
+
+    def get_row(self, row: int) -> Tuple[str, str, Dict[str, Any]]:
+        """
+        Return the id, text and metadata of a row.
+        """
+        offset = int(self._text_offsets[row])
+        length = int(self._text_lengths[row])
+        texts = self._texts
+        text = (
+            bytes(texts[offset : offset + length]).decode("utf-8")
+            if texts is not None and length
+            else ""
+        )
+        metadata = {field: self._columns[field][row] for field in METADATA_FIELDS}
+        return self._ids[row], text, metadata
+
+    def get_vector(self, row: int) -> np.ndarray:
+        """
+        Return the normalized embedding of a row.
+        """
+        assert self._vectors is not None
+        return np.asarray(self._vectors[row])
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Scale the rows of a matrix to unit length, leaving rows of zeros as they are.
+    """
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
@@ -0,0 +1,476 @@
+import asyncio
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+import aiohttp
+import requests
+from loguru import logger
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+from datastore.datastore import ChunkObserver, DataStore
+from datastore.lexical_index import LexicalIndex
+from datastore.result_cache import QueryResultCache, get_query_result_cache
+from models.models import (
+    Document,
+    DocumentChunk,
+    DocumentChunkWithScore,
+    DocumentMetadataFilter,
+    Query,
+    QueryResult,
+    QueryWithEmbedding,
+)
+from services.metrics import (
+    DATASTORE_OPERATION_ERRORS,
+    DATASTORE_OPERATION_SECONDS,
+    METRICS_PROVIDER,
+)
+
+# Read environment variables for the datastore middleware
+DATASTORE_MIDDLEWARE = os.environ.get(
+    "DATASTORE_MIDDLEWARE", "cache,metrics"
+)  # comma separated, outermost first
+DATASTORE_QUERY_TIMEOUT = float(os.environ.get("DATASTORE_QUERY_TIMEOUT", 30))
+DATASTORE_UPSERT_TIMEOUT = float(os.environ.get("DATASTORE_UPSERT_TIMEOUT", 0))
+DATASTORE_DELETE_TIMEOUT = float(os.environ.get("DATASTORE_DELETE_TIMEOUT", 60))
+DATASTORE_RETRY_ATTEMPTS = int(os.environ.get("DATASTORE_RETRY_ATTEMPTS", 3))
+HYBRID_CANDIDATES = int(os.environ.get("HYBRID_CANDIDATES", 20))
+HYBRID_RRF_K = int(os.environ.get("HYBRID_RRF_K", 60))
+
+T = TypeVar("T")
+
+
+class DataStoreMiddleware(DataStore):
+    """
+    A datastore that wraps another one and forwards every call to it.
+
+    Middleware subclasses override the public methods to add behavior around the wrapped
+    datastore. Since the public methods are forwarded, the wrapped datastore still chunks,
+    embeds and writes documents its own way, including providers that override upsert.
+    """
+
+    def __init__(self, inner: DataStore):
+        self.inner = inner
+
+    def __getattr__(self, name: str) -> Any:
+        # Expose the attributes of the wrapped datastore, e.g. the client of a provider
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def add_chunk_observer(self, observer: ChunkObserver) -> None:
+        # The chunks are written by the innermost datastore
+        self.inner.add_chunk_observer(observer)
+
+    async def upsert(
+        self, documents: List[Document], chunk_token_size: Optional[int] = None
+    ) -> List[str]:
+        return await self.inner.upsert(documents, chunk_token_size)
+
+    async def query(self, queries: List[Query]) -> List[QueryResult]:
+        return await self.inner.query(queries)
+
+    async def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        return await self.inner.delete(ids=ids, filter=filter, delete_all=delete_all)
+
+    async def delete_documents(self, document_ids: List[str]) -> bool:
+        return await self.inner.delete_documents(document_ids)
+
+    async def _upsert(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        return await self.inner._upsert(chunks)
+
+    async def _query(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
+        return await self.inner._query(queries)
+
+    async def _delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        return await self.inner._delete(ids=ids, filter=filter, delete_all=delete_all)
+
+
+class QueryResultCacheMiddleware(DataStoreMiddleware):
+    """
+    Answers repeated queries from a QueryResultCache, and invalidates it on every write.
+    """
+
+    def __init__(self, inner: DataStore, cache: QueryResultCache):
+        super().__init__(inner)
+        self.cache = cache
+
+    async def query(self, queries: List[Query]) -> List[QueryResult]:
+        # Results computed while the datastore is written to are not cached
+        generation = self.cache.generation
+        results = [self.cache.get(query) for query in queries]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            new_results = await self.inner.query([queries[i] for i in missing])
+            for i, result in zip(missing, new_results):
+                self.cache.set(queries[i], result, generation)
+                results[i] = result
+        return results  # type: ignore
+
+    async def _write(self, write: Awaitable[T]) -> T:
+        try:
+            return await write
+        finally:
+            # Even a failed write may have changed some documents
+            self.cache.invalidate()
+
+    async def upsert(
+        self, documents: List[Document], chunk_token_size: Optional[int] = None
+    ) -> List[str]:
+        return await self._write(self.inner.upsert(documents, chunk_token_size))
+
+    async def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        return await self._write(
+            self.inner.delete(ids=ids, filter=filter, delete_all=delete_all)
+        )
+
+    async def delete_documents(self, document_ids: List[str]) -> bool:
+        return await self._write(self.inner.delete_documents(document_ids))
+
+
+class MetricsMiddleware(DataStoreMiddleware):
+    """
+    Records the latency and the errors of each datastore operation in the Prometheus metrics.
+    """
+
+    def __init__(self, inner: DataStore, provider: str = METRICS_PROVIDER):
+        super().__init__(inner)
+        self.provider = provider
+
+    async def _measure(self, operation: str, call: Awaitable[T]) -> T:
+        try:
+            with DATASTORE_OPERATION_SECONDS.labels(operation, self.provider).time():
+                return await call
+        except Exception:
+            # Cancellations, by a client disconnect or a deadline, aren't errors of the datastore
+            DATASTORE_OPERATION_ERRORS.labels(operation, self.provider).inc()
+            raise
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Return the number of calls and errors, and the total latency in seconds, of each operation.
+        """
+        stats = {}
+        for operation in ["upsert", "query", "delete", "delete_documents"]:
+            latency = DATASTORE_OPERATION_SECONDS.labels(operation, self.provider)
+            errors = DATASTORE_OPERATION_ERRORS.labels(operation, self.provider)
+            stats[operation] = {
+                "calls": latency.count,
+                "errors": errors.value,
+                "seconds": latency.sum,
+            }
+        return stats
+
+    async def upsert(
+        self, documents: List[Document], chunk_token_size: Optional[int] = None
+    ) -> List[str]:
+        return await self._measure(
+            "upsert", self.inner.upsert(documents, chunk_token_size)
+        )
+
+    async def query(self, queries: List[Query]) -> List[QueryResult]:
+        return await self._measure("query", self.inner.query(queries))
+
+    async def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        return await self._measure(
+            "delete", self.inner.delete(ids=ids, filter=filter, delete_all=delete_all)
+        )
+
+    async def delete_documents(self, document_ids: List[str]) -> bool:
+        return await self._measure(
+            "delete_documents", self.inner.delete_documents(document_ids)
+        )
+
+
+class DeadlineMiddleware(DataStoreMiddleware):
+    """
+    Fails datastore operations that take longer than their timeout with asyncio.TimeoutError.
+    A timeout of 0 means no deadline for that operation.
+    """
+
+    def __init__(
+        self,
+        inner: DataStore,
+        query_timeout: float = DATASTORE_QUERY_TIMEOUT,
+        upsert_timeout: float = DATASTORE_UPSERT_TIMEOUT,
+        delete_timeout: float = DATASTORE_DELETE_TIMEOUT,
+    ):
+        super().__init__(inner)
+        self.query_timeout = query_timeout
+        self.upsert_timeout = upsert_timeout
+        self.delete_timeout = delete_timeout
+
+    @staticmethod
+    async def _with_timeout(call: Awaitable[T], timeout: float) -> T:
+        if timeout <= 0:
+            return await call
+        return await asyncio.wait_for(call, timeout)
+
+    async def upsert(
+        self, documents: List[Document], chunk_token_size: Optional[int] = None
+    ) -> List[str]:
+        return await self._with_timeout(
+            self.inner.upsert(documents, chunk_token_size), self.upsert_timeout
+        )
+
+    async def query(self, queries: List[Query]) -> List[QueryResult]:
+        return await self._with_timeout(self.inner.query(queries), self.query_timeout)
+
+    async def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        return await self._with_timeout(
+            self.inner.delete(ids=ids, filter=filter, delete_all=delete_all),
+            self.delete_timeout,
+        )
+
+    async def delete_documents(self, document_ids: List[str]) -> bool:
+        return await self._with_timeout(
+            self.inner.delete_documents(document_ids), self.delete_timeout
+        )
+
+
+# The network errors that a new attempt may not hit
+TRANSIENT_ERRORS = (
+    ConnectionError,
+    TimeoutError,
+    asyncio.TimeoutError,
+    aiohttp.ClientError,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout,
+)
+
+
+def _status_of(error: BaseException) -> Optional[int]:
+    # The HTTP status of the error of a provider client, under the names they use for it
+    for attribute in ["status", "status_code", "http_status"]:
+        status = getattr(error, attribute, None)
+        if isinstance(status, int):
+            return status
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Return whether a failed datastore call is worth another attempt: a network error, or a
+    provider response with status 429 or 5xx. Other errors, like invalid requests or bugs,
+    would fail again.
+    """
+    status = _status_of(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class RetryMiddleware(DataStoreMiddleware):
+    """
+    Retries datastore operations that failed with a transient error, see is_transient_error,
+    with exponential backoff. Other errors are raised after the first attempt.
+
+    Upserts are made idempotent by giving the documents without an id a new id once,
+    before the first attempt, so that every attempt deletes and rewrites the same
+    documents. Writes that timed out are not retried: the deadline only stops waiting
+    for them, and the first attempt may still be writing.
+    """
+
+    def __init__(self, inner: DataStore, attempts: int = DATASTORE_RETRY_ATTEMPTS):
+        super().__init__(inner)
+        self.attempts = max(1, attempts)
+
+    async def _retry(
+        self, call: Callable[[], Awaitable[T]], write: bool = False
+    ) -> T:
+        async for attempt in AsyncRetrying(
+            wait=wait_random_exponential(min=1, max=20),
+            stop=stop_after_attempt(self.attempts),
+            retry=(
+                retry_if_exception(is_transient_error)
+                & retry_if_not_exception_type(asyncio.TimeoutError)
+                if write
+                else retry_if_exception(is_transient_error)
+            ),
+            reraise=True,
+        ):
+            with attempt:
+                return await call()
+        raise AssertionError("unreachable")
+
+    async def upsert(
+        self, documents: List[Document], chunk_token_size: Optional[int] = None
+    ) -> List[str]:
+        # Every attempt must write the same ids, or each one would add the documents again
+        documents = [
+            doc if doc.id else doc.copy(update={"id": str(uuid.uuid4())})
+            for doc in documents
+        ]
+        return await self._retry(
+            lambda: self.inner.upsert(documents, chunk_token_size), write=True
+        )
+
+    async def query(self, queries: List[Query]) -> List[QueryResult]:
+        return await self._retry(lambda: self.inner.query(queries))
+
+    async def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        return await self._retry(
+            lambda: self.inner.delete(ids=ids, filter=filter, delete_all=delete_all),
+            write=True,
+        )
+
+    async def delete_documents(self, document_ids: List[str]) -> bool:
+        return await self._retry(
+            lambda: self.inner.delete_documents(document_ids), write=True
+        )
+
+
+def reciprocal_rank_fusion(
+    rankings: List[List[DocumentChunkWithScore]], top_k: int, k: int = HYBRID_RRF_K
+) -> List[DocumentChunkWithScore]:
+    """
+    Merge rankings of chunks with reciprocal rank fusion (Cormack et al., 2009).
+
+    Each chunk scores the sum of 1 / (k + rank) over the rankings it is in, so a chunk
+    ranked well by several rankings comes first, whatever the scale of their scores.
+
+    Args:
+        rankings: The rankings to merge, each one best first.
+        top_k: The number of chunks to return.
+        k: The constant that dampens the weight of the first ranks.
+
+    Returns:
+        The best chunks, with their fused score, best first.
+    """
+    scores: Dict[str, float] = {}
+    chunks: Dict[str, DocumentChunkWithScore] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, 1):
+            key = chunk.id or chunk.text
+            scores[key] = scores.get(key, 0.0) + 1 / (k + rank)
+            chunks.setdefault(key, chunk)
+    best = sorted(scores, key=lambda key: -scores[key])[:top_k]
+    return [chunks[key].copy(update={"score": scores[key]}) for key in best]
+
+
+class HybridSearchMiddleware(DataStoreMiddleware):
+    """
+    Adds a lexical signal to the results of any datastore: every query is also run against
+    a BM25 index of the chunks written through the datastore, and the two rankings are
+    merged with reciprocal rank fusion. The result scores are the fused scores.
+    """
+
+    def __init__(
+        self,
+        inner: DataStore,
+        index: LexicalIndex,
+        candidates: int = HYBRID_CANDIDATES,
+        rrf_k: int = HYBRID_RRF_K,
+    ):
+        super().__init__(inner)
+        self.index = index
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        inner.add_chunk_observer(index)
+
+    async def query(self, queries: List[Query]) -> List[QueryResult]:
+        # Fuse deeper rankings than the results, so that chunks ranked well by one side count
+        candidates = [
+            query.copy(update={"top_k": max(query.top_k or 0, self.candidates)})
+            for query in queries
+        ]
+        vector_results, lexical_results = await asyncio.gather(
+            self.inner.query(candidates),
+            asyncio.gather(
+                *[
+                    self.index.search(query.query, query.top_k, query.filter)
+                    for query in candidates
+                ]
+            ),
+        )
+        return [
+            QueryResult(
+                query=query.query,
+                results=reciprocal_rank_fusion(
+                    [vector_result.results, lexical_result],
+                    query.top_k or 0,
+                    self.rrf_k,
+                ),
+            )
+            for query, vector_result, lexical_result in zip(
+                queries, vector_results, lexical_results
+            )
+        ]
+
+
+def apply_middleware(
+    datastore: DataStore, middleware: str = DATASTORE_MIDDLEWARE
+) -> DataStore:
+    """
+    Wrap a datastore in a stack of middleware.
+
+    Args:
+        datastore: The datastore to wrap, usually a provider.
+        middleware: The comma separated names of the middleware to apply, outermost first.
+            The names are cache, metrics, deadline, retry and hybrid.
+
+    Returns:
+        The wrapped datastore, or the datastore itself if no middleware applies.
+    """
+    names = [name.strip() for name in middleware.split(",") if name.strip()]
+    # Wrap from the innermost middleware out
+    for name in reversed(names):
+        match name:
+            case "cache":
+                cache = get_query_result_cache()
+                if cache is not None:
+                    datastore = QueryResultCacheMiddleware(datastore, cache)
+            case "metrics":
+                datastore = MetricsMiddleware(datastore)
+            case "deadline":
+                datastore = DeadlineMiddleware(datastore)
+            case "retry":
+                datastore = RetryMiddleware(datastore)
+            case "hybrid":
+                datastore = HybridSearchMiddleware(datastore, LexicalIndex())
+            case _:
+                raise ValueError(
+                    f"Unsupported datastore middleware: {name}. "
+                    f"Try one of the following: cache, metrics, deadline, retry or hybrid"
+                )
+    if names:
+        logger.info(f"Using datastore middleware: {', '.join(names)}")
+    return datastore
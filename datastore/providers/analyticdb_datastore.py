@@ -13,6 +13,7 @@ from psycopg2.pool import SimpleConnectionPool
 
 from services.date import to_unix_timestamp
 from datastore.datastore import DataStore
+from datastore.executor import get_blocking_executor
 from models.models import (
     DocumentChunk,
     DocumentChunkMetadata,
@@ -53,6 +54,8 @@ class AnalyticDBDataStore(DataStore):
         )
 
         self._initialize_db()
+        # Run the blocking calls of the connection pool off the event loop
+        self._executor = get_blocking_executor("analyticdb")
 
     def _initialize_db(self):
         conn = self.connection_pool.getconn()
@@ -112,9 +115,8 @@ class AnalyticDBDataStore(DataStore):
         Takes in a dict of document_ids to list of document chunks and inserts them into the database.
         Return a list of document ids.
         """
-        loop = asyncio.get_event_loop()
         tasks = [
-            loop.run_in_executor(None, self._upsert_chunk, chunk)
+            self._executor.run(self._upsert_chunk, chunk)
             for document_chunks in chunks.values()
             for chunk in document_chunks
         ]
@@ -170,7 +172,6 @@ class AnalyticDBDataStore(DataStore):
         """
         Takes in a list of queries with embeddings and filters and returns a list of query results with matching document chunks and scores.
         """
-        query_results: List[QueryResult] = []
 
         def generate_query(query: QueryWithEmbedding) -> Tuple[str, List[Any]]:
             embedding = "[" + ", ".join(str(x) for x in query.embedding) + "]"
@@ -217,9 +218,14 @@ class AnalyticDBDataStore(DataStore):
 
             return where_clause, values
 
-        def fetch_data(cur, q: str, params: List[Any]):
-            cur.execute(q, params)
-            return cur.fetchall()
+        def fetch_data(q: str, params: List[Any]):
+            conn = self.connection_pool.getconn()
+            try:
+                with conn.cursor(cursor_factory=DictCursor) as cur:
+                    cur.execute(q, params)
+                    return cur.fetchall()
+            finally:
+                self.connection_pool.putconn(conn)
 
         def create_results(data):
             results = []
@@ -240,32 +246,31 @@ class AnalyticDBDataStore(DataStore):
                 results.append(document_chunk)
             return results
 
-        conn = self.connection_pool.getconn()
-        try:
-            for query in queries:
-                try:
-                    cur = conn.cursor(cursor_factory=DictCursor)
-                    for query in queries:
-                        q, params = generate_query(query)
-                        data = fetch_data(cur, q, params)
-                        results = create_results(data)
-                        query_results.append(
-                            QueryResult(query=query.query, results=results)
-                        )
-                except Exception as e:
-                    logger.error(e)
-                    query_results.append(QueryResult(query=query.query, results=[]))
-            return query_results
-        finally:
-            self.connection_pool.putconn(conn)
+        async def single_query(query: QueryWithEmbedding) -> QueryResult:
+            try:
+                q, params = generate_query(query)
+                data = await self._executor.run(fetch_data, q, params)
+                return QueryResult(query=query.query, results=create_results(data))
+            except Exception as e:
+                logger.error(e)
+                return QueryResult(query=query.query, results=[])
+
+        # Each query runs on its own connection of the pool
+        return await asyncio.gather(*[single_query(query) for query in queries])
 
-    async def delete(
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the vectors of the given documents with a single delete.
+        """
+        return await self._delete(ids=document_ids)
+
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
         delete_all: Optional[bool] = None,
     ) -> bool:
-        async def execute_delete(query: str, params: Optional[List] = None) -> bool:
+        def run_delete(query: str, params: Optional[List] = None) -> None:
             conn = self.connection_pool.getconn()
             try:
                 with conn.cursor() as cur:
@@ -273,13 +278,17 @@ class AnalyticDBDataStore(DataStore):
                         cur.execute(query, params)
                     else:
                         cur.execute(query)
-                    self.conn.commit()
+                    conn.commit()
+            finally:
+                self.connection_pool.putconn(conn)
+
+        async def execute_delete(query: str, params: Optional[List] = None) -> bool:
+            try:
+                await self._executor.run(run_delete, query, params)
                 return True
             except Exception as e:
                 logger.error(e)
                 return False
-            finally:
-                self.connection_pool.putconn(conn)
 
         if delete_all:
             query = f"DELETE FROM {self.collection_name} WHERE document_id LIKE %s;"
@@ -94,32 +94,49 @@ class AzureSearchDataStore(DataStore):
 
         return ids
 
-    async def delete(self, ids: Optional[List[str]] = None, filter: Optional[DocumentMetadataFilter] = None, delete_all: Optional[bool] = None) -> bool:
+    async def _delete(self, ids: Optional[List[str]] = None, filter: Optional[DocumentMetadataFilter] = None, delete_all: Optional[bool] = None) -> bool:
         filter = None if delete_all else self._translate_filter(filter)
         if delete_all or filter is not None:
-            deleted = set()
-            while True:
-                search_result = await self.client.search(None, filter=filter, top=MAX_DELETE_BATCH_SIZE, include_total_count=True, select=FIELDS_ID)
-                if await search_result.get_count() == 0:
-                    break
-                documents = [{ FIELDS_ID: d[FIELDS_ID] } async for d in search_result if d[FIELDS_ID] not in deleted]
-                if len(documents) > 0:
-                    logger.info(f"Deleting {len(documents)} chunks " + ("using a filter" if filter is not None else "using delete_all"))
-                    del_result = await self.client.delete_documents(documents=documents)
-                    if not all([rr.succeeded for rr in del_result]):
-                        raise Exception("Failed to delete documents")
-                    deleted.update([d[FIELDS_ID] for d in documents])
-                else:
-                    # All repeats, delay a bit to let the index refresh and try again
-                    time.sleep(0.25)
+            await self._delete_by_filter(filter)
         
         if ids is not None and len(ids) > 0:
-            for id in ids:
-                logger.info(f"Deleting chunks for document id {id}")
-                await self.delete(filter=DocumentMetadataFilter(document_id=id))
+            await self._delete_documents(ids)
 
         return True
 
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        # search.in takes the ids as a single delimited string, so pick a delimiter that none of them contain
+        delimiter = next((d for d in ",|;" if not any(d in id for id in document_ids)), None)
+        if delimiter is None:
+            return await super()._delete_documents(document_ids)
+
+        escape = lambda s: s.replace("'", "''")
+        for i in range(0, len(document_ids), MAX_DELETE_BATCH_SIZE):
+            batch = document_ids[i:i + MAX_DELETE_BATCH_SIZE]
+            logger.info(f"Deleting chunks for {len(batch)} document ids")
+            await self._delete_by_filter(f"search.in({FIELDS_DOCUMENT_ID}, '{escape(delimiter.join(batch))}', '{delimiter}')")
+        return True
+
+    async def _delete_by_filter(self, filter: Optional[str]):
+        """
+        Deletes the chunks matching an Azure Search filter string, or every chunk if the filter is None
+        """
+        deleted = set()
+        while True:
+            search_result = await self.client.search(None, filter=filter, top=MAX_DELETE_BATCH_SIZE, include_total_count=True, select=FIELDS_ID)
+            if await search_result.get_count() == 0:
+                break
+            documents = [{ FIELDS_ID: d[FIELDS_ID] } async for d in search_result if d[FIELDS_ID] not in deleted]
+            if len(documents) > 0:
+                logger.info(f"Deleting {len(documents)} chunks " + ("using a filter" if filter is not None else "using delete_all"))
+                del_result = await self.client.delete_documents(documents=documents)
+                if not all([rr.succeeded for rr in del_result]):
+                    raise Exception("Failed to delete documents")
+                deleted.update([d[FIELDS_ID] for d in documents])
+            else:
+                # All repeats, delay a bit to let the index refresh and try again
+                time.sleep(0.25)
+
     async def _query(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
         """
         Takes in a list of queries with embeddings and filters and returns a list of query results with matching document chunks and scores.
@@ -7,6 +7,7 @@ Consult the Chroma docs and GitHub repo for more information:
 - https://www.trychroma.com/
 """
 
+import asyncio
 import os
 from datetime import datetime
 from typing import Dict, List, Optional
@@ -14,6 +15,7 @@ from typing import Dict, List, Optional
 import chromadb
 
 from datastore.datastore import DataStore
+from datastore.executor import get_blocking_executor
 from models.models import (
     Document,
     DocumentChunk,
@@ -69,6 +71,8 @@ class ChromaDataStore(DataStore):
             name=collection_name,
             embedding_function=None,
         )
+        # Run the blocking calls of the Chroma client off the event loop
+        self._executor = get_blocking_executor("chroma")
 
     async def upsert(
         self, documents: List[Document], chunk_token_size: Optional[int] = None
@@ -78,10 +82,10 @@ class ChromaDataStore(DataStore):
         Return a list of document ids.
         """
 
-        chunks = get_document_chunks(documents, chunk_token_size)
+        chunks = await get_document_chunks(documents, chunk_token_size)
 
         # Chroma has a true upsert, so we don't need to delete first
-        return await self._upsert(chunks)
+        return await self._write_chunks(chunks)
 
     async def _upsert(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
         """
@@ -89,7 +93,8 @@ class ChromaDataStore(DataStore):
         Return a list of document ids.
         """
 
-        self._collection.upsert(
+        await self._executor.run(
+            self._collection.upsert,
             ids=[chunk.id for chunk_list in chunks.values() for chunk in chunk_list],
             embeddings=[
                 chunk.embedding
@@ -178,38 +183,34 @@ class ChromaDataStore(DataStore):
         """
         Takes in a list of queries with embeddings and filters and returns a list of query results with matching document chunks and scores.
         """
-        results = [
-            self._collection.query(
-                query_embeddings=[query.embedding],
-                include=["documents", "distances", "metadatas"],  # embeddings
-                n_results=min(query.top_k, self._collection.count()),  # type: ignore
-                where=(
-                    self._where_from_query_filter(query.filter) if query.filter else {}
-                ),
-            )
-            for query in queries
-        ]
+        results = await asyncio.gather(
+            *[
+                self._executor.run(self._query_collection, query)
+                for query in queries
+            ]
+        )
 
         output = []
         for query, result in zip(queries, results):
             inner_results = []
             (ids,) = result["ids"]
-            # (embeddings,) = result["embeddings"]
+            (embeddings,) = result.get("embeddings") or [[None] * len(ids)]
             (documents,) = result["documents"]
             (metadatas,) = result["metadatas"]
             (distances,) = result["distances"]
-            for id_, text, metadata, distance in zip(
+            for id_, text, metadata, distance, embedding in zip(
                 ids,
                 documents,
                 metadatas,
-                distances,  # embeddings (https://github.com/openai/chatgpt-retrieval-plugin/pull/59#discussion_r1154985153)
+                distances,
+                embeddings,
             ):
                 inner_results.append(
                     DocumentChunkWithScore(
                         id=id_,
                         text=text,
                         metadata=self._process_metadata_from_storage(metadata),
-                        # embedding=embedding,
+                        embedding=list(embedding) if embedding is not None else None,
                         score=distance,
                     )
                 )
@@ -217,7 +218,23 @@ class ChromaDataStore(DataStore):
 
         return output
 
-    async def delete(
+    def _query_collection(self, query: QueryWithEmbedding) -> Dict:
+        return self._collection.query(
+            query_embeddings=[query.embedding],
+            # Embeddings are only returned when asked for (https://github.com/openai/chatgpt-retrieval-plugin/pull/59#discussion_r1154985153)
+            include=["documents", "distances", "metadatas"]
+            + (["embeddings"] if query.include_embeddings else []),
+            n_results=min(query.top_k, self._collection.count()),  # type: ignore
+            where=(self._where_from_query_filter(query.filter) if query.filter else {}),
+        )
+
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the vectors of the given documents with a single delete.
+        """
+        return await self._delete(ids=document_ids)
+
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -229,7 +246,7 @@ class ChromaDataStore(DataStore):
         Returns whether the operation was successful.
         """
         if delete_all:
-            self._collection.delete()
+            await self._executor.run(self._collection.delete)
             return True
 
         if ids and len(ids) > 0:
@@ -246,5 +263,5 @@ class ChromaDataStore(DataStore):
         elif filter:
             where_clause = self._where_from_query_filter(filter)
 
-        self._collection.delete(where=where_clause)
+        await self._executor.run(self._collection.delete, where=where_clause)
         return True
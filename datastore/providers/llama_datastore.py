@@ -151,7 +151,7 @@ class LlamaDataStore(DataStore):
         
         return query_result_all
 
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
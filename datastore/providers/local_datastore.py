@@ -0,0 +1,158 @@
+import os
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+
+from datastore.datastore import DataStore
+from datastore.executor import get_blocking_executor
+from datastore.local.index import create_vector_index
+from datastore.local.sharded import ShardedVectorStore
+from datastore.local.vector_store import LocalVectorStore, Match
+from models.models import (
+    DocumentChunk,
+    DocumentChunkMetadata,
+    DocumentChunkWithScore,
+    DocumentMetadataFilter,
+    QueryResult,
+    QueryWithEmbedding,
+)
+from services.date import to_unix_timestamp
+
+# Read environment variables for the local datastore
+LOCAL_DATASTORE_PATH = os.environ.get("LOCAL_DATASTORE_PATH", "local_datastore")
+LOCAL_DATASTORE_SHARDS = int(
+    os.environ.get("LOCAL_DATASTORE_SHARDS", 1)
+)  # the number of worker processes the vectors are split across, 1 keeps them in process
+
+
+class LocalDataStore(DataStore):
+    """
+    A datastore that keeps the vectors in process, in a memory-mapped matrix on the local
+    disk, and answers queries with an exact search, or with the approximate index selected
+    by LOCAL_DATASTORE_INDEX. Suited to corpora of up to a few million chunks served by a
+    single API instance. With LOCAL_DATASTORE_SHARDS above 1, the documents are split
+    across as many worker processes, which search in parallel.
+    """
+
+    def __init__(self, path: str = LOCAL_DATASTORE_PATH, shards: int = LOCAL_DATASTORE_SHARDS):
+        self.store: Union[LocalVectorStore, ShardedVectorStore] = (
+            ShardedVectorStore(path, shards)
+            if shards > 1
+            else LocalVectorStore(path, index=create_vector_index())
+        )
+        # Search and write off the event loop, NumPy releases the GIL while it computes
+        self._executor = get_blocking_executor("local")
+
+    async def _upsert(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        """
+        Takes in a dict from document id to list of document chunks and appends them to the store.
+        Return a list of document ids.
+        """
+        all_chunks = [chunk for chunk_list in chunks.values() for chunk in chunk_list]
+        if all_chunks:
+            await self._executor.run(
+                self.store.add,
+                [chunk.id for chunk in all_chunks],
+                np.array([chunk.embedding for chunk in all_chunks], dtype=np.float32),
+                [chunk.text for chunk in all_chunks],
+                [self._get_row_metadata(chunk.metadata) for chunk in all_chunks],
+            )
+        return list(chunks.keys())
+
+    async def _query(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
+        """
+        Takes in a list of queries with embeddings and filters and returns a list of query results with matching document chunks and scores.
+        """
+        return await self._executor.run(self._search, queries)
+
+    def _search(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
+        # The unfiltered queries of the request are answered by the same pass over the vectors
+        matches = self.store.query(
+            np.array([query.embedding for query in queries], dtype=np.float32),
+            [query.top_k or 0 for query in queries],
+            [self._get_filter(query.filter) for query in queries],
+            [query.include_embeddings for query in queries],
+        )
+        return [
+            QueryResult(
+                query=query.query,
+                results=[self._get_chunk(match) for match in query_matches],
+            )
+            for query, query_matches in zip(queries, matches)
+        ]
+
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the vectors of the given documents at once.
+        """
+        await self._executor.run(self.store.delete_documents, document_ids)
+        return True
+
+    async def _delete_chunks(self, chunk_ids: Dict[str, List[str]]) -> bool:
+        """
+        Removes single chunks by id.
+        """
+        await self._executor.run(
+            self.store.delete_ids,
+            [chunk_id for doc_chunk_ids in chunk_ids.values() for chunk_id in doc_chunk_ids],
+        )
+        return True
+
+    async def _delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        """
+        Removes vectors by ids, filter, or everything in the datastore.
+        Returns whether the operation was successful.
+        """
+        if delete_all:
+            await self._executor.run(self.store.clear)
+            return True
+        if ids:
+            await self._executor.run(self.store.delete_documents, ids)
+        if filter:
+            store_filter = self._get_filter(filter)
+            if store_filter:
+                await self._executor.run(self.store.delete_matching, store_filter)
+        return True
+
+    def close(self) -> None:
+        """
+        Stop the snapshots and the shard workers of the store, and close its files.
+        """
+        self.store.close()
+
+    def _get_filter(
+        self, filter: Optional[DocumentMetadataFilter]
+    ) -> Optional[Dict[str, Any]]:
+        # The arguments of filter_rows, which the store of a shard takes as they are
+        if filter is None:
+            return None
+        return {
+            "document_id": filter.document_id,
+            "source": filter.source.value if filter.source else None,
+            "source_id": filter.source_id,
+            "author": filter.author,
+            "start_ts": to_unix_timestamp(filter.start_date) if filter.start_date else None,
+            "end_ts": to_unix_timestamp(filter.end_date) if filter.end_date else None,
+        }
+
+    def _get_row_metadata(self, metadata: DocumentChunkMetadata) -> Dict[str, Any]:
+        row = metadata.dict()
+        row["source"] = metadata.source.value if metadata.source else None
+        row["created_at_ts"] = (
+            to_unix_timestamp(metadata.created_at) if metadata.created_at else None
+        )
+        return row
+
+    def _get_chunk(self, match: Match) -> DocumentChunkWithScore:
+        return DocumentChunkWithScore(
+            id=match.id,
+            text=match.text,
+            metadata=DocumentChunkMetadata(**match.metadata),
+            embedding=match.vector,
+            score=match.score,
+        )
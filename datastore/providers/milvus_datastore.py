@@ -18,6 +18,7 @@ from uuid import uuid4
 
 from services.date import to_unix_timestamp
 from datastore.datastore import DataStore
+from datastore.executor import get_blocking_executor
 from models.models import (
     DocumentChunk,
     DocumentChunkMetadata,
@@ -120,6 +121,8 @@ class MilvusDataStore(DataStore):
         """
         # Overwrite the default consistency level by MILVUS_CONSISTENCY_LEVEL
         self._consistency_level = MILVUS_CONSISTENCY_LEVEL or consistency_level
+        # Run the blocking calls of the Milvus client off the event loop
+        self._executor = get_blocking_executor("milvus")
         self._create_connection()
 
         self._create_collection(MILVUS_COLLECTION, create_new)  # type: ignore
@@ -313,7 +316,7 @@ class MilvusDataStore(DataStore):
                 if len(batch[0]) != 0:
                     try:
                         logger.info(f"Upserting batch of size {len(batch[0])}")
-                        self.col.insert(batch)
+                        await self._executor.run(self.col.insert, batch)
                         logger.info(f"Upserted batch successfully")
                     except Exception as e:
                         logger.error(f"Failed to insert batch records, error: {e}")
@@ -389,7 +392,8 @@ class MilvusDataStore(DataStore):
 
                 # Perform our search
                 return_from = 2 if self._schema_ver == "V1" else 1
-                res = self.col.search(
+                res = await self._executor.run(
+                    self.col.search,
                     data=[query.embedding],
                     anns_field=EMBEDDING_FIELD,
                     param=self.search_params,
@@ -437,7 +441,13 @@ class MilvusDataStore(DataStore):
         )
         return results
 
-    async def delete(
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the vectors of the given documents with a single delete.
+        """
+        return await self._delete(ids=document_ids)
+
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -452,15 +462,7 @@ class MilvusDataStore(DataStore):
         """
         # If deleting all, drop and create the new collection
         if delete_all:
-            coll_name = self.col.name
-            logger.info("Delete the entire collection {} and create new one".format(coll_name))
-            # Release the collection from memory
-            self.col.release()
-            # Drop the collection
-            self.col.drop()
-            # Recreate the new collection
-            self._create_collection(coll_name, True)
-            self._create_index()
+            await self._executor.run(self._recreate_collection)
             return True
 
         # Keep track of how many we have deleted for later printing
@@ -475,7 +477,9 @@ class MilvusDataStore(DataStore):
                 # Add quotation marks around the string format id
                 ids = ['"' + str(id) + '"' for id in ids]
                 # Query for the pk's of entries that match id's
-                ids = self.col.query(f"document_id in [{','.join(ids)}]")
+                ids = await self._executor.run(
+                    self.col.query, f"document_id in [{','.join(ids)}]"
+                )
                 # Convert to list of pks
                 pks = [str(entry[pk_name]) for entry in ids]  # type: ignore
                 # for schema V2, the "id" is varchar, rewrite the expression
@@ -488,7 +492,9 @@ class MilvusDataStore(DataStore):
                     batch_pks = pks[:batch_size]
                     pks = pks[batch_size:]
                     # Delete the entries batch by batch
-                    res = self.col.delete(f"{pk_name} in [{','.join(batch_pks)}]")
+                    res = await self._executor.run(
+                        self.col.delete, f"{pk_name} in [{','.join(batch_pks)}]"
+                    )
                     # Increment our deleted count
                     delete_count += int(res.delete_count)  # type: ignore
         except Exception as e:
@@ -502,7 +508,7 @@ class MilvusDataStore(DataStore):
                 # Check if there is anything to filter
                 if len(filter) != 0:  # type: ignore
                     # Query for the pk's of entries that match filter
-                    res = self.col.query(filter)  # type: ignore
+                    res = await self._executor.run(self.col.query, filter)  # type: ignore
                     # Convert to list of pks
                     pks = [str(entry[pk_name]) for entry in res]  # type: ignore
                     # for schema V2, the "id" is varchar, rewrite the expression
@@ -513,7 +519,9 @@ class MilvusDataStore(DataStore):
                         batch_pks = pks[:batch_size]
                         pks = pks[batch_size:]
                         # Delete the entries batch by batch
-                        res = self.col.delete(f"{pk_name} in [{','.join(batch_pks)}]")  # type: ignore
+                        res = await self._executor.run(
+                            self.col.delete, f"{pk_name} in [{','.join(batch_pks)}]"
+                        )  # type: ignore
                         # Increment our delete count
                         delete_count += int(res.delete_count)  # type: ignore
         except Exception as e:
@@ -526,6 +534,18 @@ class MilvusDataStore(DataStore):
 
         return True
 
+    def _recreate_collection(self):
+        """Drop the collection and create a new empty one with the same name."""
+        coll_name = self.col.name
+        logger.info("Delete the entire collection {} and create new one".format(coll_name))
+        # Release the collection from memory
+        self.col.release()
+        # Drop the collection
+        self.col.drop()
+        # Recreate the new collection
+        self._create_collection(coll_name, True)
+        self._create_index()
+
     def _get_filter(self, filter: DocumentMetadataFilter) -> Optional[str]:
         """Converts a DocumentMetdataFilter to the expression that Milvus takes.
 
@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 from typing import Any, Dict, List, Optional
 from datetime import datetime
@@ -75,6 +76,7 @@ class PgVectorDataStore(DataStore):
         Takes in a dict of document_ids to list of document chunks and inserts them into the database.
         Return a list of document ids.
         """
+        rows = []
         for document_id, document_chunks in chunks.items():
             for chunk in document_chunks:
                 json = {
@@ -93,7 +95,9 @@ class PgVectorDataStore(DataStore):
                             to_unix_timestamp(chunk.metadata.created_at)
                         ),
                     )
-                await self.client.upsert("documents", json)
+                rows.append(json)
+        # The client limits how many of the rows are written at once
+        await asyncio.gather(*[self.client.upsert("documents", json) for json in rows])
 
         return list(chunks.keys())
 
@@ -101,8 +105,8 @@ class PgVectorDataStore(DataStore):
         """
         Takes in a list of queries with embeddings and filters and returns a list of query results with matching document chunks and scores.
         """
-        query_results: List[QueryResult] = []
-        for query in queries:
+
+        async def _single_query(query: QueryWithEmbedding) -> QueryResult:
             # get the top 3 documents with the highest cosine similarity using rpc function in the database called "match_page_sections"
             params = {
                 "in_embedding": query.embedding,
@@ -146,13 +150,20 @@ class PgVectorDataStore(DataStore):
                         ),
                     )
                     results.append(document_chunk)
-                query_results.append(QueryResult(query=query.query, results=results))
+                return QueryResult(query=query.query, results=results)
             except Exception as e:
                 logger.error(e)
-                query_results.append(QueryResult(query=query.query, results=[]))
-        return query_results
+                return QueryResult(query=query.query, results=[])
+
+        return await asyncio.gather(*[_single_query(query) for query in queries])
+
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the vectors of the given documents with a single delete.
+        """
+        return await self._delete(ids=document_ids)
 
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -179,3 +190,22 @@ class PgVectorDataStore(DataStore):
             except:
                 return False
         return True
+
+    async def _delete_chunks(self, chunk_ids: Dict[str, List[str]]) -> bool:
+        """
+        Removes single chunks by id from the documents table.
+        Returns whether the operation was successful.
+        """
+        try:
+            await self.client.delete_in(
+                "documents",
+                "id",
+                [
+                    chunk_id
+                    for doc_chunk_ids in chunk_ids.values()
+                    for chunk_id in doc_chunk_ids
+                ],
+            )
+        except:
+            return False
+        return True
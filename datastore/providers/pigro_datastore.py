@@ -60,21 +60,12 @@ class PigroDataStore(DataStore):
         Return a list of chunks ids.
         """
         # Delete any existing vectors for documents with the input document ids
-        await asyncio.gather(
-            *[
-                self.delete(
-                    filter=DocumentMetadataFilter(
-                        document_id=document.id,
-                    ),
-                    delete_all=False,
-                )
-                for document in documents
-                if document.id
-            ]
+        await self.delete_documents(
+            [document.id for document in documents if document.id]
         )
 
         chunks = get_pigro_document_chunks(documents)
-        return await self._upsert(chunks)
+        return await self._write_chunks(chunks)
 
     async def _upsert(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
         """
@@ -144,7 +135,7 @@ class PigroDataStore(DataStore):
                 query=query.query, results=query_results))
         return results
 
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -176,6 +167,15 @@ class PigroDataStore(DataStore):
             }
             return await self._post_pigro_api(data, "delete")
 
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes the chunks of all the given documents with a single call to Pigro's Api.
+        """
+        data = {
+            "has_doc_id": document_ids
+        }
+        return await self._post_pigro_api(data, "delete_with_filter")
+
     async def _post_pigro_api(self, data, method):
         headers = {
             "x-api-key": PIGRO_KEY,
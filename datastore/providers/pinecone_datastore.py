@@ -6,6 +6,7 @@ import asyncio
 from loguru import logger
 
 from datastore.datastore import DataStore
+from datastore.executor import get_blocking_executor
 from models.models import (
     DocumentChunk,
     DocumentChunkMetadata,
@@ -34,6 +35,9 @@ UPSERT_BATCH_SIZE = 100
 
 class PineconeDataStore(DataStore):
     def __init__(self):
+        # Run the blocking calls of the Pinecone client off the event loop
+        self._executor = get_blocking_executor("pinecone")
+
         # Check if the index name is specified and exists in Pinecone
         if PINECONE_INDEX and PINECONE_INDEX not in pinecone.list_indexes():
 
@@ -95,16 +99,18 @@ class PineconeDataStore(DataStore):
             vectors[i : i + UPSERT_BATCH_SIZE]
             for i in range(0, len(vectors), UPSERT_BATCH_SIZE)
         ]
-        # Upsert each batch to Pinecone
-        for batch in batches:
+        # Upsert the batches to Pinecone concurrently
+        async def _upsert_batch(batch: List[Any]) -> None:
             try:
                 logger.info(f"Upserting batch of size {len(batch)}")
-                self.index.upsert(vectors=batch)
+                await self._executor.run(self.index.upsert, vectors=batch)
                 logger.info(f"Upserted batch successfully")
             except Exception as e:
                 logger.error(f"Error upserting batch: {e}")
                 raise e
 
+        await asyncio.gather(*[_upsert_batch(batch) for batch in batches])
+
         return doc_ids
 
     @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
@@ -125,12 +131,14 @@ class PineconeDataStore(DataStore):
 
             try:
                 # Query the index with the query embedding, filter, and top_k
-                query_response = self.index.query(
+                query_response = await self._executor.run(
+                    self.index.query,
                     # namespace=namespace,
                     top_k=query.top_k,
                     vector=query.embedding,
                     filter=pinecone_filter,
                     include_metadata=True,
+                    include_values=query.include_embeddings,
                 )
             except Exception as e:
                 logger.error(f"Error querying index: {e}")
@@ -161,6 +169,7 @@ class PineconeDataStore(DataStore):
                     score=score,
                     text=metadata["text"] if metadata and "text" in metadata else None,
                     metadata=metadata_without_text,
+                    embedding=result.values or None,
                 )
                 query_results.append(result)
             return QueryResult(query=query.query, results=query_results)
@@ -172,8 +181,14 @@ class PineconeDataStore(DataStore):
 
         return results
 
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the vectors of the given documents with a single delete.
+        """
+        return await self._delete(ids=document_ids)
+
     @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
-    async def delete(
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -186,7 +201,7 @@ class PineconeDataStore(DataStore):
         if delete_all:
             try:
                 logger.info(f"Deleting all vectors from index")
-                self.index.delete(delete_all=True)
+                await self._executor.run(self.index.delete, delete_all=True)
                 logger.info(f"Deleted all vectors successfully")
                 return True
             except Exception as e:
@@ -199,7 +214,7 @@ class PineconeDataStore(DataStore):
         if pinecone_filter != {}:
             try:
                 logger.info(f"Deleting vectors with filter {pinecone_filter}")
-                self.index.delete(filter=pinecone_filter)
+                await self._executor.run(self.index.delete, filter=pinecone_filter)
                 logger.info(f"Deleted vectors with filter successfully")
             except Exception as e:
                 logger.error(f"Error deleting vectors with filter: {e}")
@@ -210,7 +225,7 @@ class PineconeDataStore(DataStore):
             try:
                 logger.info(f"Deleting vectors with ids {ids}")
                 pinecone_filter = {"document_id": {"$in": ids}}
-                self.index.delete(filter=pinecone_filter)  # type: ignore
+                await self._executor.run(self.index.delete, filter=pinecone_filter)  # type: ignore
                 logger.info(f"Deleted vectors with ids successfully")
             except Exception as e:
                 logger.error(f"Error deleting vectors with ids: {e}")
@@ -218,6 +233,23 @@ class PineconeDataStore(DataStore):
 
         return True
 
+    @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
+    async def _delete_chunks(self, chunk_ids: Dict[str, List[str]]) -> bool:
+        """
+        Removes single chunks by id from the index.
+        """
+        ids = [chunk_id for doc_chunk_ids in chunk_ids.values() for chunk_id in doc_chunk_ids]
+        for i in range(0, len(ids), UPSERT_BATCH_SIZE):
+            batch = ids[i : i + UPSERT_BATCH_SIZE]
+            try:
+                logger.info(f"Deleting {len(batch)} chunks")
+                await self._executor.run(self.index.delete, ids=batch)
+            except Exception as e:
+                logger.error(f"Error deleting chunks: {e}")
+                raise e
+
+        return True
+
     def _get_pinecone_filter(
         self, filter: Optional[DocumentMetadataFilter] = None
     ) -> Dict[str, Any]:
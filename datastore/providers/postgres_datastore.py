@@ -1,5 +1,5 @@
 import os
-from typing import Any, List
+from typing import Any, List, Optional
 from datetime import datetime
 import numpy as np
 
@@ -8,6 +8,7 @@ from psycopg2.extras import DictCursor
 from pgvector.psycopg2 import register_vector
 
 from services.date import to_unix_timestamp
+from datastore.executor import get_blocking_executor
 from datastore.providers.pgvector_datastore import PGClient, PgVectorDataStore
 from models.models import (
     DocumentMetadataFilter,
@@ -33,6 +34,9 @@ class PostgresClient(PGClient):
             dbname=PG_DB, user=PG_USER, password=PG_PASSWORD, host=PG_HOST, port=PG_PORT
         )
         register_vector(self.client)
+        # Run the blocking calls of the connection off the event loop, one at a time
+        # since they share its transaction
+        self._executor = get_blocking_executor("postgres")
 
     def __del__(self):
         # close the connection when the client is destroyed
@@ -42,33 +46,32 @@ class PostgresClient(PGClient):
         """
         Takes in a list of documents and inserts them into the table.
         """
-        with self.client.cursor() as cur:
-            if not json.get("created_at"):
-                json["created_at"] = datetime.now()
-            json["embedding"] = np.array(json["embedding"])
-            cur.execute(
-                f"INSERT INTO {table} (id, content, embedding, document_id, source, source_id, url, author, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT (id) DO UPDATE SET content = %s, embedding = %s, document_id = %s, source = %s, source_id = %s, url = %s, author = %s, created_at = %s",
-                (
-                    json["id"],
-                    json["content"],
-                    json["embedding"],
-                    json["document_id"],
-                    json["source"],
-                    json["source_id"],
-                    json["url"],
-                    json["author"],
-                    json["created_at"],
-                    json["content"],
-                    json["embedding"],
-                    json["document_id"],
-                    json["source"],
-                    json["source_id"],
-                    json["url"],
-                    json["author"],
-                    json["created_at"],
-                ),
-            )
-            self.client.commit()
+        if not json.get("created_at"):
+            json["created_at"] = datetime.now()
+        json["embedding"] = np.array(json["embedding"])
+        await self._executor.run(
+            self._execute,
+            f"INSERT INTO {table} (id, content, embedding, document_id, source, source_id, url, author, created_at) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) ON CONFLICT (id) DO UPDATE SET content = %s, embedding = %s, document_id = %s, source = %s, source_id = %s, url = %s, author = %s, created_at = %s",
+            (
+                json["id"],
+                json["content"],
+                json["embedding"],
+                json["document_id"],
+                json["source"],
+                json["source_id"],
+                json["url"],
+                json["author"],
+                json["created_at"],
+                json["content"],
+                json["embedding"],
+                json["document_id"],
+                json["source"],
+                json["source_id"],
+                json["url"],
+                json["author"],
+                json["created_at"],
+            ),
+        )
 
     async def rpc(self, function_name: str, params: dict[str, Any]):
         """
@@ -76,36 +79,31 @@ class PostgresClient(PGClient):
         """
         data = []
         params["in_embedding"] = np.array(params["in_embedding"])
-        with self.client.cursor(cursor_factory=DictCursor) as cur:
-            cur.callproc(function_name, params)
-            rows = cur.fetchall()
-            self.client.commit()
-            for row in rows:
-                row["created_at"] = to_unix_timestamp(row["created_at"])
-                data.append(dict(row))
+        rows = await self._executor.run(self._callproc, function_name, params)
+        for row in rows:
+            row["created_at"] = to_unix_timestamp(row["created_at"])
+            data.append(dict(row))
         return data
 
     async def delete_like(self, table: str, column: str, pattern: str):
         """
         Deletes rows in the table that match the pattern.
         """
-        with self.client.cursor() as cur:
-            cur.execute(
-                f"DELETE FROM {table} WHERE {column} LIKE %s",
-                (f"%{pattern}%",),
-            )
-            self.client.commit()
+        await self._executor.run(
+            self._execute,
+            f"DELETE FROM {table} WHERE {column} LIKE %s",
+            (f"%{pattern}%",),
+        )
 
     async def delete_in(self, table: str, column: str, ids: List[str]):
         """
         Deletes rows in the table that match the ids.
         """
-        with self.client.cursor() as cur:
-            cur.execute(
-                f"DELETE FROM {table} WHERE {column} IN %s",
-                (tuple(ids),),
-            )
-            self.client.commit()
+        await self._executor.run(
+            self._execute,
+            f"DELETE FROM {table} WHERE {column} IN %s",
+            (tuple(ids),),
+        )
 
     async def delete_by_filters(self, table: str, filter: DocumentMetadataFilter):
         """
@@ -127,6 +125,16 @@ class PostgresClient(PGClient):
             filters += f" created_at <= '{filter.end_date}' AND"
         filters = filters[:-4]
 
+        await self._executor.run(self._execute, f"DELETE FROM {table} {filters}")
+
+    def _execute(self, query: str, params: Optional[tuple] = None) -> None:
         with self.client.cursor() as cur:
-            cur.execute(f"DELETE FROM {table} {filters}")
+            cur.execute(query, params)
+            self.client.commit()
+
+    def _callproc(self, function_name: str, params: dict[str, Any]) -> List[Any]:
+        with self.client.cursor(cursor_factory=DictCursor) as cur:
+            cur.callproc(function_name, params)
+            rows = cur.fetchall()
             self.client.commit()
+        return rows
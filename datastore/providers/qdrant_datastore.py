@@ -7,6 +7,7 @@ from qdrant_client.http.exceptions import UnexpectedResponse
 from qdrant_client.http.models import PayloadSchemaType
 
 from datastore.datastore import DataStore
+from datastore.executor import get_blocking_executor
 from models.models import (
     DocumentChunk,
     DocumentMetadataFilter,
@@ -54,6 +55,8 @@ class QdrantDataStore(DataStore):
             timeout=10,
         )
         self.collection_name = collection_name or QDRANT_COLLECTION
+        # Run the blocking calls of the Qdrant client off the event loop
+        self._executor = get_blocking_executor("qdrant")
 
         # Set up the collection so the points might be inserted or queried
         self._set_up_collection(vector_size, distance, recreate_collection)
@@ -68,7 +71,8 @@ class QdrantDataStore(DataStore):
             for _, chunks in chunks.items()
             for chunk in chunks
         ]
-        self.client.upsert(
+        await self._executor.run(
+            self.client.upsert,
             collection_name=self.collection_name,
             points=points,  # type: ignore
             wait=True,
@@ -85,7 +89,8 @@ class QdrantDataStore(DataStore):
         search_requests = [
             self._convert_query_to_search_request(query) for query in queries
         ]
-        results = self.client.search_batch(
+        results = await self._executor.run(
+            self.client.search_batch,
             collection_name=self.collection_name,
             requests=search_requests,
         )
@@ -100,7 +105,13 @@ class QdrantDataStore(DataStore):
             for query, result in zip(queries, results)
         ]
 
-    async def delete(
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the vectors of the given documents with a single delete.
+        """
+        return await self._delete(ids=document_ids)
+
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -122,12 +133,31 @@ class QdrantDataStore(DataStore):
                 filter, ids
             )
 
-        response = self.client.delete(
+        response = await self._executor.run(
+            self.client.delete,
             collection_name=self.collection_name,
             points_selector=points_selector,  # type: ignore
         )
         return "COMPLETED" == response.status
 
+    async def _delete_chunks(self, chunk_ids: Dict[str, List[str]]) -> bool:
+        """
+        Removes single chunks by id from the collection.
+        Returns whether the operation was successful.
+        """
+        response = await self._executor.run(
+            self.client.delete,
+            collection_name=self.collection_name,
+            points_selector=rest.PointIdsList(
+                points=[
+                    self._create_document_chunk_id(chunk_id)
+                    for doc_chunk_ids in chunk_ids.values()
+                    for chunk_id in doc_chunk_ids
+                ]
+            ),
+        )
+        return "COMPLETED" == response.status
+
     def _convert_document_chunk_to_point(
         self, document_chunk: DocumentChunk
     ) -> rest.PointStruct:
@@ -160,7 +190,7 @@ class QdrantDataStore(DataStore):
             filter=self._convert_metadata_filter_to_qdrant_filter(query.filter),
             limit=query.top_k,  # type: ignore
             with_payload=True,
-            with_vector=False,
+            with_vector=query.include_embeddings,
         )
 
     def _convert_metadata_filter_to_qdrant_filter(
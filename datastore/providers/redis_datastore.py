@@ -35,6 +35,10 @@ REDIS_DOC_PREFIX = os.environ.get("REDIS_DOC_PREFIX", "doc")
 REDIS_DISTANCE_METRIC = os.environ.get("REDIS_DISTANCE_METRIC", "COSINE")
 REDIS_INDEX_TYPE = os.environ.get("REDIS_INDEX_TYPE", "FLAT")
 assert REDIS_INDEX_TYPE in ("FLAT", "HNSW")
+REDIS_DELETE_PAGE_SIZE = int(
+    os.environ.get("REDIS_DELETE_PAGE_SIZE", 1000)
+)  # the number of keys read per page when finding the chunks of documents to delete
+REDIS_DELETE_IDS_PER_QUERY = 100  # the document ids matched by each tag query
 
 # OpenAI Ada Embeddings Dimension
 VECTOR_DIMENSION = 1536
@@ -258,8 +262,11 @@ class RedisDataStore(DataStore):
         Args:
             keys (List[str]): List of keys to delete.
         """
-        # Delete the keys
-        await asyncio.gather(*[self.client.delete(key) for key in keys])
+        # Delete the keys in a single round trip
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.delete(key)
+            await pipe.execute()
 
     #######
 
@@ -335,7 +342,63 @@ class RedisDataStore(DataStore):
     async def _find_keys(self, pattern: str) -> List[str]:
         return [key async for key in self.client.scan_iter(pattern)]
 
-    async def delete(
+    async def _find_document_keys(self, document_ids: List[str]) -> List[str]:
+        """
+        Find the keys of the chunks of documents with tag queries on the document_id field
+        of the index, which only return the matching keys, page by page.
+        """
+        keys: List[str] = []
+        for i in range(0, len(document_ids), REDIS_DELETE_IDS_PER_QUERY):
+            batch = document_ids[i : i + REDIS_DELETE_IDS_PER_QUERY]
+            tags = "|".join(self._escape(document_id) for document_id in batch)
+            offset = 0
+            while True:
+                # Read every page before deleting, deletes would shift the offsets
+                query = (
+                    RediSearchQuery(f"@document_id:{{{tags}}}")
+                    .no_content()
+                    .paging(offset, REDIS_DELETE_PAGE_SIZE)
+                    .dialect(2)
+                )
+                response = await self.client.ft(REDIS_INDEX_NAME).search(query)
+                keys.extend(doc.id for doc in response.docs)
+                offset += len(response.docs)
+                if not response.docs or offset >= response.total:
+                    break
+        return keys
+
+    async def _scan_document_keys(self, document_ids: List[str]) -> List[str]:
+        # Every SCAN walks the whole keyspace, so match the keys of all the documents in one pass
+        if len(document_ids) == 1:
+            return await self._find_keys(f"{REDIS_DOC_PREFIX}:{document_ids[0]}:*")
+        prefix = f"{REDIS_DOC_PREFIX}:"
+        ids = set(document_ids)
+        return [
+            key
+            async for key in self.client.scan_iter(f"{prefix}*", count=1000)
+            if key.decode()[len(prefix) :].split(":chunk:", 1)[0] in ids
+        ]
+
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the chunks of the given documents, found through the document_id tag of
+        the index, or with a scan of the keys if the index can't be searched.
+        """
+        try:
+            keys = await self._find_document_keys(document_ids)
+        except redis.ResponseError as e:
+            logger.warning(f"Error searching the keys of documents, scanning them: {e}")
+            keys = await self._scan_document_keys(document_ids)
+        try:
+            logger.info(f"Deleting {len(keys)} keys of {len(document_ids)} documents")
+            await self._redis_delete(keys)
+        except Exception as e:
+            logger.error(f"Error deleting documents: {e}")
+            raise e
+
+        return True
+
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -389,3 +452,22 @@ class RedisDataStore(DataStore):
                 raise e
 
         return True
+
+    async def _delete_chunks(self, chunk_ids: Dict[str, List[str]]) -> bool:
+        """
+        Removes single chunks by id from the datastore.
+        Returns whether the operation was successful.
+        """
+        keys = [
+            self._redis_key(document_id, chunk_id)
+            for document_id, doc_chunk_ids in chunk_ids.items()
+            for chunk_id in doc_chunk_ids
+        ]
+        try:
+            logger.info(f"Deleting {len(keys)} chunk keys from Redis")
+            await self._redis_delete(keys)
+        except Exception as e:
+            logger.error(f"Error deleting chunks: {e}")
+            raise e
+
+        return True
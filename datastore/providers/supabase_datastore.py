@@ -4,6 +4,7 @@ from datetime import datetime
 
 from supabase import Client
 
+from datastore.executor import get_blocking_executor
 from datastore.providers.pgvector_datastore import PGClient, PgVectorDataStore
 from models.models import (
     DocumentMetadataFilter,
@@ -32,6 +33,8 @@ class SupabaseClient(PGClient):
             self.client = Client(SUPABASE_URL, SUPABASE_ANON_KEY)
         else:
             self.client = Client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+        # Run the blocking requests of the Supabase client off the event loop
+        self._executor = get_blocking_executor("supabase")
 
     async def upsert(self, table: str, json: dict[str, Any]):
         """
@@ -40,7 +43,7 @@ class SupabaseClient(PGClient):
         if "created_at" in json:
             json["created_at"] = json["created_at"][0].isoformat()
 
-        self.client.table(table).upsert(json).execute()
+        await self._executor.run(self.client.table(table).upsert(json).execute)
 
     async def rpc(self, function_name: str, params: dict[str, Any]):
         """
@@ -51,20 +54,26 @@ class SupabaseClient(PGClient):
         if "in_end_date" in params:
             params["in_end_date"] = params["in_end_date"].isoformat()
 
-        response = self.client.rpc(function_name, params=params).execute()
+        response = await self._executor.run(
+            self.client.rpc(function_name, params=params).execute
+        )
         return response.data
 
     async def delete_like(self, table: str, column: str, pattern: str):
         """
         Deletes rows in the table that match the pattern.
         """
-        self.client.table(table).delete().like(column, pattern).execute()
+        await self._executor.run(
+            self.client.table(table).delete().like(column, pattern).execute
+        )
 
     async def delete_in(self, table: str, column: str, ids: List[str]):
         """
         Deletes rows in the table that match the ids.
         """
-        self.client.table(table).delete().in_(column, ids).execute()
+        await self._executor.run(
+            self.client.table(table).delete().in_(column, ids).execute
+        )
 
     async def delete_by_filters(self, table: str, filter: DocumentMetadataFilter):
         """
@@ -92,4 +101,4 @@ class SupabaseClient(PGClient):
                 "created_at",
                 filter.end_date[0].isoformat(),
             )
-        builder.execute()
+        await self._executor.run(builder.execute)
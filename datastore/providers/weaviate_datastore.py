@@ -10,6 +10,7 @@ from weaviate import Client
 from weaviate.util import generate_uuid5
 
 from datastore.datastore import DataStore
+from datastore.executor import BlockingExecutor, get_blocking_executor
 from models.models import (
     DocumentChunk,
     DocumentChunkMetadata,
@@ -117,6 +118,10 @@ class WeaviateDataStore(DataStore):
             timeout_retries=WEAVIATE_BATCH_TIMEOUT_RETRIES,
             num_workers=WEAVIATE_BATCH_NUM_WORKERS,
         )
+        # Run the blocking calls of the Weaviate client off the event loop. The batch of
+        # the client is shared, so the batch writes run one at a time.
+        self._executor = get_blocking_executor("weaviate")
+        self._batch_executor = BlockingExecutor("weaviate", max_concurrency=1)
 
         if self.client.schema.contains(SCHEMA):
             current_schema = self.client.schema.get(WEAVIATE_CLASS)
@@ -151,6 +156,9 @@ class WeaviateDataStore(DataStore):
         Takes in a list of list of document chunks and inserts them into the database.
         Return a list of document ids.
         """
+        return await self._batch_executor.run(self._write_batch, chunks)
+
+    def _write_batch(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
         doc_ids = []
 
         with self.client.batch as batch:
@@ -196,7 +204,7 @@ class WeaviateDataStore(DataStore):
         async def _single_query(query: QueryWithEmbedding) -> QueryResult:
             logger.debug(f"Query: {query.query}")
             if not hasattr(query, "filter") or not query.filter:
-                result = (
+                request = (
                     self.client.query.get(
                         WEAVIATE_CLASS,
                         [
@@ -213,11 +221,10 @@ class WeaviateDataStore(DataStore):
                     .with_hybrid(query=query.query, alpha=0.5, vector=query.embedding)
                     .with_limit(query.top_k)  # type: ignore
                     .with_additional(["score", "vector"])
-                    .do()
                 )
             else:
                 filters_ = self.build_filters(query.filter)
-                result = (
+                request = (
                     self.client.query.get(
                         WEAVIATE_CLASS,
                         [
@@ -235,9 +242,10 @@ class WeaviateDataStore(DataStore):
                     .with_where(filters_)
                     .with_limit(query.top_k)  # type: ignore
                     .with_additional(["score", "vector"])
-                    .do()
                 )
 
+            result = await self._executor.run(request.do)
+
             query_results: List[DocumentChunkWithScore] = []
             response = result["data"]["Get"][WEAVIATE_CLASS]
 
@@ -261,7 +269,13 @@ class WeaviateDataStore(DataStore):
 
         return await asyncio.gather(*[_single_query(query) for query in queries])
 
-    async def delete(
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        """
+        Removes all the vectors of the given documents with a single delete.
+        """
+        return await self._delete(ids=document_ids)
+
+    async def _delete(
         self,
         ids: Optional[List[str]] = None,
         filter: Optional[DocumentMetadataFilter] = None,
@@ -274,7 +288,7 @@ class WeaviateDataStore(DataStore):
         """
         if delete_all:
             logger.debug(f"Deleting all vectors in index {WEAVIATE_CLASS}")
-            self.client.schema.delete_all()
+            await self._executor.run(self.client.schema.delete_all)
             return True
 
         if ids:
@@ -286,8 +300,11 @@ class WeaviateDataStore(DataStore):
             where_clause = {"operator": "Or", "operands": operands}
 
             logger.debug(f"Deleting vectors from index {WEAVIATE_CLASS} with ids {ids}")
-            result = self.client.batch.delete_objects(
-                class_name=WEAVIATE_CLASS, where=where_clause, output="verbose"
+            result = await self._executor.run(
+                self.client.batch.delete_objects,
+                class_name=WEAVIATE_CLASS,
+                where=where_clause,
+                output="verbose",
             )
 
             if not bool(result["results"]["successful"]):
@@ -301,8 +318,10 @@ class WeaviateDataStore(DataStore):
             logger.debug(
                 f"Deleting vectors from index {WEAVIATE_CLASS} with filter {where_clause}"
             )
-            result = self.client.batch.delete_objects(
-                class_name=WEAVIATE_CLASS, where=where_clause
+            result = await self._executor.run(
+                self.client.batch.delete_objects,
+                class_name=WEAVIATE_CLASS,
+                where=where_clause,
             )
 
             if not bool(result["results"]["successful"]):
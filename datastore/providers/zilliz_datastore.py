@@ -7,6 +7,7 @@ from pymilvus import (
 )
 from uuid import uuid4
 
+from datastore.executor import get_blocking_executor
 from datastore.providers.milvus_datastore import (
     MilvusDataStore,
 )
@@ -31,6 +32,8 @@ class ZillizDataStore(MilvusDataStore):
         """
         # Overwrite the default consistency level by MILVUS_CONSISTENCY_LEVEL
         self._consistency_level = ZILLIZ_CONSISTENCY_LEVEL or "Bounded"
+        # Run the blocking calls of the Zilliz client off the event loop
+        self._executor = get_blocking_executor("zilliz")
         self._create_connection()
 
         self._create_collection(ZILLIZ_COLLECTION, create_new)  # type: ignore
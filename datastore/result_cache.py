@@ -0,0 +1,120 @@
+import os
+from typing import Dict, Hashable, Optional
+
+from loguru import logger
+
+from models.models import Query, QueryResult
+from services.cache import LRUCache
+from services.metrics import (
+    QUERY_RESULT_CACHE_GENERATION,
+    QUERY_RESULT_CACHE_HIT_RATE,
+    QUERY_RESULT_CACHE_HITS,
+    QUERY_RESULT_CACHE_MISSES,
+)
+from services.openai import get_embedding_model_id
+from services.query_embeddings import normalize_query
+
+# Read environment variables for the query result cache
+QUERY_RESULT_CACHE_SIZE = int(
+    os.environ.get("QUERY_RESULT_CACHE_SIZE", 0)
+)  # 0 disables the cache
+QUERY_RESULT_CACHE_TTL = float(os.environ.get("QUERY_RESULT_CACHE_TTL", 300)) or None
+QUERY_RESULT_CACHE_MAX_BYTES = int(
+    os.environ.get("QUERY_RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+)
+
+
+def estimate_result_size(result: QueryResult) -> int:
+    """
+    Roughly estimate the memory used by a query result, in bytes.
+    """
+    size = 256 + len(result.query)
+    for chunk in result.results:
+        # Every float of an embedding list is a separate Python object
+        size += 512 + len(chunk.text) + 32 * len(chunk.embedding or [])
+    return size
+
+
+class QueryResultCache:
+    """
+    Caches query results by embedding model, normalized query text, filter and top_k.
+
+    Every write to the datastore bumps a generation counter and drops the cached results.
+    A result is only stored if no write happened while it was being computed, so a cached
+    result never predates the last write made through this process. Writes made by other
+    processes are only picked up when entries expire, after the TTL.
+    """
+
+    def __init__(
+        self,
+        max_size: int = QUERY_RESULT_CACHE_SIZE,
+        ttl: Optional[float] = QUERY_RESULT_CACHE_TTL,
+        max_bytes: int = QUERY_RESULT_CACHE_MAX_BYTES,
+    ):
+        """
+        Args:
+            max_size: The maximum number of cached results.
+            ttl: The number of seconds after which a cached result expires, or None to never expire them.
+            max_bytes: The maximum estimated memory used by the cached results.
+        """
+        self.generation = 0
+        self._cache: LRUCache[QueryResult] = LRUCache(
+            max_size=max_size,
+            ttl=ttl,
+            max_bytes=max_bytes,
+            sizeof=estimate_result_size,
+        )
+
+    @staticmethod
+    def key(query: Query) -> Hashable:
+        return (
+            get_embedding_model_id(),
+            normalize_query(query.query),
+            query.filter.json() if query.filter else None,
+            query.top_k,
+            query.diversity or None,
+        )
+
+    def get(self, query: Query) -> Optional[QueryResult]:
+        """
+        Return the cached result of a query, or None if it is not cached.
+        """
+        result = self._cache.get(self.key(query))
+        counter = QUERY_RESULT_CACHE_MISSES if result is None else QUERY_RESULT_CACHE_HITS
+        counter.labels().inc()
+        QUERY_RESULT_CACHE_HIT_RATE.labels().set(self._cache.stats()["hit_rate"])
+        if result is None:
+            return None
+        # The cached result may be for a query that only normalizes to the same text
+        return QueryResult(query=query.query, results=result.results)
+
+    def set(self, query: Query, result: QueryResult, generation: int) -> None:
+        """
+        Cache the result of a query computed at the given generation, unless the datastore
+        was written to since.
+        """
+        if generation == self.generation:
+            self._cache.set(self.key(query), result)
+
+    def invalidate(self) -> None:
+        """
+        Drop every cached result, after a write to the datastore.
+        """
+        self.generation += 1
+        self._cache.clear()
+        QUERY_RESULT_CACHE_GENERATION.labels().set(self.generation)
+
+    def stats(self) -> Dict[str, float]:
+        return {**self._cache.stats(), "generation": self.generation}
+
+
+def get_query_result_cache() -> Optional[QueryResultCache]:
+    """
+    Create the query result cache configured by QUERY_RESULT_CACHE_SIZE, or return None if it is disabled.
+    """
+    if QUERY_RESULT_CACHE_SIZE <= 0:
+        return None
+    logger.info(
+        f"Caching up to {QUERY_RESULT_CACHE_SIZE} query results for {QUERY_RESULT_CACHE_TTL}s"
+    )
+    return QueryResultCache()
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from loguru import logger
+from pydantic import BaseModel
+
+from models.models import DocumentChunk, DocumentMetadata
+
+# Read environment variables for the upsert manifest
+UPSERT_MANIFEST = os.environ.get("UPSERT_MANIFEST")  # "sqlite", "memory" or unset
+UPSERT_MANIFEST_PATH = os.environ.get("UPSERT_MANIFEST_PATH", "upsert_manifest.sqlite3")
+
+# Bump to invalidate every manifest, e.g. when the chunking algorithm changes
+MANIFEST_VERSION = "1"
+
+
+class DocumentManifest(BaseModel):
+    """
+    What was last written to the datastore for a document.
+    """
+
+    document_hash: str
+    chunks: Dict[str, str]  # chunk id -> chunk hash
+
+
+def _metadata_json(metadata: Optional[DocumentMetadata]) -> str:
+    return json.dumps(metadata.dict() if metadata else None, sort_keys=True, default=str)
+
+
+def document_hash(
+    text: str, metadata: Optional[DocumentMetadata], chunk_token_size: Optional[int]
+) -> str:
+    """
+    Hash everything that determines the chunks written for a document.
+    """
+    return hashlib.sha256(
+        "\0".join(
+            [MANIFEST_VERSION, str(chunk_token_size), _metadata_json(metadata), text]
+        ).encode("utf-8")
+    ).hexdigest()
+
+
+def chunk_hash(chunk: DocumentChunk) -> str:
+    """
+    Hash the text and metadata of a chunk, ignoring its id and embedding.
+    """
+    return hashlib.sha256(
+        f"{_metadata_json(chunk.metadata)}\0{chunk.text}".encode("utf-8")
+    ).hexdigest()
+
+
+class UpsertManifest(ABC):
+    """
+    Stores a manifest of the chunks written for each document, so that re-upserting a document
+    only writes the chunks that changed.
+
+    The manifest has to see every write and delete made to the datastore, so it must only be
+    used with a single writer, or with writers sharing the same manifest.
+    """
+
+    @abstractmethod
+    async def get_many(self, document_ids: List[str]) -> Dict[str, DocumentManifest]:
+        """
+        Return the manifests of the given documents, skipping the documents without one.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_many(self, manifests: Dict[str, DocumentManifest]) -> None:
+        """
+        Store manifests by document id.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_many(self, document_ids: List[str]) -> None:
+        """
+        Forget the manifests of the given documents.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def clear(self) -> None:
+        """
+        Forget every manifest.
+        """
+        raise NotImplementedError
+
+
+class MemoryUpsertManifest(UpsertManifest):
+    """
+    Upsert manifest kept in memory, lost when the process exits.
+    """
+
+    def __init__(self):
+        self._manifests: Dict[str, DocumentManifest] = {}
+
+    async def get_many(self, document_ids: List[str]) -> Dict[str, DocumentManifest]:
+        return {
+            document_id: self._manifests[document_id]
+            for document_id in document_ids
+            if document_id in self._manifests
+        }
+
+    async def set_many(self, manifests: Dict[str, DocumentManifest]) -> None:
+        self._manifests.update(manifests)
+
+    async def delete_many(self, document_ids: List[str]) -> None:
+        for document_id in document_ids:
+            self._manifests.pop(document_id, None)
+
+    async def clear(self) -> None:
+        self._manifests.clear()
+
+
+class SQLiteUpsertManifest(UpsertManifest):
+    """
+    Upsert manifest stored on local disk in SQLite.
+    """
+
+    def __init__(self, path: str = UPSERT_MANIFEST_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS manifests "
+            "(document_id TEXT PRIMARY KEY, manifest TEXT NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _get_many(self, document_ids: List[str]) -> Dict[str, DocumentManifest]:
+        manifests = {}
+        with self._lock:
+            # Stay well under SQLite's limit on the number of query parameters
+            for i in range(0, len(document_ids), 500):
+                batch = document_ids[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                for document_id, manifest in self._conn.execute(
+                    f"SELECT document_id, manifest FROM manifests WHERE document_id IN ({placeholders})",
+                    batch,
+                ):
+                    manifests[document_id] = DocumentManifest.parse_raw(manifest)
+        return manifests
+
+    def _set_many(self, manifests: Dict[str, DocumentManifest]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO manifests (document_id, manifest) VALUES (?, ?)",
+                [
+                    (document_id, manifest.json())
+                    for document_id, manifest in manifests.items()
+                ],
+            )
+            self._conn.commit()
+
+    def _delete_many(self, document_ids: List[str]) -> None:
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM manifests WHERE document_id = ?",
+                [(document_id,) for document_id in document_ids],
+            )
+            self._conn.commit()
+
+    def _clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM manifests")
+            self._conn.commit()
+
+    async def get_many(self, document_ids: List[str]) -> Dict[str, DocumentManifest]:
+        return await asyncio.to_thread(self._get_many, document_ids)
+
+    async def set_many(self, manifests: Dict[str, DocumentManifest]) -> None:
+        await asyncio.to_thread(self._set_many, manifests)
+
+    async def delete_many(self, document_ids: List[str]) -> None:
+        await asyncio.to_thread(self._delete_many, document_ids)
+
+    async def clear(self) -> None:
+        await asyncio.to_thread(self._clear)
+
+
+def get_upsert_manifest() -> Optional[UpsertManifest]:
+    """
+    Create the upsert manifest selected by UPSERT_MANIFEST, or return None if incremental upserts are disabled.
+    """
+    if not UPSERT_MANIFEST:
+        return None
+
+    match UPSERT_MANIFEST:
+        case "sqlite":
+            logger.info(f"Using the upsert manifest at {UPSERT_MANIFEST_PATH}")
+            return SQLiteUpsertManifest()
+        case "memory":
+            return MemoryUpsertManifest()
+        case _:
+            raise ValueError(
+                f"Unsupported upsert manifest: {UPSERT_MANIFEST}. "
+                f"Try one of the following: sqlite or memory"
+            )
@@ -0,0 +1,152 @@
+import asyncio
+import os
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from loguru import logger
+
+from models.models import Document, DocumentChunk
+from services.chunks import (
+    CHUNKING_PROCESS_MIN_CHARS,
+    create_all_document_chunks,
+    embed_document_chunks,
+)
+
+# Read environment variables for the upsert pipeline
+UPSERT_PIPELINE_BATCH_CHARS = int(
+    os.environ.get("UPSERT_PIPELINE_BATCH_CHARS", 200_000)
+)  # the size of the groups of documents that move through the pipeline together
+UPSERT_PIPELINE_QUEUE_SIZE = int(
+    os.environ.get("UPSERT_PIPELINE_QUEUE_SIZE", 2)
+)  # the number of groups waiting between two stages
+
+_DONE = object()
+
+
+def group_documents(documents: List[Document], max_chars: int) -> List[List[Document]]:
+    """
+    Split documents into contiguous groups of up to max_chars characters of text.
+    A document longer than max_chars gets a group of its own.
+
+    Args:
+        documents: The documents to group, in order.
+        max_chars: The maximum total length of the texts of a group.
+
+    Returns:
+        A list of non-empty groups of documents, in order.
+    """
+    groups: List[List[Document]] = []
+    group: List[Document] = []
+    group_chars = 0
+    for doc in documents:
+        if group and group_chars + len(doc.text) > max_chars:
+            groups.append(group)
+            group, group_chars = [], 0
+        group.append(doc)
+        group_chars += len(doc.text)
+    if group:
+        groups.append(group)
+    return groups
+
+
+async def run_upsert_pipeline(
+    documents: List[Document],
+    chunk_token_size: Optional[int],
+    delete: Callable[[List[str]], Awaitable[bool]],
+    write: Callable[[Dict[str, List[DocumentChunk]]], Awaitable[List[str]]],
+    batch_chars: int = UPSERT_PIPELINE_BATCH_CHARS,
+    queue_size: int = UPSERT_PIPELINE_QUEUE_SIZE,
+) -> List[str]:
+    """
+    Upsert documents through a pipeline of stages connected by bounded queues, so that one group
+    of documents is written while the next ones are embedded and the ones after them are chunked.
+
+    Each group's existing vectors are deleted while it is chunked and embedded, and always before
+    it is written. Groups are written in order, and the queues bound how many groups are in flight
+    and held in memory at once.
+
+    Args:
+        documents: The documents to upsert.
+        chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+        delete: A coroutine function that deletes the existing vectors of a list of document ids.
+        write: A coroutine function that writes embedded chunks by document id and returns the document ids.
+        batch_chars: The maximum total length of the texts of a group of documents.
+        queue_size: The maximum number of groups waiting between two stages.
+
+    Returns:
+        The document ids returned by write, in order, once for a repeated document id.
+    """
+    # A document id repeated in the request keeps its last version, as if the documents were
+    # upserted one after the other. Writing both from different groups would leave the extra
+    # chunks of the first version, since only the first group deletes the old ones.
+    last_versions: Dict[str, Document] = {}
+    for doc in documents:
+        if doc.id:
+            last_versions[doc.id] = doc
+    documents = [doc for doc in documents if not doc.id or last_versions[doc.id] is doc]
+
+    chunked: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+    embedded: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+    # The deletes, chunking and embeddings in flight, cancelled if the pipeline fails. Finished
+    # ones are dropped so that the chunks of written groups can be freed.
+    in_flight: Set[asyncio.Future] = set()
+
+    def start(coroutine: Awaitable) -> asyncio.Future:
+        future = asyncio.ensure_future(coroutine)
+        in_flight.add(future)
+        future.add_done_callback(in_flight.discard)
+        return future
+
+    # Decide once for the whole request whether chunking is worth sending to the process pool
+    in_process_pool = sum(len(doc.text) for doc in documents) >= CHUNKING_PROCESS_MIN_CHARS
+
+    async def chunk_stage() -> None:
+        for group in group_documents(documents, batch_chars):
+            ids = [doc.id for doc in group if doc.id]
+            deleted = start(delete(ids))
+            # Chunk the group in the background, so that several groups can use the process pool
+            chunking = start(
+                create_all_document_chunks(group, chunk_token_size, in_process_pool)
+            )
+            await chunked.put((deleted, chunking))
+        await chunked.put(_DONE)
+
+    async def embed_stage() -> None:
+        while (item := await chunked.get()) is not _DONE:
+            deleted, chunking = item
+            chunks = await chunking
+            # Embed the group in the background, so that the next group can start embedding
+            # while this one waits in the queue for the write stage
+            embedding = start(
+                embed_document_chunks(
+                    [chunk for doc_chunks in chunks.values() for chunk in doc_chunks]
+                )
+            )
+            await embedded.put((deleted, embedding, chunks))
+        await embedded.put(_DONE)
+
+    async def write_stage() -> List[str]:
+        doc_ids: List[str] = []
+        while (item := await embedded.get()) is not _DONE:
+            deleted, embedding, chunks = item
+            await deleted
+            await embedding
+            if any(chunks.values()):
+                doc_ids.extend(await write(chunks))
+        return doc_ids
+
+    stages = [
+        asyncio.ensure_future(chunk_stage()),
+        asyncio.ensure_future(embed_stage()),
+        asyncio.ensure_future(write_stage()),
+    ]
+    try:
+        *_, doc_ids = await asyncio.gather(*stages)
+    except BaseException as e:
+        logger.error(f"Error in upsert pipeline: {e}")
+        pending = stages + list(in_flight)
+        for future in pending:
+            future.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        raise
+
+    return doc_ids
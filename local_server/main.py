@@ -13,7 +13,10 @@ from models.api import (
     UpsertRequest,
     UpsertResponse,
 )
+from datastore.executor import shutdown_thread_pool
 from datastore.factory import get_datastore
+from services.chunks import shutdown_process_pool
+from services.openai import close_session
 from services.file import get_document_from_file
 
 from starlette.responses import FileResponse
@@ -144,5 +147,16 @@ async def startup():
     datastore = await get_datastore()
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    # Only some datastores hold resources of their own, like the local one
+    close = getattr(datastore, "close", None)
+    if close is not None:
+        close()
+    await close_session()
+    shutdown_process_pool()
+    shutdown_thread_pool()
+
+
 def start():
     uvicorn.run("local_server.main:app", host="localhost", port=PORT, reload=True)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 from enum import Enum
 
@@ -55,10 +55,14 @@ class Query(BaseModel):
     query: str
     filter: Optional[DocumentMetadataFilter] = None
     top_k: Optional[int] = 3
+    # Trades relevance for diverse results by maximal marginal relevance, 0 or None disables it
+    diversity: Optional[float] = Field(None, ge=0, le=1)
 
 
 class QueryWithEmbedding(Query):
     embedding: List[float]
+    # Whether the provider should return the embeddings of the matching chunks
+    include_embeddings: bool = False
 
 
 class QueryResult(BaseModel):
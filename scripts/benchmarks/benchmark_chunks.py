@@ -0,0 +1,67 @@
+import argparse
+import random
+import time
+
+from loguru import logger
+from services.chunks import get_text_chunks, tokenizer
+
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "Übergröße", "日本語"]
+SEPARATORS = [" "] * 15 + [". ", "? ", "\n", "\n\n"]
+
+
+def generate_text(num_chars: int, seed: int = 0) -> str:
+    """
+    Generate a random text of about num_chars characters, with sentences and paragraphs.
+    """
+    rng = random.Random(seed)
+    parts = []
+    length = 0
+    while length < num_chars:
+        part = rng.choice(WORDS) + rng.choice(SEPARATORS)
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def benchmark(num_chars: int, chunk_token_size: int, repeat: int) -> None:
+    text = generate_text(num_chars)
+    num_tokens = len(tokenizer.encode(text, disallowed_special=()))
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = get_text_chunks(text, chunk_token_size)
+        timings.append(time.perf_counter() - start)
+
+    best = min(timings)
+    logger.info(
+        f"{len(text) / 1e6:.2f} MB, {num_tokens} tokens -> {len(chunks)} chunks "
+        f"in {best * 1000:.1f} ms ({len(text) / 1e6 / best:.2f} MB/s, "
+        f"{num_tokens / best / 1e6:.2f} M tokens/s)"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--sizes",
+        default="100000,1000000,5000000",
+        help="A comma separated list of text sizes to benchmark, in characters",
+    )
+    parser.add_argument(
+        "--chunk_token_size",
+        default=200,
+        type=int,
+        help="The target size of each chunk in tokens",
+    )
+    parser.add_argument(
+        "--repeat", default=3, type=int, help="The number of runs per size"
+    )
+    args = parser.parse_args()
+
+    for size in args.sizes.split(","):
+        benchmark(int(size), args.chunk_token_size, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,204 @@
+import argparse
+import time
+
+import numpy as np
+from loguru import logger
+from datastore.local.hnsw import HNSWIndex
+from datastore.local.ivfpq import IVFPQIndex
+from datastore.local.quantized import BinaryIndex, Int8Index
+from datastore.local.vector_store import normalize
+
+
+def generate_vectors(
+    num_vectors: int, dimension: int, num_clusters: int = 100, seed: int = 0
+) -> np.ndarray:
+    """
+    Generate normalized random vectors grouped in clusters, which is closer to real
+    embeddings than uniform noise and harder for an approximate index.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dimension))
+    assignments = rng.integers(0, num_clusters, num_vectors)
+    vectors = centers[assignments] + 0.7 * rng.standard_normal((num_vectors, dimension))
+    return normalize(vectors.astype(np.float32))
+
+
+def exact_search(vectors: np.ndarray, queries: np.ndarray, top_k: int) -> np.ndarray:
+    scores = queries @ vectors.T
+    nearest = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+    return nearest
+
+
+def recall(found, expected: np.ndarray) -> float:
+    hits = sum(
+        len({row for row, _ in rows} & set(expected_rows.tolist()))
+        for rows, expected_rows in zip(found, expected)
+    )
+    return hits / expected.size
+
+
+def benchmark_hnsw(vectors: np.ndarray, queries: np.ndarray, expected: np.ndarray, args):
+    index = HNSWIndex(m=args.m, ef_construction=args.ef_construction)
+    start = time.perf_counter()
+    index.add(vectors, 0)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"hnsw: built M={args.m}, efConstruction={args.ef_construction} over "
+        f"{len(vectors)} vectors in {elapsed:.1f} s "
+        f"({len(vectors) / elapsed:.0f} vectors/s)"
+    )
+
+    top_k = [args.top_k] * len(queries)
+    for ef_search in args.ef_search.split(","):
+        start = time.perf_counter()
+        found = index.search(vectors, queries, top_k, ef_search=int(ef_search))
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"hnsw efSearch={ef_search}: recall@{args.top_k} "
+            f"{recall(found, expected):.3f}, "
+            f"{elapsed * 1000 / len(queries):.3f} ms/query"
+        )
+
+
+def benchmark_ivfpq(vectors: np.ndarray, queries: np.ndarray, expected: np.ndarray, args):
+    index = IVFPQIndex(nlist=args.nlist, m=args.pq_m, train_rows=args.train_rows)
+    start = time.perf_counter()
+    index.add(vectors, 0)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"ivfpq: built nlist={args.nlist}, m={args.pq_m} over {len(vectors)} vectors "
+        f"in {elapsed:.1f} s, {index.memory_bytes / 1e6:.1f} MB in memory instead of "
+        f"{vectors.nbytes / 1e6:.1f} MB ({vectors.nbytes / index.memory_bytes:.0f}x smaller)"
+    )
+
+    top_k = [args.top_k] * len(queries)
+    for nprobe in args.nprobe.split(","):
+        for rerank in args.rerank.split(","):
+            start = time.perf_counter()
+            found = index.search(
+                vectors, queries, top_k, nprobe=int(nprobe), rerank=int(rerank)
+            )
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"ivfpq nprobe={nprobe} rerank={rerank}: recall@{args.top_k} "
+                f"{recall(found, expected):.3f}, "
+                f"{elapsed * 1000 / len(queries):.3f} ms/query"
+            )
+
+
+def benchmark_quantized(
+    vectors: np.ndarray, queries: np.ndarray, expected: np.ndarray, args
+):
+    logger.info(f"float32: {vectors.nbytes / 1e6:.1f} MB in memory")
+    for mode, index in [("int8", Int8Index()), ("binary", BinaryIndex())]:
+        start = time.perf_counter()
+        index.add(vectors, 0)
+        elapsed = time.perf_counter() - start
+        logger.info(
+            f"{mode}: encoded {len(vectors)} vectors in {elapsed:.1f} s, "
+            f"{index.memory_bytes / 1e6:.1f} MB in memory "
+            f"({vectors.nbytes / index.memory_bytes:.0f}x smaller)"
+        )
+        for rescore in args.rescore.split(","):
+            found = []
+            start = time.perf_counter()
+            for query in queries:
+                found += index.search(
+                    vectors, query[None], [args.top_k], rescore=int(rescore)
+                )
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"{mode} rescore={rescore}: recall@{args.top_k} "
+                f"{recall(found, expected):.3f}, "
+                f"{elapsed * 1000 / len(queries):.3f} ms/query (one at a time)"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--index",
+        default="hnsw",
+        choices=["hnsw", "ivfpq", "quantized"],
+        help="The approximate index to benchmark against the exact search, quantized "
+        "compares the float32, int8 and binary scans",
+    )
+    parser.add_argument(
+        "--num_vectors", default=100000, type=int, help="The number of vectors to index"
+    )
+    parser.add_argument(
+        "--dimension", default=256, type=int, help="The dimension of the vectors"
+    )
+    parser.add_argument(
+        "--num_queries", default=200, type=int, help="The number of queries to run"
+    )
+    parser.add_argument(
+        "--top_k", default=10, type=int, help="The number of results per query"
+    )
+    parser.add_argument("--m", default=16, type=int, help="The HNSW M parameter")
+    parser.add_argument(
+        "--ef_construction", default=200, type=int, help="The HNSW efConstruction"
+    )
+    parser.add_argument(
+        "--ef_search",
+        default="16,32,64,128,256",
+        help="A comma separated list of HNSW efSearch values to benchmark",
+    )
+    parser.add_argument(
+        "--nlist", default=1024, type=int, help="The number of IVF-PQ lists"
+    )
+    parser.add_argument(
+        "--pq_m", default=64, type=int, help="The number of IVF-PQ subquantizers"
+    )
+    parser.add_argument(
+        "--train_rows",
+        default=50000,
+        type=int,
+        help="The number of vectors the IVF-PQ quantizers are trained on",
+    )
+    parser.add_argument(
+        "--nprobe",
+        default="8,16,64",
+        help="A comma separated list of IVF-PQ nprobe values to benchmark",
+    )
+    parser.add_argument(
+        "--rerank",
+        default="0,4,16",
+        help="A comma separated list of IVF-PQ rerank factors to benchmark",
+    )
+    parser.add_argument(
+        "--rescore",
+        default="0,4,10,40",
+        help="A comma separated list of int8 and binary rescore factors to benchmark",
+    )
+    args = parser.parse_args()
+
+    vectors = generate_vectors(args.num_vectors, args.dimension)
+    queries = generate_vectors(args.num_queries, args.dimension, seed=1)
+
+    start = time.perf_counter()
+    expected = exact_search(vectors, queries, args.top_k)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"exact: recall@{args.top_k} 1.000, "
+        f"{elapsed * 1000 / args.num_queries:.3f} ms/query (batched)"
+    )
+    start = time.perf_counter()
+    for query in queries:
+        exact_search(vectors, query[None], args.top_k)
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"exact: recall@{args.top_k} 1.000, "
+        f"{elapsed * 1000 / args.num_queries:.3f} ms/query (one at a time)"
+    )
+
+    if args.index == "hnsw":
+        benchmark_hnsw(vectors, queries, expected, args)
+    elif args.index == "ivfpq":
+        benchmark_ivfpq(vectors, queries, expected, args)
+    else:
+        benchmark_quantized(vectors, queries, expected, args)
+
+
+if __name__ == "__main__":
+    main()
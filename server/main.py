@@ -1,8 +1,11 @@
 from models.models import DocumentMetadata, Source
+import asyncio
 import os
+import time
 from typing import Optional
 import uvicorn
-from fastapi import FastAPI, File, Form, HTTPException, Depends, Body, UploadFile
+from fastapi import FastAPI, File, Form, HTTPException, Depends, Body, Request, UploadFile
+from fastapi.responses import PlainTextResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
@@ -15,7 +18,18 @@ from models.api import (
     UpsertRequest,
     UpsertResponse,
 )
+from datastore.executor import shutdown_thread_pool
 from datastore.factory import get_datastore
+from services.chunks import shutdown_process_pool
+from services.metrics import (
+    HTTP_REQUEST_SECONDS,
+    HTTP_REQUESTS_IN_FLIGHT,
+    REGISTRY,
+    current_endpoint,
+    monitor_event_loop_lag,
+    time_stage,
+)
+from services.openai import close_session
 
 datastore = os.environ.get("DATASTORE")
 if datastore == "pigro":
@@ -48,6 +62,50 @@ sub_app = FastAPI(
 )
 app.mount("/sub", sub_app)
 
+# The paths used as endpoint labels in the metrics, any other path is labelled "other"
+METRICS_ENDPOINTS = {
+    "/upsert-file",
+    "/upsert",
+    "/query",
+    "/delete",
+    "/metrics",
+    "/sub/query",
+}
+
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    endpoint = request.url.path if request.url.path in METRICS_ENDPOINTS else "other"
+    in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    # The stages timed while serving the request are labelled with its endpoint
+    token = current_endpoint.set(endpoint)
+    status = "500"
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+        return response
+    finally:
+        current_endpoint.reset(token)
+        in_flight.dec()
+        HTTP_REQUEST_SECONDS.labels(endpoint, status).observe(
+            time.perf_counter() - start
+        )
+
+
+def serialize_query_response(response: QueryResponse) -> Response:
+    # Serialize the response here rather than in FastAPI, to measure how long it takes
+    with time_stage("serialize"):
+        return Response(content=response.json(), media_type="application/json")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(
+        REGISTRY.expose(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 
 @app.post(
     "/upsert-file",
@@ -102,7 +160,7 @@ async def query_main(
         results = await datastore.query(
             request.queries,
         )
-        return QueryResponse(results=results)
+        return serialize_query_response(QueryResponse(results=results))
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=500, detail="Internal Service Error")
@@ -121,7 +179,7 @@ async def query(
         results = await datastore.query(
             request.queries,
         )
-        return QueryResponse(results=results)
+        return serialize_query_response(QueryResponse(results=results))
     except Exception as e:
         logger.error(e)
         raise HTTPException(status_code=500, detail="Internal Service Error")
@@ -153,8 +211,21 @@ async def delete(
 
 @app.on_event("startup")
 async def startup():
-    global datastore
+    global datastore, event_loop_lag_monitor
     datastore = await get_datastore()
+    event_loop_lag_monitor = asyncio.create_task(monitor_event_loop_lag())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    event_loop_lag_monitor.cancel()
+    # Only some datastores hold resources of their own, like the local one
+    close = getattr(datastore, "close", None)
+    if close is not None:
+        close()
+    await close_session()
+    shutdown_process_pool()
+    shutdown_thread_pool()
 
 
 def start():
@@ -0,0 +1,100 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, TypeVar
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class LRUCache(Generic[V]):
+    """
+    A bounded in-memory least recently used cache with an optional time to live.
+    The cache can also be bounded by the estimated memory used by its values.
+
+    Not thread-safe: it is meant to be used from the event loop thread only.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[V], int]] = None,
+    ):
+        """
+        Args:
+            max_size: The maximum number of entries to keep. A size of 0 disables the cache.
+            ttl: The number of seconds after which an entry expires, or None to never expire entries.
+            max_bytes: The maximum total size of the values to keep, or None for no limit.
+            sizeof: A function estimating the size of a value in bytes, required with max_bytes.
+        """
+        if max_bytes is not None and sizeof is None:
+            raise ValueError("sizeof is required to bound the cache by max_bytes")
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self.bytes = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[V]:
+        """
+        Return the value stored under key and mark it as recently used, or None if it is missing or expired.
+        """
+        entry = self._entries.get(key, _MISSING)
+        if entry is not _MISSING:
+            value, expires_at, _ = entry
+            if expires_at is None or expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self._pop(key)
+        self.misses += 1
+        return None
+
+    def _pop(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self.bytes -= size
+
+    def set(self, key: Hashable, value: V) -> None:
+        """
+        Store value under key, evicting the least recently used entries if the cache is full.
+        """
+        if self.max_size <= 0:
+            return
+        size = self.sizeof(value) if self.sizeof else 0
+        if self.max_bytes is not None and size > self.max_bytes:
+            # Storing it would evict everything else
+            return
+        if key in self._entries:
+            self._pop(key)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._entries[key] = (value, expires_at, size)
+        self.bytes += size
+        while len(self._entries) > self.max_size or (
+            self.max_bytes is not None and self.bytes > self.max_bytes
+        ):
+            self._pop(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the size and the hit and miss counters of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -1,11 +1,18 @@
 from typing import Dict, List, Optional, Tuple
+import asyncio
 import uuid
 import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from models.models import Document, DocumentChunk, DocumentChunkMetadata
 
 import tiktoken
+from loguru import logger
 
-from services.openai import get_embeddings
+from services.embedding_cache import get_embedding_cache
+from services.metrics import time_stage
+from services.openai import aget_embeddings
 
 # Global variables
 tokenizer = tiktoken.get_encoding(
@@ -16,14 +23,51 @@ tokenizer = tiktoken.get_encoding(
 CHUNK_SIZE = 200  # The target size of each text chunk in tokens
 MIN_CHUNK_SIZE_CHARS = 350  # The minimum size of each text chunk in characters
 MIN_CHUNK_LENGTH_TO_EMBED = 5  # Discard chunks shorter than this
-EMBEDDINGS_BATCH_SIZE = int(os.environ.get("OPENAI_EMBEDDING_BATCH_SIZE", 128))  # The number of embeddings to request at a time
+EMBEDDINGS_BATCH_SIZE = int(os.environ.get("OPENAI_EMBEDDING_BATCH_SIZE", 128))  # The maximum number of embeddings to request at a time
+EMBEDDINGS_BATCH_TOKENS = int(os.environ.get("OPENAI_EMBEDDING_BATCH_TOKENS", 100000))  # The maximum number of tokens to send in a single embeddings request
+EMBEDDINGS_MAX_CONCURRENCY = int(os.environ.get("OPENAI_EMBEDDING_MAX_CONCURRENCY", 8))  # The maximum number of embedding requests in flight at once
 MAX_NUM_CHUNKS = 10000  # The maximum number of chunks to generate from a text
+CHUNKING_PROCESSES = int(os.environ.get("CHUNKING_PROCESSES", os.cpu_count() or 1))  # The number of worker processes used to chunk large upserts, 0 to always chunk inline
+CHUNKING_PROCESS_MIN_CHARS = int(os.environ.get("CHUNKING_PROCESS_MIN_CHARS", 200000))  # The total text size of an upsert, in characters, below which it is chunked inline
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+# The embedding semaphores of each event loop by concurrency, shared by every upsert
+_embedding_semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+
+def _init_chunking_worker() -> None:
+    # Give each worker process its own encoder rather than relying on the one inherited
+    # from the parent, which doesn't exist with the spawn start method
+    global tokenizer
+    tokenizer = tiktoken.get_encoding("cl100k_base")
+
+
+def _get_process_pool() -> ProcessPoolExecutor:
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(
+            max_workers=CHUNKING_PROCESSES, initializer=_init_chunking_worker
+        )
+    return _process_pool
+
+
+def shutdown_process_pool() -> None:
+    """
+    Shut down the worker processes used for chunking, if they were started.
+    """
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
 
 
 def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
     """
     Split a text into chunks of ~CHUNK_SIZE tokens, based on punctuation and newline boundaries.
 
+    The text is tokenized once, and the chunks are cut by walking a token offset through it,
+    so the cost is linear in the length of the text.
+
     Args:
         text: The text to split into chunks.
         chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
@@ -37,6 +81,7 @@ def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
 
     # Tokenize the text
     tokens = tokenizer.encode(text, disallowed_special=())
+    num_tokens = len(tokens)
 
     # Initialize an empty list of chunks
     chunks = []
@@ -47,18 +92,21 @@ def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
     # Initialize a counter for the number of chunks
     num_chunks = 0
 
+    # The offset of the first token that has not been consumed yet
+    offset = 0
+
     # Loop until all tokens are consumed
-    while tokens and num_chunks < MAX_NUM_CHUNKS:
-        # Take the first chunk_size tokens as a chunk
-        chunk = tokens[:chunk_size]
+    while offset < num_tokens and num_chunks < MAX_NUM_CHUNKS:
+        # Take the next chunk_size tokens as a chunk
+        chunk = tokens[offset : offset + chunk_size]
 
         # Decode the chunk into text
         chunk_text = tokenizer.decode(chunk)
 
         # Skip the chunk if it is empty or whitespace
         if not chunk_text or chunk_text.isspace():
-            # Remove the tokens corresponding to the chunk text from the remaining tokens
-            tokens = tokens[len(chunk) :]
+            # Move past the tokens of the chunk
+            offset += len(chunk)
             # Continue to the next iteration of the loop
             continue
 
@@ -82,15 +130,17 @@ def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
             # Append the chunk text to the list of chunks
             chunks.append(chunk_text_to_append)
 
-        # Remove the tokens corresponding to the chunk text from the remaining tokens
-        tokens = tokens[len(tokenizer.encode(chunk_text, disallowed_special=())) :]
+        # Move past the tokens corresponding to the chunk text. The truncated text is
+        # re-encoded rather than mapped back to token offsets, because its encoding can
+        # differ from the prefix of the chunk tokens at the cut.
+        offset += len(tokenizer.encode(chunk_text, disallowed_special=()))
 
         # Increment the number of chunks
         num_chunks += 1
 
     # Handle the remaining tokens
-    if tokens:
-        remaining_text = tokenizer.decode(tokens).replace("\n", " ").strip()
+    if offset < num_tokens:
+        remaining_text = tokenizer.decode(tokens[offset:]).replace("\n", " ").strip()
         if len(remaining_text) > MIN_CHUNK_LENGTH_TO_EMBED:
             chunks.append(remaining_text)
 
@@ -98,7 +148,9 @@ def get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
 
 
 def create_document_chunks(
-    doc: Document, chunk_token_size: Optional[int]
+    doc: Document,
+    chunk_token_size: Optional[int],
+    text_chunks: Optional[List[str]] = None,
 ) -> Tuple[List[DocumentChunk], str]:
     """
     Create a list of document chunks from a document object and return the document id.
@@ -106,6 +158,7 @@ def create_document_chunks(
     Args:
         doc: The document object to create chunks from. It should have a text attribute and optionally an id and a metadata attribute.
         chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+        text_chunks: The text of the document already split into chunks, or None to split it here.
 
     Returns:
         A tuple of (doc_chunks, doc_id), where doc_chunks is a list of document chunks, each of which is a DocumentChunk object with an id, a document_id, a text, and a metadata attribute,
@@ -118,8 +171,9 @@ def create_document_chunks(
     # Generate a document id if not provided
     doc_id = doc.id or str(uuid.uuid4())
 
-    # Split the document text into chunks
-    text_chunks = get_text_chunks(doc.text, chunk_token_size)
+    # Split the document text into chunks, unless it was already done
+    if text_chunks is None:
+        text_chunks = get_text_chunks(doc.text, chunk_token_size)
 
     metadata = (
         DocumentChunkMetadata(**doc.metadata.__dict__)
@@ -147,57 +201,223 @@ def create_document_chunks(
     return doc_chunks, doc_id
 
 
-def get_document_chunks(
-    documents: List[Document], chunk_token_size: Optional[int]
+def get_embedding_batches(
+    texts: List[str],
+    max_batch_tokens: int = EMBEDDINGS_BATCH_TOKENS,
+    max_batch_size: int = EMBEDDINGS_BATCH_SIZE,
+) -> List[List[str]]:
+    """
+    Pack texts into consecutive batches bounded by a token budget and an item cap.
+
+    Args:
+        texts: The texts to pack.
+        max_batch_tokens: The maximum number of tokens in a batch. A text longer than this is sent in a batch of its own.
+        max_batch_size: The maximum number of texts in a batch.
+
+    Returns:
+        A list of batches of texts, which concatenated give back the input texts in order.
+    """
+    batches: List[List[str]] = []
+    batch: List[str] = []
+    batch_tokens = 0
+
+    token_counts = [len(tokens) for tokens in tokenizer.encode_ordinary_batch(texts)]
+    for text, num_tokens in zip(texts, token_counts):
+        # Start a new batch if adding this text would go over either limit
+        if batch and (
+            batch_tokens + num_tokens > max_batch_tokens
+            or len(batch) >= max_batch_size
+        ):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(text)
+        batch_tokens += num_tokens
+
+    if batch:
+        batches.append(batch)
+
+    return batches
+
+
+def _get_embedding_semaphore(max_concurrency: int) -> asyncio.Semaphore:
+    # Asyncio primitives are bound to the loop they are first used on
+    semaphores = _embedding_semaphores.setdefault(asyncio.get_running_loop(), {})
+    if max_concurrency not in semaphores:
+        semaphores[max_concurrency] = asyncio.Semaphore(max_concurrency)
+    return semaphores[max_concurrency]
+
+
+async def get_embeddings_in_batches(
+    texts: List[str],
+    max_batch_tokens: int = EMBEDDINGS_BATCH_TOKENS,
+    max_batch_size: int = EMBEDDINGS_BATCH_SIZE,
+    max_concurrency: int = EMBEDDINGS_MAX_CONCURRENCY,
+) -> List[List[float]]:
+    """
+    Embed a list of texts in token-bounded batches, with a bounded number of batches in flight at once.
+
+    The bound holds for the whole process: concurrent calls with the same max_concurrency share
+    one semaphore, so that concurrent upserts don't multiply the requests in flight.
+
+    Args:
+        texts: The texts to embed.
+        max_batch_tokens: The maximum number of tokens to send in each embeddings request.
+        max_batch_size: The maximum number of texts to send in each embeddings request.
+        max_concurrency: The maximum number of embeddings requests to run concurrently.
+
+    Returns:
+        A list of embeddings in the same order as the input texts.
+    """
+    semaphore = _get_embedding_semaphore(max(1, max_concurrency))
+
+    async def embed_batch(batch_texts: List[str]) -> List[List[float]]:
+        async with semaphore:
+            return await aget_embeddings(batch_texts)
+
+    # asyncio.gather returns results in the order of the batches, not of completion
+    batch_embeddings = await asyncio.gather(
+        *[
+            embed_batch(batch_texts)
+            for batch_texts in get_embedding_batches(
+                texts, max_batch_tokens, max_batch_size
+            )
+        ]
+    )
+
+    return [embedding for batch in batch_embeddings for embedding in batch]
+
+
+async def get_all_text_chunks(
+    texts: List[str],
+    chunk_token_size: Optional[int],
+    in_process_pool: Optional[bool] = None,
+) -> List[List[str]]:
+    """
+    Split several texts into chunks, in worker processes if they are large enough to be worth it.
+
+    Below CHUNKING_PROCESS_MIN_CHARS characters in total, the texts are chunked inline on the
+    calling thread. Above it, each text is chunked in the process pool, so the event loop stays
+    responsive and chunking uses all the cores.
+
+    Args:
+        texts: The texts to split into chunks.
+        chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+        in_process_pool: Whether to use the process pool, or None to decide from the size of the texts.
+
+    Returns:
+        A list with the text chunks of each input text, in order.
+    """
+    if in_process_pool is None:
+        in_process_pool = sum(len(text) for text in texts) >= CHUNKING_PROCESS_MIN_CHARS
+    if CHUNKING_PROCESSES <= 0 or not in_process_pool:
+        return [get_text_chunks(text, chunk_token_size) for text in texts]
+
+    loop = asyncio.get_running_loop()
+    process_pool = _get_process_pool()
+    try:
+        return list(
+            await asyncio.gather(
+                *[
+                    loop.run_in_executor(
+                        process_pool, get_text_chunks, text, chunk_token_size
+                    )
+                    for text in texts
+                ]
+            )
+        )
+    except BrokenProcessPool as e:
+        # A worker died, e.g. killed for using too much memory: start a new pool next time
+        logger.error(f"Chunking process pool is broken, chunking inline: {e}")
+        shutdown_process_pool()
+        return [get_text_chunks(text, chunk_token_size) for text in texts]
+
+
+async def create_all_document_chunks(
+    documents: List[Document],
+    chunk_token_size: Optional[int],
+    in_process_pool: Optional[bool] = None,
 ) -> Dict[str, List[DocumentChunk]]:
     """
-    Convert a list of documents into a dictionary from document id to list of document chunks.
+    Split a list of documents into chunks, without embedding them.
 
     Args:
-        documents: The list of documents to convert.
+        documents: The list of documents to split.
         chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+        in_process_pool: Whether to chunk in the process pool, or None to decide from the size of the documents.
 
     Returns:
-        A dictionary mapping each document id to a list of document chunks, each of which is a DocumentChunk object
-        with text, metadata, and embedding attributes.
+        A dictionary mapping each document id to a list of document chunks with text and metadata attributes.
     """
     # Initialize an empty dictionary of lists of chunks
     chunks: Dict[str, List[DocumentChunk]] = {}
 
-    # Initialize an empty list of all chunks
-    all_chunks: List[DocumentChunk] = []
+    # Split the text of every document into chunks
+    with time_stage("chunk"):
+        all_text_chunks = await get_all_text_chunks(
+            [doc.text for doc in documents], chunk_token_size, in_process_pool
+        )
 
     # Loop over each document and create chunks
-    for doc in documents:
-        doc_chunks, doc_id = create_document_chunks(doc, chunk_token_size)
-
-        # Append the chunks for this document to the list of all chunks
-        all_chunks.extend(doc_chunks)
+    for doc, text_chunks in zip(documents, all_text_chunks):
+        doc_chunks, doc_id = create_document_chunks(doc, chunk_token_size, text_chunks)
 
         # Add the list of chunks for this document to the dictionary with the document id as the key
         chunks[doc_id] = doc_chunks
 
-    # Check if there are no chunks
-    if not all_chunks:
-        return {}
+    return chunks
 
-    # Get all the embeddings for the document chunks in batches, using get_embeddings
-    embeddings: List[List[float]] = []
-    for i in range(0, len(all_chunks), EMBEDDINGS_BATCH_SIZE):
-        # Get the text of the chunks in the current batch
-        batch_texts = [
-            chunk.text for chunk in all_chunks[i : i + EMBEDDINGS_BATCH_SIZE]
-        ]
 
-        # Get the embeddings for the batch texts
-        batch_embeddings = get_embeddings(batch_texts)
+async def embed_document_chunks(chunks: List[DocumentChunk]) -> None:
+    """
+    Embed document chunks in place.
 
-        # Append the batch embeddings to the embeddings list
-        embeddings.extend(batch_embeddings)
+    Args:
+        chunks: The document chunks to embed. Their embedding attributes are set to the embeddings of their texts.
+    """
+    if not chunks:
+        return
+
+    # Get all the embeddings for the document chunks in batches, sending up to
+    # EMBEDDINGS_MAX_CONCURRENCY batches concurrently. If an embedding cache is
+    # configured, only the chunks that are not cached are sent.
+    texts = [chunk.text for chunk in chunks]
+    embedding_cache = get_embedding_cache()
+    with time_stage("embed"):
+        if embedding_cache is not None:
+            embeddings = await embedding_cache.get_or_embed(
+                texts, get_embeddings_in_batches
+            )
+        else:
+            embeddings = await get_embeddings_in_batches(texts)
 
     # Update the document chunk objects with the embeddings
-    for i, chunk in enumerate(all_chunks):
+    for i, chunk in enumerate(chunks):
         # Assign the embedding from the embeddings list to the chunk object
         chunk.embedding = embeddings[i]
 
+
+async def get_document_chunks(
+    documents: List[Document], chunk_token_size: Optional[int]
+) -> Dict[str, List[DocumentChunk]]:
+    """
+    Convert a list of documents into a dictionary from document id to list of document chunks.
+
+    Args:
+        documents: The list of documents to convert.
+        chunk_token_size: The target size of each chunk in tokens, or None to use the default CHUNK_SIZE.
+
+    Returns:
+        A dictionary mapping each document id to a list of document chunks, each of which is a DocumentChunk object
+        with text, metadata, and embedding attributes.
+    """
+    chunks = await create_all_document_chunks(documents, chunk_token_size)
+
+    # Check if there are no chunks
+    all_chunks = [chunk for doc_chunks in chunks.values() for chunk in doc_chunks]
+    if not all_chunks:
+        return {}
+
+    await embed_document_chunks(all_chunks)
+
     return chunks
@@ -0,0 +1,291 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import numpy as np
+from loguru import logger
+
+from services.metrics import EMBEDDING_CACHE_HITS, EMBEDDING_CACHE_MISSES
+from services.openai import get_embedding_model_id
+
+# Read environment variables for the embedding cache
+EMBEDDING_CACHE = os.environ.get("EMBEDDING_CACHE")  # "sqlite", "redis" or unset
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = int(
+    os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 1_000_000)
+)
+EMBEDDING_CACHE_REDIS_URL = os.environ.get(
+    "EMBEDDING_CACHE_REDIS_URL", "redis://localhost:6379"
+)
+EMBEDDING_CACHE_REDIS_PREFIX = os.environ.get("EMBEDDING_CACHE_REDIS_PREFIX", "emb")
+
+
+def embedding_cache_key(model: str, text: str) -> str:
+    """
+    Create the content-addressed cache key for a text embedded with a given model.
+
+    Args:
+        model: The name of the model or Azure deployment used to embed the text.
+        text: The embedded text.
+
+    Returns:
+        The hex sha256 digest of the model and text.
+    """
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+def _to_blob(embedding: List[float]) -> bytes:
+    return np.asarray(embedding, dtype=np.float32).tobytes()
+
+
+def _from_blob(blob: bytes) -> List[float]:
+    return np.frombuffer(blob, dtype=np.float32).tolist()
+
+
+class EmbeddingCache(ABC):
+    """
+    A persistent cache of embeddings keyed by the hash of the model and the embedded text.
+    """
+
+    # The label of the cache in the metrics
+    backend = "unknown"
+
+    def __init__(self, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    @abstractmethod
+    async def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        """
+        Look up the embeddings stored under the given keys.
+        Returns a list aligned with keys, with None for every key that is not cached.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    async def set_many(self, items: Dict[str, List[float]]) -> None:
+        """
+        Store embeddings by key, evicting the least recently used entries if the cache
+        grows beyond max_entries.
+        """
+        raise NotImplementedError
+
+    async def get_or_embed(
+        self,
+        texts: List[str],
+        embed: Callable[[List[str]], Awaitable[List[List[float]]]],
+    ) -> List[List[float]]:
+        """
+        Return the embeddings of texts, calling embed only for the texts that are not cached.
+
+        Args:
+            texts: The texts to embed.
+            embed: A coroutine function that embeds a list of texts, in order.
+
+        Returns:
+            A list of embeddings in the same order as the input texts.
+        """
+        model = get_embedding_model_id()
+        keys = [embedding_cache_key(model, text) for text in texts]
+        embeddings = await self.get_many(keys)
+
+        # Embed every missing text once, even if it appears several times in the input
+        missing: Dict[str, str] = {}
+        for key, text, embedding in zip(keys, texts, embeddings):
+            if embedding is None:
+                missing.setdefault(key, text)
+
+        num_misses = sum(1 for embedding in embeddings if embedding is None)
+        self.hits += len(texts) - num_misses
+        self.misses += num_misses
+        EMBEDDING_CACHE_HITS.labels(self.backend).inc(len(texts) - num_misses)
+        EMBEDDING_CACHE_MISSES.labels(self.backend).inc(num_misses)
+
+        if missing:
+            new_embeddings = dict(
+                zip(missing.keys(), await embed(list(missing.values())))
+            )
+            await self.set_many(new_embeddings)
+            embeddings = [
+                embedding if embedding is not None else new_embeddings[key]
+                for key, embedding in zip(keys, embeddings)
+            ]
+
+        return embeddings  # type: ignore
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Return the hit and miss counters of the cache.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class SQLiteEmbeddingCache(EmbeddingCache):
+    """
+    Embedding cache stored on local disk in SQLite, with embeddings as float32 blobs.
+    """
+
+    backend = "sqlite"
+
+    def __init__(
+        self,
+        path: str = EMBEDDING_CACHE_PATH,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        super().__init__(max_entries)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings "
+            "(key TEXT PRIMARY KEY, embedding BLOB NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_accessed_at ON embeddings (accessed_at)"
+        )
+        self._conn.commit()
+        (self._count,) = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+
+    def _get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        found: Dict[str, bytes] = {}
+        with self._lock:
+            # Stay well under SQLite's limit on the number of query parameters
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                placeholders = ",".join("?" * len(batch))
+                found.update(
+                    self._conn.execute(
+                        f"SELECT key, embedding FROM embeddings WHERE key IN ({placeholders})",
+                        batch,
+                    ).fetchall()
+                )
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET accessed_at = ? WHERE key = ?",
+                    [(now, key) for key in found],
+                )
+                self._conn.commit()
+        return [_from_blob(found[key]) if key in found else None for key in keys]
+
+    def _set_many(self, items: Dict[str, List[float]]) -> None:
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, embedding, accessed_at) VALUES (?, ?, ?)",
+                [(key, _to_blob(embedding), now) for key, embedding in items.items()],
+            )
+            self._count += self._conn.total_changes - before
+
+            # Evict the least recently used entries
+            excess = self._count - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+                self._count -= excess
+            self._conn.commit()
+
+    async def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        return await asyncio.to_thread(self._get_many, keys)
+
+    async def set_many(self, items: Dict[str, List[float]]) -> None:
+        await asyncio.to_thread(self._set_many, items)
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class RedisEmbeddingCache(EmbeddingCache):
+    """
+    Embedding cache shared between processes and hosts through Redis.
+    A sorted set of keys by last access time is used to evict the least recently used entries.
+    """
+
+    backend = "redis"
+
+    def __init__(
+        self,
+        url: str = EMBEDDING_CACHE_REDIS_URL,
+        prefix: str = EMBEDDING_CACHE_REDIS_PREFIX,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        import redis.asyncio as redis
+
+        super().__init__(max_entries)
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._lru_key = f"{prefix}:lru"
+
+    def _redis_key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    async def get_many(self, keys: List[str]) -> List[Optional[List[float]]]:
+        if not keys:
+            return []
+        blobs = await self.client.mget([self._redis_key(key) for key in keys])
+        found = {key: time.time() for key, blob in zip(keys, blobs) if blob is not None}
+        if found:
+            await self.client.zadd(self._lru_key, found)
+        return [_from_blob(blob) if blob is not None else None for blob in blobs]
+
+    async def set_many(self, items: Dict[str, List[float]]) -> None:
+        if not items:
+            return
+        now = time.time()
+        async with self.client.pipeline(transaction=False) as pipe:
+            pipe.mset(
+                {
+                    self._redis_key(key): _to_blob(embedding)
+                    for key, embedding in items.items()
+                }
+            )
+            pipe.zadd(self._lru_key, {key: now for key in items})
+            pipe.zcard(self._lru_key)
+            *_, count = await pipe.execute()
+
+        # Evict the least recently used entries
+        excess = count - self.max_entries
+        if excess > 0:
+            evicted = await self.client.zpopmin(self._lru_key, excess)
+            await self.client.delete(*[self._redis_key(key.decode()) for key, _ in evicted])
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Return the process-wide embedding cache selected by EMBEDDING_CACHE, or None if caching is disabled.
+    """
+    global _embedding_cache
+    if _embedding_cache is not None or not EMBEDDING_CACHE:
+        return _embedding_cache
+
+    match EMBEDDING_CACHE:
+        case "sqlite":
+            _embedding_cache = SQLiteEmbeddingCache()
+        case "redis":
+            _embedding_cache = RedisEmbeddingCache()
+        case _:
+            raise ValueError(
+                f"Unsupported embedding cache: {EMBEDDING_CACHE}. "
+                f"Try one of the following: sqlite or redis"
+            )
+    logger.info(f"Using {EMBEDDING_CACHE} embedding cache")
+    return _embedding_cache
@@ -0,0 +1,339 @@
+import asyncio
+import bisect
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Read environment variables for metrics
+METRICS_PROVIDER = os.environ.get("DATASTORE", "unknown")
+EVENT_LOOP_LAG_INTERVAL = float(os.environ.get("EVENT_LOOP_LAG_INTERVAL", 0.5))
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    """
+    A metric with optional labels, written in the Prometheus text exposition format.
+    """
+
+    type = ""
+
+    def __init__(self, name: str, help: str, label_names: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def _new_child(self) -> object:
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """
+        Return the child metric for the given label values, creating it on first use.
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(
+                    f"{self.name} expects labels {self.label_names}, got {values}"
+                )
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self, key: Tuple[str, ...], child) -> Iterator[str]:
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._samples(key, child))
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _samples(self, key, child) -> Iterator[str]:
+        labels = _format_labels(self.label_names, key)
+        yield f"{self.name}_total{labels} {_format_value(child.value)}"
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def _new_child(self) -> _Value:
+        return _Value()
+
+    def _samples(self, key, child) -> Iterator[str]:
+        labels = _format_labels(self.label_names, key)
+        yield f"{self.name}{labels} {_format_value(child.value)}"
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """
+        Context manager that observes the wall time spent in its body, including awaits.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self) -> _HistogramValue:
+        return _HistogramValue(self.buckets)
+
+    def _samples(self, key, child) -> Iterator[str]:
+        with child._lock:
+            counts = list(child.counts)
+            total = child.sum
+        names = self.label_names + ("le",)
+        cumulative = 0
+        for bound, count in zip(self.buckets + (math.inf,), counts):
+            cumulative += count
+            labels = _format_labels(names, key + (_format_value(bound),))
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.label_names, key)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {cumulative}"
+
+
+class Registry:
+    """
+    The metrics exposed on the scrape endpoint.
+    """
+
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        """
+        Return every metric in the Prometheus text exposition format.
+        """
+        return "\n".join(metric.expose() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+
+# The endpoint of the HTTP request being served, set by the server's metrics middleware, so
+# that the stages of a request are labelled with it. Work outside of a request gets "none".
+current_endpoint: ContextVar[str] = ContextVar("current_endpoint", default="none")
+
+STAGE_SECONDS: Histogram = REGISTRY.register(  # type: ignore
+    Histogram(
+        "retrieval_stage_seconds",
+        "Time spent in each stage of upserts and queries, by the endpoint they serve.",
+        ["stage", "provider", "endpoint"],
+    )
+)
+DATASTORE_OPERATION_SECONDS: Histogram = REGISTRY.register(  # type: ignore
+    Histogram(
+        "retrieval_datastore_operation_seconds",
+        "Latency of the datastore operations, including chunking and embedding.",
+        ["operation", "provider"],
+    )
+)
+DATASTORE_OPERATION_ERRORS: Counter = REGISTRY.register(  # type: ignore
+    Counter(
+        "retrieval_datastore_operation_errors",
+        "Number of failed datastore operations.",
+        ["operation", "provider"],
+    )
+)
+HTTP_REQUEST_SECONDS: Histogram = REGISTRY.register(  # type: ignore
+    Histogram(
+        "retrieval_http_request_seconds",
+        "Latency of the HTTP requests, by endpoint and status code.",
+        ["endpoint", "status"],
+    )
+)
+HTTP_REQUESTS_IN_FLIGHT: Gauge = REGISTRY.register(  # type: ignore
+    Gauge(
+        "retrieval_http_requests_in_flight",
+        "Number of HTTP requests being served, by endpoint.",
+        ["endpoint"],
+    )
+)
+EMBEDDING_CACHE_HITS: Counter = REGISTRY.register(  # type: ignore
+    Counter(
+        "retrieval_embedding_cache_hits",
+        "Number of chunk texts whose embedding was found in the embedding cache, by backend.",
+        ["backend"],
+    )
+)
+EMBEDDING_CACHE_MISSES: Counter = REGISTRY.register(  # type: ignore
+    Counter(
+        "retrieval_embedding_cache_misses",
+        "Number of chunk texts missing from the embedding cache, by backend.",
+        ["backend"],
+    )
+)
+QUERY_EMBEDDING_CACHE_HITS: Counter = REGISTRY.register(  # type: ignore
+    Counter(
+        "retrieval_query_embedding_cache_hits",
+        "Number of query strings whose embedding was found in the query embedding cache.",
+    )
+)
+QUERY_EMBEDDING_CACHE_MISSES: Counter = REGISTRY.register(  # type: ignore
+    Counter(
+        "retrieval_query_embedding_cache_misses",
+        "Number of query strings that had to be embedded.",
+    )
+)
+QUERY_EMBEDDING_CACHE_HIT_RATE: Gauge = REGISTRY.register(  # type: ignore
+    Gauge(
+        "retrieval_query_embedding_cache_hit_rate",
+        "Share of the query embedding cache lookups that were hits, since the start.",
+    )
+)
+QUERY_RESULT_CACHE_HITS: Counter = REGISTRY.register(  # type: ignore
+    Counter(
+        "retrieval_query_result_cache_hits",
+        "Number of queries answered from the query result cache.",
+    )
+)
+QUERY_RESULT_CACHE_MISSES: Counter = REGISTRY.register(  # type: ignore
+    Counter(
+        "retrieval_query_result_cache_misses",
+        "Number of queries missing from the query result cache.",
+    )
+)
+QUERY_RESULT_CACHE_HIT_RATE: Gauge = REGISTRY.register(  # type: ignore
+    Gauge(
+        "retrieval_query_result_cache_hit_rate",
+        "Share of the query result cache lookups that were hits, since the start.",
+    )
+)
+QUERY_RESULT_CACHE_GENERATION: Gauge = REGISTRY.register(  # type: ignore
+    Gauge(
+        "retrieval_query_result_cache_generation",
+        "Number of writes that invalidated the query result cache.",
+    )
+)
+EVENT_LOOP_LAG_SECONDS: Histogram = REGISTRY.register(  # type: ignore
+    Histogram(
+        "retrieval_event_loop_lag_seconds",
+        "How late the event loop wakes up a sleeping task, a measure of how long it is blocked.",
+    )
+)
+
+
+def time_stage(stage: str, provider: Optional[str] = None):
+    """
+    Context manager that records the time spent in a stage of an upsert or a query, labelled
+    with the endpoint in current_endpoint.
+
+    Args:
+        stage: The name of the stage, e.g. chunk, embed or provider_query.
+        provider: The datastore provider, or None for the one selected by DATASTORE.
+    """
+    return STAGE_SECONDS.labels(
+        stage, provider or METRICS_PROVIDER, current_endpoint.get()
+    ).time()
+
+
+async def monitor_event_loop_lag(interval: float = EVENT_LOOP_LAG_INTERVAL) -> None:
+    """
+    Measure how late the event loop wakes up from a sleep, every interval seconds, until cancelled.
+    """
+    loop = asyncio.get_running_loop()
+    lag = EVENT_LOOP_LAG_SECONDS.labels()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag.observe(max(0.0, loop.time() - start - interval))
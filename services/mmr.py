@@ -0,0 +1,91 @@
+import os
+from typing import List
+
+import numpy as np
+from loguru import logger
+
+from models.models import QueryResult, QueryWithEmbedding
+
+# Read environment variables for maximal marginal relevance
+MMR_CANDIDATES_FACTOR = int(
+    os.environ.get("MMR_CANDIDATES_FACTOR", 4)
+)  # the candidates fetched per result of a diversified query
+
+
+def mmr_candidates(top_k: int, factor: int = MMR_CANDIDATES_FACTOR) -> int:
+    """
+    Return the number of candidates to fetch for a diversified query of top_k results.
+    """
+    return top_k * max(factor, 1)
+
+
+def maximal_marginal_relevance(
+    query_embedding: np.ndarray,
+    embeddings: np.ndarray,
+    top_k: int,
+    diversity: float,
+) -> List[int]:
+    """
+    Select results by maximal marginal relevance (Carbonell and Goldstein, 1998): each
+    step picks the candidate with the best trade-off between its similarity to the query
+    and its highest similarity to the candidates already picked.
+
+    The similarities between the candidates are computed once, as a single matrix
+    product, and each step only updates the highest similarity of every candidate, so
+    selecting k of n candidates costs O(n^2 d + k n).
+
+    Args:
+        query_embedding: The embedding of the query.
+        embeddings: The embeddings of the candidates, one per row, best ranked first.
+        top_k: The number of candidates to select.
+        diversity: The weight of the similarity to the candidates already picked, from 0,
+            which keeps the order by relevance, to 1.
+
+    Returns:
+        The indices of the selected candidates, in the order they were picked.
+    """
+    n = min(top_k, len(embeddings))
+    if n <= 0:
+        return []
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms == 0, 1, norms)
+    query_norm = np.linalg.norm(query_embedding)
+    relevance = embeddings @ (query_embedding / (query_norm or 1))
+    similarities = embeddings @ embeddings.T
+
+    scores = (1 - diversity) * relevance
+    # The highest similarity of each candidate to the picked ones, dissimilar counts as 0
+    redundancy = np.zeros(len(embeddings), dtype=similarities.dtype)
+    selected: List[int] = []
+    available = np.ones(len(embeddings), dtype=bool)
+    for _ in range(n):
+        marginal = np.where(available, scores - diversity * redundancy, -np.inf)
+        best = int(np.argmax(marginal))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarities[best], out=redundancy)
+    return selected
+
+
+def diversify_result(result: QueryResult, query: QueryWithEmbedding) -> QueryResult:
+    """
+    Reorder and cut the candidates of a diversified query to its top_k results by
+    maximal marginal relevance, and drop their embeddings from the result.
+    """
+    top_k = query.top_k or 0
+    chunks = result.results
+    if any(chunk.embedding is None for chunk in chunks):
+        # The provider doesn't return vectors, keep the order by relevance
+        logger.debug("Skipping maximal marginal relevance, the results have no embeddings")
+        selected = list(range(min(top_k, len(chunks))))
+    else:
+        selected = maximal_marginal_relevance(
+            np.asarray(query.embedding, dtype=np.float32),
+            np.array([chunk.embedding for chunk in chunks], dtype=np.float32),
+            top_k,
+            query.diversity or 0.0,
+        )
+    return QueryResult(
+        query=result.query,
+        results=[chunks[i].copy(update={"embedding": None}) for i in selected],
+    )
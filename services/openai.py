@@ -1,12 +1,116 @@
-from typing import List
+from typing import Any, Dict, List, Optional
+import asyncio
+import aiohttp
 import openai
 import os
+import tiktoken
+from contextlib import asynccontextmanager
 from loguru import logger
 
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 
+from services.rate_limiter import RateLimiter, get_rate_limiter, wait_retry_after
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
+# The number of attempts made for each OpenAI call before giving up
+OPENAI_MAX_ATTEMPTS = int(os.environ.get("OPENAI_MAX_ATTEMPTS", 6))
+
+# Requests and tokens per minute limits of the embedding and chat models, 0 means no limit
+OPENAI_EMBEDDING_RPM = int(os.environ.get("OPENAI_EMBEDDING_RPM", 0))
+OPENAI_EMBEDDING_TPM = int(os.environ.get("OPENAI_EMBEDDING_TPM", 0))
+OPENAI_CHAT_RPM = int(os.environ.get("OPENAI_CHAT_RPM", 0))
+OPENAI_CHAT_TPM = int(os.environ.get("OPENAI_CHAT_TPM", 0))
+# The number of completion tokens a chat completion is assumed to use when pacing requests
+CHAT_COMPLETION_TOKENS_ESTIMATE = 500
+
+# Settings for the pooled, keep-alive HTTP session shared by the async OpenAI calls
+OPENAI_HTTP_POOL_SIZE = int(os.environ.get("OPENAI_HTTP_POOL_SIZE", 100))
+OPENAI_HTTP_KEEPALIVE_TIMEOUT = float(
+    os.environ.get("OPENAI_HTTP_KEEPALIVE_TIMEOUT", 30)
+)
+
+_session: Optional[aiohttp.ClientSession] = None
+_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+EMBEDDING_MODEL = "text-embedding-ada-002"
+
+
+def _get_embedding_model_kwargs() -> Dict[str, Any]:
+    # NOTE: Azure Open AI requires deployment id
+    deployment = os.environ.get("OPENAI_EMBEDDINGMODEL_DEPLOYMENTID")
+
+    if deployment == None:
+        return {"model": EMBEDDING_MODEL}
+    return {"deployment_id": deployment}
+
+
+def get_embedding_model_id() -> str:
+    """
+    Return the name of the model, or the Azure deployment, used to embed texts.
+    """
+    return os.environ.get("OPENAI_EMBEDDINGMODEL_DEPLOYMENTID") or EMBEDDING_MODEL
+
+
+tokenizer = tiktoken.get_encoding(
+    "cl100k_base"
+)  # The encoding scheme to use for counting tokens against the rate limits
+
+
+def _get_embedding_rate_limiter() -> RateLimiter:
+    return get_rate_limiter(
+        get_embedding_model_id(), OPENAI_EMBEDDING_RPM, OPENAI_EMBEDDING_TPM
+    )
+
+
+def _count_tokens(texts: List[str]) -> int:
+    return sum(len(tokens) for tokens in tokenizer.encode_ordinary_batch(texts))
+
+
+def _get_session() -> aiohttp.ClientSession:
+    """
+    Return the process-wide aiohttp session, creating it on first use.
+
+    The session is bound to the event loop it was created on, so a new one is created
+    if the previous session was closed or belongs to another loop.
+    """
+    global _session, _session_loop
+    loop = asyncio.get_running_loop()
+    if _session is None or _session.closed or _session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=OPENAI_HTTP_POOL_SIZE,
+            keepalive_timeout=OPENAI_HTTP_KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(connector=connector)
+        _session_loop = loop
+    return _session
+
+
+@asynccontextmanager
+async def _pooled_session():
+    # openai picks up the session from a context variable, so it has to be set in the
+    # task making the request rather than once at startup
+    token = openai.aiosession.set(_get_session())
+    try:
+        yield
+    finally:
+        openai.aiosession.reset(token)
+
+
+async def close_session() -> None:
+    """
+    Close the pooled HTTP session used by the async OpenAI calls, if any.
+    """
+    global _session, _session_loop
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+    _session_loop = None
+
+
+@retry(
+    wait=wait_retry_after(wait_random_exponential(min=1, max=20)),
+    stop=stop_after_attempt(OPENAI_MAX_ATTEMPTS),
+)
 def get_embeddings(texts: List[str]) -> List[List[float]]:
     """
     Embed texts using OpenAI's ada model.
@@ -21,14 +125,43 @@ def get_embeddings(texts: List[str]) -> List[List[float]]:
         Exception: If the OpenAI API call fails.
     """
     # Call the OpenAI API to get the embeddings
-    # NOTE: Azure Open AI requires deployment id
-    deployment = os.environ.get("OPENAI_EMBEDDINGMODEL_DEPLOYMENTID")
+    with _get_embedding_rate_limiter().limit_sync(_count_tokens(texts)):
+        response = openai.Embedding.create(
+            input=texts, **_get_embedding_model_kwargs()
+        )
+
+    # Extract the embedding data from the response
+    data = response["data"]  # type: ignore
+
+    # Return the embeddings as a list of lists of floats
+    return [result["embedding"] for result in data]
 
-    response = {}
-    if deployment == None:
-        response = openai.Embedding.create(input=texts, model="text-embedding-ada-002")
-    else:
-        response = openai.Embedding.create(input=texts, deployment_id=deployment)
+
+@retry(
+    wait=wait_retry_after(wait_random_exponential(min=1, max=20)),
+    stop=stop_after_attempt(OPENAI_MAX_ATTEMPTS),
+)
+async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+    """
+    Embed texts using OpenAI's ada model without blocking the event loop.
+
+    Requests go through a pooled keep-alive HTTP session shared by the whole process,
+    and are paced to stay under the rate limits of the embedding model.
+
+    Args:
+        texts: The list of texts to embed.
+
+    Returns:
+        A list of embeddings, each of which is a list of floats.
+
+    Raises:
+        Exception: If the OpenAI API call fails.
+    """
+    async with _get_embedding_rate_limiter().limit(_count_tokens(texts)):
+        async with _pooled_session():
+            response = await openai.Embedding.acreate(
+                input=texts, **_get_embedding_model_kwargs()
+            )
 
     # Extract the embedding data from the response
     data = response["data"]  # type: ignore
@@ -37,7 +170,10 @@ def get_embeddings(texts: List[str]) -> List[List[float]]:
     return [result["embedding"] for result in data]
 
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
+@retry(
+    wait=wait_retry_after(wait_random_exponential(min=1, max=20)),
+    stop=stop_after_attempt(OPENAI_MAX_ATTEMPTS),
+)
 def get_chat_completion(
     messages,
     model="gpt-3.5-turbo",  # use "gpt-4" for better results
@@ -58,17 +194,25 @@ def get_chat_completion(
     """
     # call the OpenAI chat completion API with the given messages
     # Note: Azure Open AI requires deployment id
+    rate_limiter = get_rate_limiter(
+        deployment_id or model, OPENAI_CHAT_RPM, OPENAI_CHAT_TPM
+    )
+    tokens = (
+        _count_tokens([message["content"] for message in messages])
+        + CHAT_COMPLETION_TOKENS_ESTIMATE
+    )
     response = {}
-    if deployment_id == None:
-        response = openai.ChatCompletion.create(
-            model=model,
-            messages=messages,
-        )
-    else:
-        response = openai.ChatCompletion.create(
-            deployment_id = deployment_id,
-            messages=messages,
-        )
+    with rate_limiter.limit_sync(tokens):
+        if deployment_id == None:
+            response = openai.ChatCompletion.create(
+                model=model,
+                messages=messages,
+            )
+        else:
+            response = openai.ChatCompletion.create(
+                deployment_id = deployment_id,
+                messages=messages,
+            )
 
 
     choices = response["choices"]  # type: ignore
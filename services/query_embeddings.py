@@ -0,0 +1,165 @@
+import asyncio
+import os
+from typing import Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+from services.cache import LRUCache
+from services.metrics import (
+    QUERY_EMBEDDING_CACHE_HIT_RATE,
+    QUERY_EMBEDDING_CACHE_HITS,
+    QUERY_EMBEDDING_CACHE_MISSES,
+    time_stage,
+)
+from services.openai import aget_embeddings, get_embedding_model_id
+
+# Read environment variables for the query embedding cache
+QUERY_EMBEDDING_CACHE_SIZE = int(os.environ.get("QUERY_EMBEDDING_CACHE_SIZE", 1024))
+QUERY_EMBEDDING_CACHE_TTL = float(os.environ.get("QUERY_EMBEDDING_CACHE_TTL", 0)) or None
+
+# Read environment variables for batching query embeddings across concurrent requests
+QUERY_EMBEDDING_BATCH_WINDOW_MS = float(
+    os.environ.get("QUERY_EMBEDDING_BATCH_WINDOW_MS", 5)
+)  # 0 sends every request's queries on their own
+QUERY_EMBEDDING_MAX_BATCH_SIZE = int(
+    os.environ.get("QUERY_EMBEDDING_MAX_BATCH_SIZE", 128)
+)
+
+query_embedding_cache: LRUCache[List[float]] = LRUCache(
+    max_size=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL
+)
+
+
+class QueryEmbeddingBatcher:
+    """
+    Collects the query strings of concurrent requests over a short window and embeds them
+    with a single embeddings request, then hands each request back its own embeddings.
+    """
+
+    def __init__(
+        self,
+        window_ms: float = QUERY_EMBEDDING_BATCH_WINDOW_MS,
+        max_batch_size: int = QUERY_EMBEDDING_MAX_BATCH_SIZE,
+    ):
+        """
+        Args:
+            window_ms: How long to wait for more queries after the first one of a batch, in milliseconds.
+            max_batch_size: The number of distinct queries that sends a batch before the window ends,
+                and the most sent in one embeddings request.
+        """
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks, hold the batches in flight
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts as part of the current batch.
+
+        Args:
+            texts: The texts to embed.
+
+        Returns:
+            A list of embeddings in the same order as the input texts.
+        """
+        if self.window_ms <= 0:
+            return await aget_embeddings(texts)
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for text in texts:
+            future = loop.create_future()
+            self._pending.setdefault(text, []).append(future)
+            futures.append(future)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_ms / 1000, self._flush)
+
+        return list(await asyncio.gather(*futures))
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        # A single request can bring more texts than a batch holds
+        texts = list(pending)
+        batch_size = max(1, self.max_batch_size)
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(texts), batch_size):
+            batch = {text: pending[text] for text in texts[start : start + batch_size]}
+            task = loop.create_task(self._embed_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, pending: Dict[str, List[asyncio.Future]]) -> None:
+        texts = list(pending.keys())
+        try:
+            embeddings = await aget_embeddings(texts)
+        except Exception as e:
+            logger.error(f"Error embedding a batch of {len(texts)} queries: {e}")
+            for futures in pending.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+            return
+
+        for text, embedding in zip(texts, embeddings):
+            for future in pending[text]:
+                if not future.done():
+                    future.set_result(embedding)
+
+
+query_embedding_batcher = QueryEmbeddingBatcher()
+
+
+def normalize_query(text: str) -> str:
+    """
+    Normalize a query string for caching by collapsing runs of whitespace and stripping it.
+    """
+    return " ".join(text.split())
+
+
+async def get_query_embeddings(queries: List[str]) -> List[List[float]]:
+    """
+    Embed query strings, serving repeated queries from an in-process LRU cache and
+    batching the others with the queries of concurrent requests.
+
+    Args:
+        queries: The query strings to embed.
+
+    Returns:
+        A list of embeddings in the same order as the input queries.
+    """
+    model = get_embedding_model_id()
+    keys: List[Tuple[str, str]] = [(model, normalize_query(query)) for query in queries]
+
+    embeddings: Dict[Tuple[str, str], List[float]] = {}
+    # Embed every uncached query once, even if it appears several times in the request
+    missing: Dict[Tuple[str, str], None] = {}
+    for key in keys:
+        if key in embeddings or key in missing:
+            continue
+        embedding = query_embedding_cache.get(key)
+        if embedding is None:
+            missing[key] = None
+        else:
+            embeddings[key] = embedding
+    QUERY_EMBEDDING_CACHE_HITS.labels().inc(len(embeddings))
+    QUERY_EMBEDDING_CACHE_MISSES.labels().inc(len(missing))
+    QUERY_EMBEDDING_CACHE_HIT_RATE.labels().set(query_embedding_cache.stats()["hit_rate"])
+
+    if missing:
+        with time_stage("query_embed"):
+            new_embeddings = await query_embedding_batcher.embed(
+                [text for _, text in missing]
+            )
+        for key, embedding in zip(missing, new_embeddings):
+            query_embedding_cache.set(key, embedding)
+            embeddings[key] = embedding
+
+    return [embeddings[key] for key in keys]
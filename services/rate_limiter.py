@@ -0,0 +1,257 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+
+from loguru import logger
+from openai.error import RateLimitError
+from tenacity import RetryCallState
+from tenacity.wait import wait_base
+
+# The number of concurrent requests a rate limiter starts with and never goes above
+OPENAI_MAX_CONCURRENCY = int(os.environ.get("OPENAI_MAX_CONCURRENCY", 32))
+# The number of successful requests after which a rate limiter allows one more concurrent request
+CONCURRENCY_INCREASE_INTERVAL = 10
+
+
+def get_retry_after(exception: Optional[BaseException]) -> Optional[float]:
+    """
+    Read the number of seconds to wait before retrying from the headers of an OpenAI error.
+
+    Args:
+        exception: The exception raised by the OpenAI call.
+
+    Returns:
+        The number of seconds to wait, or None if the error has no Retry-After header.
+    """
+    headers = getattr(exception, "headers", None)
+    if not headers:
+        return None
+    try:
+        # Azure OpenAI sends the delay in milliseconds as well
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after") is not None:
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class wait_retry_after(wait_base):
+    """
+    Tenacity wait strategy that honors the Retry-After header of the failed request,
+    and otherwise falls back to another strategy.
+    """
+
+    def __init__(self, fallback: wait_base):
+        self.fallback = fallback
+
+    def __call__(self, retry_state: RetryCallState) -> float:
+        exception = retry_state.outcome.exception() if retry_state.outcome else None
+        retry_after = get_retry_after(exception)
+        if retry_after is not None:
+            # Jitter so that the requests paused together don't all retry at once
+            return retry_after + random.uniform(0, 1)
+        return self.fallback(retry_state)
+
+
+class RateLimiter:
+    """
+    Paces requests to an OpenAI model or deployment to stay under its requests and tokens per minute limits.
+
+    Each limit is a token bucket holding up to one minute worth of capacity. Requests reserve
+    capacity before they are sent and wait until the bucket would have refilled enough. A rate
+    limited response pauses every caller for its Retry-After delay and halves the number of
+    concurrent requests allowed, which then grows back by one every CONCURRENCY_INCREASE_INTERVAL
+    successful requests.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = 0,
+        tokens_per_minute: int = 0,
+        max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+    ):
+        """
+        Args:
+            requests_per_minute: The requests per minute limit, or 0 for no limit.
+            tokens_per_minute: The tokens per minute limit, or 0 for no limit.
+            max_concurrency: The maximum number of requests in flight at once.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max(1, max_concurrency)
+        self.concurrency = self.max_concurrency
+
+        self._lock = threading.Lock()
+        self._available_requests = float(requests_per_minute)
+        self._available_tokens = float(tokens_per_minute)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._successes = 0
+
+        self._in_flight = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._condition_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        if self.requests_per_minute:
+            self._available_requests = min(
+                float(self.requests_per_minute),
+                self._available_requests + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            self._available_tokens = min(
+                float(self.tokens_per_minute),
+                self._available_tokens + elapsed * self.tokens_per_minute / 60,
+            )
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserve capacity for a request of the given number of tokens.
+
+        Args:
+            tokens: The number of tokens the request is expected to use.
+
+        Returns:
+            The number of seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            wait = max(0.0, self._paused_until - now)
+            if self.requests_per_minute:
+                self._available_requests -= 1
+                if self._available_requests < 0:
+                    wait = max(
+                        wait, -self._available_requests * 60 / self.requests_per_minute
+                    )
+            if self.tokens_per_minute:
+                self._available_tokens -= tokens
+                if self._available_tokens < 0:
+                    wait = max(wait, -self._available_tokens * 60 / self.tokens_per_minute)
+            return wait
+
+    def _pause_remaining(self) -> float:
+        with self._lock:
+            return max(0.0, self._paused_until - time.monotonic())
+
+    def on_success(self) -> None:
+        """
+        Record a successful request, growing the concurrency back towards its maximum.
+        """
+        with self._lock:
+            self._successes += 1
+            if (
+                self.concurrency < self.max_concurrency
+                and self._successes >= CONCURRENCY_INCREASE_INTERVAL
+            ):
+                self.concurrency += 1
+                self._successes = 0
+
+    def on_rate_limited(self, retry_after: Optional[float]) -> None:
+        """
+        Record a rate limited request: pause every caller for retry_after seconds, if given,
+        and halve the concurrency.
+        """
+        with self._lock:
+            if retry_after:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+            self.concurrency = max(1, self.concurrency // 2)
+            self._successes = 0
+            logger.warning(
+                f"Rate limited by OpenAI, retrying after {retry_after}s "
+                f"with a concurrency of {self.concurrency}"
+            )
+
+    def _get_condition(self) -> asyncio.Condition:
+        # asyncio primitives are bound to the event loop they are first used on
+        loop = asyncio.get_running_loop()
+        if self._condition is None or self._condition_loop is not loop:
+            self._condition = asyncio.Condition()
+            self._condition_loop = loop
+            self._in_flight = 0
+        return self._condition
+
+    @asynccontextmanager
+    async def limit(self, tokens: int):
+        """
+        Async context manager that waits for capacity and a concurrency slot before
+        the request in its body is sent.
+
+        Args:
+            tokens: The number of tokens the request is expected to use.
+        """
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self._in_flight < self.concurrency)
+            self._in_flight += 1
+
+        try:
+            await asyncio.sleep(self.reserve(tokens))
+            # Another request may have been rate limited while this one was waiting
+            while (pause := self._pause_remaining()) > 0:
+                await asyncio.sleep(pause)
+            try:
+                yield
+            except RateLimitError as e:
+                self.on_rate_limited(get_retry_after(e))
+                raise
+            self.on_success()
+        finally:
+            async with condition:
+                self._in_flight -= 1
+                condition.notify_all()
+
+    @contextmanager
+    def limit_sync(self, tokens: int):
+        """
+        Context manager that waits for capacity before the blocking request in its body is sent.
+        Blocking callers are paced by the requests and tokens per minute limits, but don't count
+        towards the concurrency limit.
+
+        Args:
+            tokens: The number of tokens the request is expected to use.
+        """
+        time.sleep(self.reserve(tokens))
+        while (pause := self._pause_remaining()) > 0:
+            time.sleep(pause)
+        try:
+            yield
+        except RateLimitError as e:
+            self.on_rate_limited(get_retry_after(e))
+            raise
+        self.on_success()
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(
+    name: str, requests_per_minute: int = 0, tokens_per_minute: int = 0
+) -> RateLimiter:
+    """
+    Return the process-wide rate limiter for a model or deployment, creating it on first use.
+
+    Args:
+        name: The name of the model or deployment.
+        requests_per_minute: The requests per minute limit of the model, or 0 for no limit.
+        tokens_per_minute: The tokens per minute limit of the model, or 0 for no limit.
+
+    Returns:
+        The rate limiter shared by every call to the model.
+    """
+    with _rate_limiters_lock:
+        if name not in _rate_limiters:
+            _rate_limiters[name] = RateLimiter(requests_per_minute, tokens_per_minute)
+        return _rate_limiters[name]
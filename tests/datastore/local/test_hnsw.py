@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from datastore.local.hnsw import HNSWIndex
+from datastore.local.vector_store import LocalVectorStore, normalize
+
+
+def clustered_vectors(n: int, dimension: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((20, dimension))
+    vectors = centers[rng.integers(0, 20, n)] + 0.5 * rng.standard_normal((n, dimension))
+    return normalize(vectors.astype(np.float32))
+
+
+def recall(found, expected) -> float:
+    hits = [
+        len({row for row, _ in rows} & set(expected_rows.tolist()))
+        for rows, expected_rows in zip(found, expected)
+    ]
+    return sum(hits) / expected.size
+
+
+def test_hnsw_finds_the_nearest_neighbors():
+    vectors = clustered_vectors(2000, 32, seed=0)
+    queries = clustered_vectors(50, 32, seed=1)
+    expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :10]
+    index = HNSWIndex(m=16, ef_construction=100, ef_search=64)
+
+    # Rows are added incrementally
+    index.add(vectors[:1000], 0)
+    index.add(vectors, 1000)
+    found = index.search(vectors, queries, [10] * 50)
+
+    assert index.size == 2000
+    assert recall(found, expected) > 0.95
+    for rows in found:
+        scores = [score for _, score in rows]
+        assert scores == sorted(scores, reverse=True)
+    # The neighbor lists are bounded by m
+    assert index.counts0.max() <= 32
+
+
+def test_hnsw_skips_deleted_rows():
+    vectors = clustered_vectors(500, 16, seed=2)
+    index = HNSWIndex(m=8, ef_construction=32)
+    index.add(vectors, 0)
+
+    index.remove(range(0, 500, 2))
+    found = index.search(vectors, vectors[:10], [5] * 10)
+
+    assert all(row % 2 == 1 for rows in found for row, _ in rows)
+    assert all(len(rows) == 5 for rows in found)
+    with pytest.raises(ValueError):
+        index.add(vectors, 10)
+
+
+def test_hnsw_save_and_load(tmp_path):
+    vectors = clustered_vectors(300, 16, seed=3)
+    index = HNSWIndex(m=8, ef_construction=32)
+    index.add(vectors, 0)
+    index.remove([0])
+    index.save(str(tmp_path / "hnsw.npz"))
+
+    loaded = HNSWIndex(m=8, ef_construction=32)
+    assert loaded.load(str(tmp_path / "hnsw.npz"))
+    assert loaded.search(vectors, vectors[:5], [3] * 5) == index.search(
+        vectors, vectors[:5], [3] * 5
+    )
+    # A graph built with other parameters isn't used
+    assert not HNSWIndex(m=4).load(str(tmp_path / "hnsw.npz"))
+
+
+def test_store_answers_unfiltered_queries_from_the_index(tmp_path, monkeypatch):
+    vectors = clustered_vectors(200, 16, seed=4)
+    ids = [str(i) for i in range(200)]
+    metadata = [{"document_id": f"doc-{i % 10}"} for i in range(200)]
+    store = LocalVectorStore(str(tmp_path), index=HNSWIndex(m=8))
+    store.add(ids[:150], vectors[:150], [""] * 150, metadata[:150])
+    store.save_index()
+    store.add(ids[150:], vectors[150:], [""] * 50, metadata[150:])
+    store.delete_documents(["doc-3"])
+
+    # The saved index is brought up to date with the rows added and deleted since
+    reloaded = LocalVectorStore(str(tmp_path), index=HNSWIndex(m=8))
+    assert reloaded.index is not None and reloaded.index.size == 200
+
+    rows = reloaded.filter_rows(document_id="doc-5")
+    found = reloaded.search(vectors[:2], [200, 5], [None, rows])
+    assert {row for row, _ in found[0]} <= {i for i in range(200) if i % 10 != 3}
+    assert len(found[0]) > 150
+    assert {row for row, _ in found[1]} <= {i for i in range(200) if i % 10 == 5}
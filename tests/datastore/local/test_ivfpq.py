@@ -0,0 +1,87 @@
+import numpy as np
+
+from datastore.local.ivfpq import IVFPQIndex
+from datastore.local.vector_store import LocalVectorStore, normalize
+
+
+def clustered_vectors(n: int, dimension: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((20, dimension))
+    vectors = centers[rng.integers(0, 20, n)] + 0.5 * rng.standard_normal((n, dimension))
+    return normalize(vectors.astype(np.float32))
+
+
+def recall(found, expected) -> float:
+    hits = [
+        len({row for row, _ in rows} & set(expected_rows.tolist()))
+        for rows, expected_rows in zip(found, expected)
+    ]
+    return sum(hits) / expected.size
+
+
+def test_ivfpq_trains_once_enough_rows_are_added():
+    vectors = clustered_vectors(3000, 32, seed=0)
+    queries = clustered_vectors(50, 32, seed=1)
+    expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :10]
+    index = IVFPQIndex(nlist=16, m=8, nprobe=8, rerank=8, train_rows=2000)
+
+    index.add(vectors[:1000], 0)
+    assert not index.ready
+    index.add(vectors, 1000)
+    assert index.ready and index.size == 3000
+
+    found = index.search(vectors, queries, [10] * 50)
+    assert recall(found, expected) > 0.9
+    # The re-ranked scores are the exact similarities
+    row, score = found[0][0]
+    assert np.isclose(score, vectors[row] @ queries[0], atol=1e-5)
+    # Searching more lists and re-ranking more candidates finds more neighbors
+    coarse = index.search(vectors, queries, [10] * 50, nprobe=1, rerank=0)
+    assert recall(coarse, expected) < recall(found, expected)
+    # A vector is stored as m bytes and a row id
+    assert sum(rows.nbytes + codes.nbytes for rows, codes in index._lists) == 3000 * (8 + 4)
+
+
+def test_ivfpq_skips_deleted_rows():
+    vectors = clustered_vectors(1000, 24, seed=2)
+    index = IVFPQIndex(nlist=8, m=6, nprobe=8, train_rows=500)
+    index.add(vectors, 0)
+
+    index.remove(range(0, 1000, 2))
+    found = index.search(vectors, vectors[:10], [5] * 10)
+
+    assert all(row % 2 == 1 for rows in found for row, _ in rows)
+    assert all(len(rows) == 5 for rows in found)
+
+
+def test_ivfpq_save_and_load(tmp_path):
+    vectors = clustered_vectors(600, 20, seed=3)
+    index = IVFPQIndex(nlist=8, m=4, nprobe=2, train_rows=500)
+    index.add(vectors, 0)
+    index.remove([0])
+    index.save(str(tmp_path / "ivfpq.npz"))
+
+    loaded = IVFPQIndex(nlist=8, m=4, nprobe=2, train_rows=500)
+    assert loaded.load(str(tmp_path / "ivfpq.npz"))
+    assert loaded.ready and loaded.size == 600
+    assert loaded.search(vectors, vectors[:5], [3] * 5) == index.search(
+        vectors, vectors[:5], [3] * 5
+    )
+    loaded.add(np.concatenate([vectors, vectors[:10]]), 600)
+    assert loaded.search(vectors, vectors[:5], [3] * 5)
+    assert not IVFPQIndex(nlist=16, m=4).load(str(tmp_path / "ivfpq.npz"))
+
+
+def test_store_uses_exact_search_until_the_index_is_trained(tmp_path):
+    vectors = clustered_vectors(300, 16, seed=4)
+    ids = [str(i) for i in range(300)]
+    metadata = [{"document_id": f"doc-{i}"} for i in range(300)]
+    store = LocalVectorStore(str(tmp_path), index=IVFPQIndex(nlist=4, m=4, train_rows=200))
+
+    store.add(ids[:100], vectors[:100], [""] * 100, metadata[:100])
+    assert not store.index.ready
+    assert store.search(vectors[:1], [1], [None])[0][0][0] == 0
+
+    store.add(ids[100:], vectors[100:], [""] * 200, metadata[100:])
+    assert store.index.ready
+    assert store.search(vectors[150:151], [1], [None])[0][0][0] == 150
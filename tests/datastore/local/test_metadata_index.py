@@ -0,0 +1,106 @@
+import numpy as np
+
+from datastore.local import metadata_index, vector_store
+from datastore.local.hnsw import HNSWIndex
+from datastore.local.metadata_index import MetadataIndex
+from datastore.local.vector_store import LocalVectorStore, normalize
+
+
+def test_metadata_index_intersects_fields_and_dates(monkeypatch):
+    # Merge the dates into the sorted column after every few rows
+    monkeypatch.setattr(metadata_index, "MIN_DATES_TAIL", 7)
+    index = MetadataIndex(["document_id", "source", "author"])
+    metadata = [
+        {
+            "document_id": f"doc-{row // 10}",
+            "source": ["email", "file", "chat"][row % 3],
+            "author": "alice" if row % 2 else None,
+            "created_at_ts": None if row % 5 == 0 else 1000 + row,
+        }
+        for row in range(100)
+    ]
+    for start in range(0, 100, 9):
+        index.add(start, metadata[start : start + 9])
+    dates = np.array(
+        [np.nan if row["created_at_ts"] is None else row["created_at_ts"] for row in metadata]
+    )
+
+    def match(**filter):
+        start_ts, end_ts = filter.pop("start_ts", None), filter.pop("end_ts", None)
+        rows = index.match(filter, start_ts, end_ts, dates)
+        return None if rows is None else rows.tolist()
+
+    def expected(predicate):
+        return [row for row, row_metadata in enumerate(metadata) if predicate(row_metadata)]
+
+    assert match() is None
+    assert match(source=None) is None
+    assert match(document_id="doc-3") == list(range(30, 40))
+    assert match(document_id="missing") == []
+    assert match(source="file", author="alice") == expected(
+        lambda row: row["source"] == "file" and row["author"] == "alice"
+    )
+    # Rows without a date never match a date range
+    in_range = lambda row: row["created_at_ts"] is not None and 1020 <= row["created_at_ts"] <= 1050
+    assert match(start_ts=1020, end_ts=1050) == expected(in_range)
+    assert match(start_ts=1019.5, end_ts=1050.5) == expected(in_range)
+    assert match(end_ts=1003) == [1, 2, 3]
+    assert match(source="chat", start_ts=1020, end_ts=1050) == expected(
+        lambda row: row["source"] == "chat" and in_range(row)
+    )
+
+
+def test_store_filters_use_the_metadata_index(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = normalize(rng.standard_normal((500, 16)).astype(np.float32))
+    ids = [str(row) for row in range(500)]
+    metadata = [
+        {"document_id": f"doc-{row % 50}", "source": "file" if row % 4 else "email"}
+        for row in range(500)
+    ]
+    store = LocalVectorStore(str(tmp_path))
+    store.add(ids, vectors, [""] * 500, metadata)
+    store.delete_documents(["doc-2"])
+
+    rows = store.filter_rows(source="email")
+    assert rows.tolist() == [row for row in range(0, 500, 4) if row % 50 != 2]
+    found = store.search(vectors[:1], [5], [rows])[0]
+    scores = vectors[rows] @ vectors[0]
+    assert [row for row, _ in found] == rows[np.argsort(-scores)[:5]].tolist()
+
+    # Replaced rows no longer match
+    store.add(["0"], vectors[:1], [""], [{"document_id": "doc-9", "source": "file"}])
+    assert 0 not in store.filter_rows(source="email").tolist()
+    assert store.filter_rows(document_id="doc-9").tolist()[-1] == 500
+
+
+def test_broad_filters_post_filter_the_index(tmp_path, monkeypatch):
+    rng = np.random.default_rng(1)
+    vectors = normalize(rng.standard_normal((2000, 16)).astype(np.float32))
+    ids = [str(row) for row in range(2000)]
+    metadata = [{"source": "file" if row % 2 else "email"} for row in range(2000)]
+    store = LocalVectorStore(str(tmp_path), index=HNSWIndex(m=16, ef_construction=100))
+    store.add(ids, vectors, [""] * 2000, metadata)
+    rows = store.filter_rows(source="file")
+    expected = store.search(vectors[:20], [5] * 20, [rows] * 20)
+
+    monkeypatch.setattr(vector_store, "PREFILTER_MAX_ROWS", 100)
+    searches = []
+    search = store.index.search
+    monkeypatch.setattr(
+        store.index, "search", lambda *args: searches.append(args) or search(*args)
+    )
+    found = store.search(vectors[:20], [5] * 20, [rows] * 20)
+
+    assert len(searches) == 20
+    assert all(row % 2 == 1 for results in found for row, _ in results)
+    hits = sum(
+        len({row for row, _ in a} & {row for row, _ in b}) for a, b in zip(found, expected)
+    )
+    assert hits / 100 > 0.9
+    # When too few of the results of the index match, the matching rows are searched
+    monkeypatch.setattr(store.index, "search", lambda vectors, queries, top_k: [[]])
+    exact = (vectors[rows] @ vectors[0]).argsort()[::-1][:5]
+    assert [row for row, _ in store.search(vectors[:1], [5], [rows])[0]] == rows[
+        exact
+    ].tolist()
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from datastore.local.quantized import (
+    POPCOUNT,
+    BinaryIndex,
+    Int8Index,
+    pack_signs,
+    popcount,
+)
+from datastore.local.vector_store import normalize
+
+
+def clustered_vectors(n: int, dimension: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((20, dimension))
+    vectors = centers[rng.integers(0, 20, n)] + 0.5 * rng.standard_normal((n, dimension))
+    return normalize(vectors.astype(np.float32))
+
+
+def recall(found, expected) -> float:
+    hits = [
+        len({row for row, _ in rows} & set(expected_rows.tolist()))
+        for rows, expected_rows in zip(found, expected)
+    ]
+    return sum(hits) / expected.size
+
+
+def test_int8_index_is_close_to_exact_search():
+    vectors = clustered_vectors(20000, 64, seed=0)
+    queries = clustered_vectors(20, 64, seed=1)
+    expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :10]
+    index = Int8Index(rescore=4)
+    index.add(vectors[:5000], 0)
+    index.add(vectors, 5000)
+
+    assert index.memory_bytes == 20000 * (64 + 4 + 1)
+    assert recall(index.search(vectors, queries, [10] * 20, rescore=0), expected) > 0.9
+    found = index.search(vectors, queries, [10] * 20)
+    assert recall(found, expected) == 1
+    row, score = found[0][0]
+    assert score == pytest.approx(float(vectors[row] @ queries[0]), abs=1e-5)
+
+
+def test_binary_index_rescoring_trades_latency_for_recall():
+    vectors = clustered_vectors(5000, 128, seed=2)
+    queries = clustered_vectors(20, 128, seed=3)
+    expected = np.argsort(-(queries @ vectors.T), axis=1)[:, :10]
+    index = BinaryIndex()
+    index.add(vectors, 0)
+
+    assert index.memory_bytes == 5000 * (128 // 8 + 1)
+    recalls = [
+        recall(index.search(vectors, queries, [10] * 20, rescore=rescore), expected)
+        for rescore in [0, 10, 100]
+    ]
+    assert recalls == sorted(recalls) and recalls[-1] > 0.8
+
+
+def test_quantized_index_skips_deleted_rows_and_reloads(tmp_path):
+    vectors = clustered_vectors(1000, 40, seed=4)
+    index = Int8Index()
+    index.add(vectors, 0)
+    index.remove(range(0, 1000, 2))
+    found = index.search(vectors, vectors[:10], [5] * 10)
+    assert all(row % 2 == 1 for rows in found for row, _ in rows)
+    assert all(len(rows) == 5 for rows in found)
+
+    index.save(str(tmp_path / "int8.npz"))
+    loaded = Int8Index()
+    assert loaded.load(str(tmp_path / "int8.npz"))
+    assert loaded.size == 1000
+    assert loaded.search(vectors, vectors[:10], [5] * 10) == found
+    loaded.add(np.concatenate([vectors, vectors[:1]]), 1000)
+    assert loaded.search(vectors, vectors[1:2], [1])[0][0][0] == 1
+
+
+def test_pack_signs_and_popcount():
+    vectors = np.array([[1.0] * 70, [-1.0] * 70], dtype=np.float32)
+    bits = pack_signs(vectors)
+
+    assert bits.shape == (2, 2) and bits.dtype == np.uint64
+    assert popcount(bits).sum(axis=1).tolist() == [70, 0]
+    # The table used without np.bitwise_count agrees
+    assert POPCOUNT[bits.view(np.uint8)].sum() == 70
@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+from datastore.local.sharded import ShardedVectorStore, shard_of
+from datastore.local.vector_store import LocalVectorStore
+
+
+def rows(count: int, documents: int):
+    rng = np.random.default_rng(0)
+    ids = [f"doc{i % documents}_{i}" for i in range(count)]
+    vectors = rng.standard_normal((count, 16)).astype(np.float32)
+    metadata = [{"document_id": f"doc{i % documents}", "author": f"a{i % 3}"} for i in range(count)]
+    return ids, vectors, ids, metadata
+
+
+@pytest.fixture
+def sharded(tmp_path):
+    store = ShardedVectorStore(str(tmp_path / "sharded"), shards=3)
+    yield store
+    store.close()
+
+
+def test_sharded_store_matches_a_single_store(tmp_path, sharded):
+    single = LocalVectorStore(str(tmp_path / "single"), snapshot_interval=0)
+    ids, vectors, texts, metadata = rows(300, 20)
+    single.add(ids, vectors, texts, metadata)
+    sharded.add(ids, vectors, texts, metadata)
+    queries = np.random.default_rng(1).standard_normal((4, 16)).astype(np.float32)
+    filters = [None, {"author": "a1"}, {"document_id": "doc3"}, None]
+
+    expected = single.query(queries, [10, 5, 20, 0], filters, [False, False, False, True])
+    found = sharded.query(queries, [10, 5, 20, 0], filters, [False, False, False, True])
+
+    assert sharded.count == 300
+    assert [[match.id for match in matches] for matches in found] == [
+        [match.id for match in matches] for matches in expected
+    ]
+    assert found[0][0].score == pytest.approx(expected[0][0].score)
+    assert found[0][0].metadata == expected[0][0].metadata
+    assert len(found[2]) == 15
+
+
+def test_sharded_store_routes_documents_to_their_shard(tmp_path, sharded):
+    ids, vectors, texts, metadata = rows(60, 6)
+    sharded.add(ids, vectors, texts, metadata)
+
+    counts = sharded._broadcast("count")
+    for shard, count in enumerate(counts):
+        owned = [i for i in range(60) if shard_of(metadata[i]["document_id"], 3) == shard]
+        assert count == len(owned)
+
+    sharded.delete_documents(["doc1", "doc2"])
+    sharded.delete_ids(["doc3_3"])
+    sharded.delete_matching({"author": "a0", "document_id": "doc0"})
+    assert sharded.count == 60 - 20 - 1 - 10
+
+    with pytest.raises(ValueError):
+        sharded.add(["bad"], np.zeros((1, 4), dtype=np.float32), [""], [{}])
+    # The shards still answer after an error
+    assert sharded.count == 29
+
+    sharded.clear()
+    assert sharded.count == 0
+
+
+def test_shard_count_is_fixed(tmp_path):
+    store = ShardedVectorStore(str(tmp_path), shards=2)
+    ids, vectors, texts, metadata = rows(10, 4)
+    store.add(ids, vectors, texts, metadata)
+    store.close()
+
+    with pytest.raises(ValueError):
+        ShardedVectorStore(str(tmp_path), shards=3)
+    reloaded = ShardedVectorStore(str(tmp_path), shards=2)
+    assert reloaded.count == 10
+    reloaded.close()
@@ -0,0 +1,141 @@
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from datastore.local import vector_store as vector_store_module
+from datastore.local.snapshot import SNAPSHOT_FILE
+from datastore.local.vector_store import ROWS_FILE, VECTORS_FILE, LocalVectorStore
+
+
+def add(store, start, count, document_id=None):
+    rng = np.random.default_rng(start)
+    ids = [str(i) for i in range(start, start + count)]
+    store.add(
+        ids,
+        rng.standard_normal((count, 8)).astype(np.float32),
+        [f"text {id}" for id in ids],
+        [
+            {"document_id": document_id or f"doc{i % 3}", "created_at_ts": 1000 + i}
+            for i in range(start, start + count)
+        ],
+    )
+
+
+def test_start_loads_the_snapshot_and_replays_the_log_tail(tmp_path, monkeypatch):
+    store = LocalVectorStore(str(tmp_path), snapshot_interval=0)
+    add(store, 0, 30)
+    store.delete_ids(["1"])
+    assert store.snapshot()
+    assert not store.snapshot()
+    # Writes after the snapshot are only in the log
+    add(store, 30, 10, document_id="late")
+    store.delete_ids(["2", "31"])
+    add(store, 0, 1)
+
+    replayed = []
+    replay = LocalVectorStore._replay
+
+    def spy(self, offset):
+        replayed.append(offset)
+        return replay(self, offset)
+
+    monkeypatch.setattr(LocalVectorStore, "_replay", spy)
+    reloaded = LocalVectorStore(str(tmp_path), snapshot_interval=0)
+
+    assert replayed == [store._snapshot_log_size] and replayed[0] > 0
+    assert reloaded.count == store.count == 37
+    assert reloaded.get_row(40) == store.get_row(40)
+    assert reloaded.get_row(5) == store.get_row(5)
+    queries = np.random.default_rng(7).standard_normal((3, 8)).astype(np.float32)
+    assert reloaded.search(queries, [5] * 3, [None] * 3) == store.search(
+        queries, [5] * 3, [None] * 3
+    )
+    assert reloaded.filter_rows(document_id="doc1").tolist() == (
+        store.filter_rows(document_id="doc1").tolist()
+    )
+    assert reloaded.filter_rows(document_id="late").tolist() == [30] + list(range(32, 40))
+    assert reloaded.filter_rows(start_ts=1005, end_ts=1010).tolist() == (
+        store.filter_rows(start_ts=1005, end_ts=1010).tolist()
+    )
+    # The reloaded store keeps taking writes on top of the snapshot
+    add(reloaded, 100, 5)
+    assert reloaded.count == 42
+
+
+def test_clear_removes_the_snapshot(tmp_path):
+    store = LocalVectorStore(str(tmp_path), snapshot_interval=0)
+    add(store, 0, 10)
+    assert store.snapshot()
+    store.clear()
+    add(store, 50, 2)
+
+    assert not os.path.exists(tmp_path / SNAPSHOT_FILE)
+    reloaded = LocalVectorStore(str(tmp_path), snapshot_interval=0)
+    assert reloaded.count == 2
+    assert reloaded.get_row(0)[0] == "50"
+
+
+def test_clear_keeps_the_maps_of_running_searches_readable(tmp_path):
+    store = LocalVectorStore(str(tmp_path), snapshot_interval=0)
+    add(store, 0, 10)
+    # What a search that started before the clear holds
+    vectors, texts = store._vectors, store._texts
+    expected = np.array(vectors), bytes(texts)
+
+    store.clear()
+
+    assert store.count == 0
+    assert np.array_equal(vectors, expected[0]) and bytes(texts) == expected[1]
+    assert os.path.getsize(tmp_path / VECTORS_FILE) == 0
+    add(store, 50, 2)
+    assert LocalVectorStore(str(tmp_path), snapshot_interval=0).count == 2
+
+
+def test_log_entries_ahead_of_the_vectors_are_dropped(tmp_path):
+    store = LocalVectorStore(str(tmp_path), snapshot_interval=0)
+    add(store, 0, 2)
+    # A crash where the log entry reached the disk but not the vectors it refers to
+    with open(tmp_path / ROWS_FILE, "a") as f:
+        entry = {
+            "op": "add",
+            "ids": ["x"],
+            "metadata": [{}],
+            "text_offsets": [0],
+            "text_lengths": [0],
+        }
+        f.write(json.dumps(entry) + "\n")
+
+    reloaded = LocalVectorStore(str(tmp_path), snapshot_interval=0)
+
+    assert reloaded.count == 2
+    assert os.path.getsize(tmp_path / VECTORS_FILE) == 2 * 8 * 4
+
+
+def test_concurrent_writes_share_fsyncs(tmp_path, monkeypatch):
+    store = LocalVectorStore(str(tmp_path), snapshot_interval=0)
+    add(store, 0, 1)
+    syncs = []
+    fsync = os.fsync
+
+    def slow_fsync(fd):
+        syncs.append(fd)
+        time.sleep(0.01)
+        fsync(fd)
+
+    monkeypatch.setattr(vector_store_module.os, "fsync", slow_fsync)
+    threads = [
+        threading.Thread(target=add, args=(store, 10 * (i + 1), 1)) for i in range(16)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert store.count == 17
+    # Each batch fsyncs the log, the vectors and the texts once
+    assert len(syncs) < 3 * 16
+    assert store._synced_log_size == store._log_size
@@ -0,0 +1,231 @@
+from typing import Dict, Iterator, List
+
+import numpy as np
+import pytest
+
+from datastore.local.vector_store import ROWS_FILE, VECTORS_FILE, LocalVectorStore
+from datastore.middleware import apply_middleware
+from datastore.providers.local_datastore import LocalDataStore
+from models.models import (
+    DocumentChunk,
+    DocumentChunkMetadata,
+    DocumentMetadataFilter,
+    QueryWithEmbedding,
+    Source,
+)
+
+DIMENSION = 8
+
+
+def embedding(seed: int) -> List[float]:
+    return np.random.default_rng(seed).standard_normal(DIMENSION).tolist()
+
+
+@pytest.fixture
+def document_chunks() -> Dict[str, List[DocumentChunk]]:
+    return {
+        "first-doc": [
+            DocumentChunk(
+                id=f"first-doc_{i}",
+                text=f"Lorem ipsum {i}",
+                metadata=DocumentChunkMetadata(
+                    document_id="first-doc",
+                    source=Source.email,
+                    created_at="2023-04-03",
+                ),
+                embedding=embedding(i),
+            )
+            for i in range(3)
+        ],
+        "second-doc": [
+            DocumentChunk(
+                id=f"second-doc_{i}",
+                text=f"Dolor sit amet {i} é",
+                metadata=DocumentChunkMetadata(
+                    document_id="second-doc",
+                    author="Max",
+                    created_at="2023-04-05",
+                ),
+                embedding=embedding(10 + i),
+            )
+            for i in range(3)
+        ],
+    }
+
+
+@pytest.fixture
+def datastore(tmp_path) -> Iterator[LocalDataStore]:
+    datastore = LocalDataStore(str(tmp_path))
+    yield datastore
+    datastore.close()
+
+
+@pytest.mark.asyncio
+async def test_query_returns_the_nearest_chunks(datastore, document_chunks):
+    assert await datastore._upsert(document_chunks) == ["first-doc", "second-doc"]
+
+    results = await datastore._query(
+        [
+            QueryWithEmbedding(query="first", embedding=embedding(1), top_k=2),
+            QueryWithEmbedding(query="second", embedding=embedding(12), top_k=10),
+        ]
+    )
+
+    assert results[0].results[0].id == "first-doc_1"
+    assert results[0].results[0].score == pytest.approx(1.0)
+    assert results[0].results[0].text == "Lorem ipsum 1"
+    assert results[0].results[0].metadata.source == Source.email
+    assert len(results[0].results) == 2
+    assert results[1].results[0].id == "second-doc_2"
+    assert results[1].results[0].text == "Dolor sit amet 2 é"
+    assert len(results[1].results) == 6
+    scores = [result.score for result in results[1].results]
+    assert scores == sorted(scores, reverse=True)
+    assert results[0].results[0].embedding is None
+
+
+@pytest.mark.asyncio
+async def test_query_returns_embeddings_when_asked(datastore, document_chunks):
+    await datastore._upsert(document_chunks)
+
+    results = await datastore._query(
+        [
+            QueryWithEmbedding(
+                query="first", embedding=embedding(1), top_k=1, include_embeddings=True
+            )
+        ]
+    )
+
+    # The store keeps normalized vectors
+    expected = np.array(embedding(1))
+    assert results[0].results[0].embedding == pytest.approx(
+        (expected / np.linalg.norm(expected)).tolist(), abs=1e-6
+    )
+
+
+@pytest.mark.asyncio
+async def test_query_applies_filters(datastore, document_chunks):
+    await datastore._upsert(document_chunks)
+
+    def query(filter: DocumentMetadataFilter) -> QueryWithEmbedding:
+        return QueryWithEmbedding(
+            query="q", embedding=embedding(1), top_k=10, filter=filter
+        )
+
+    results = await datastore._query(
+        [
+            query(DocumentMetadataFilter(author="Max")),
+            query(DocumentMetadataFilter(source=Source.email, document_id="first-doc")),
+            query(DocumentMetadataFilter(start_date="2023-04-04")),
+            query(DocumentMetadataFilter(end_date="2023-04-04", author="Max")),
+        ]
+    )
+
+    assert {r.id for r in results[0].results} == {f"second-doc_{i}" for i in range(3)}
+    assert {r.id for r in results[1].results} == {f"first-doc_{i}" for i in range(3)}
+    assert {r.id for r in results[2].results} == {f"second-doc_{i}" for i in range(3)}
+    assert results[3].results == []
+
+
+@pytest.mark.asyncio
+async def test_deletes(datastore, document_chunks):
+    await datastore._upsert(document_chunks)
+
+    await datastore._delete_chunks({"first-doc": ["first-doc_0"]})
+    assert datastore.store.count == 5
+    await datastore.delete_documents(["second-doc"])
+    assert datastore.store.count == 2
+    await datastore._delete(filter=DocumentMetadataFilter(source=Source.email))
+    assert datastore.store.count == 0
+
+    await datastore._upsert(document_chunks)
+    await datastore._delete(delete_all=True)
+    results = await datastore._query(
+        [QueryWithEmbedding(query="q", embedding=embedding(1), top_k=3)]
+    )
+    assert results[0].results == []
+
+
+@pytest.mark.asyncio
+async def test_store_is_reloaded_from_disk(tmp_path, document_chunks):
+    datastore = LocalDataStore(str(tmp_path))
+    await datastore._upsert(document_chunks)
+    await datastore.delete_documents(["first-doc"])
+    # Upserting an existing id replaces its row
+    await datastore._upsert({"second-doc": document_chunks["second-doc"][:1]})
+
+    reloaded = LocalDataStore(str(tmp_path))
+
+    assert reloaded.store.count == 3
+    results = await reloaded._query(
+        [QueryWithEmbedding(query="q", embedding=embedding(10), top_k=10)]
+    )
+    assert [r.id for r in results[0].results][0] == "second-doc_0"
+    assert len(results[0].results) == 3
+
+
+def test_incomplete_writes_are_dropped_on_load(tmp_path):
+    store = LocalVectorStore(str(tmp_path))
+    vectors = np.eye(4, dtype=np.float32)
+    store.add(["a", "b"], vectors[:2], ["a", "b"], [{}, {}])
+    # A crash after the vectors were written but before the log entry
+    with open(tmp_path / VECTORS_FILE, "ab") as f:
+        f.write(vectors[2:].tobytes())
+    with open(tmp_path / ROWS_FILE, "a") as f:
+        f.write('{"op": "add", "ids": ["c"')
+
+    reloaded = LocalVectorStore(str(tmp_path))
+    reloaded.add(["d"], vectors[3:], ["d"], [{}])
+
+    assert reloaded.count == 3
+    assert reloaded.search(vectors[3:], [1], [None]) == [[(2, pytest.approx(1.0))]]
+    assert reloaded.get_row(2)[:2] == ("d", "d")
+
+
+def test_search_merges_blocks(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((1000, 16)).astype(np.float32)
+    queries = rng.standard_normal((5, 16)).astype(np.float32)
+    store = LocalVectorStore(str(tmp_path), block_rows=64)
+    store.add([str(i) for i in range(1000)], vectors, [""] * 1000, [{}] * 1000)
+
+    results = store.search(queries, [10] * 5, [None] * 5)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(queries @ normalized.T), axis=1)[:, :10]
+    assert [[row for row, _ in result] for result in results] == expected.tolist()
+
+
+@pytest.mark.asyncio
+async def test_sharded_datastore(tmp_path, document_chunks):
+    datastore = LocalDataStore(str(tmp_path), shards=2)
+    try:
+        await datastore._upsert(document_chunks)
+        results = await datastore._query(
+            [
+                QueryWithEmbedding(query="q", embedding=embedding(11), top_k=4),
+                QueryWithEmbedding(
+                    query="q",
+                    embedding=embedding(11),
+                    top_k=4,
+                    filter=DocumentMetadataFilter(author="Max"),
+                ),
+            ]
+        )
+        assert results[0].results[0].id == "second-doc_1"
+        assert len(results[0].results) == 4
+        assert {r.metadata.document_id for r in results[1].results} == {"second-doc"}
+
+        await datastore.delete_documents(["second-doc"])
+        await datastore.delete(filter=DocumentMetadataFilter(source=Source.email))
+        assert datastore.store.count == 0
+    finally:
+        datastore.close()
+
+
+def test_close_stops_the_shard_workers_through_the_middleware(tmp_path):
+    datastore = apply_middleware(LocalDataStore(str(tmp_path), shards=2), "metrics,retry")
+
+    datastore.close()
+
+    assert not any(process.is_alive() for process in datastore.store._processes)
@@ -62,3 +62,26 @@ async def test_redis_filter_query(redis_datastore):
 async def test_redis_delete_docs(redis_datastore):
     res = await redis_datastore.delete(ids=["docs"])
     assert res
+
+
+@pytest.mark.asyncio
+async def test_redis_delete_documents(redis_datastore):
+    chunks = {
+        doc_id: [
+            DocumentChunk(
+                id=f"{doc_id}_{i}",
+                text=f"Lorem ipsum {i}",
+                embedding=create_embedding(i, 5),
+                metadata=DocumentChunkMetadata(document_id=doc_id),
+            )
+            for i in range(3)
+        ]
+        for doc_id in ["bulk-doc-1", "bulk-doc-2", "bulk-doc-3"]
+    }
+    await redis_datastore._upsert(chunks)
+
+    assert await redis_datastore._delete_documents(["bulk-doc-1", "bulk-doc-2"])
+
+    assert await redis_datastore._find_document_keys(["bulk-doc-1", "bulk-doc-2"]) == []
+    assert len(await redis_datastore._find_document_keys(["bulk-doc-3"])) == 3
+    await redis_datastore._delete_documents(["bulk-doc-3"])
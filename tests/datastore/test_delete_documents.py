@@ -0,0 +1,72 @@
+from typing import Dict, List, Optional
+
+import pytest
+
+from datastore.datastore import DataStore
+from datastore.upsert_manifest import DocumentManifest, MemoryUpsertManifest
+from models.models import (
+    DocumentChunk,
+    DocumentMetadataFilter,
+    QueryResult,
+    QueryWithEmbedding,
+)
+
+
+class RecordingDataStore(DataStore):
+    """
+    Records the calls to _delete.
+    """
+
+    def __init__(self):
+        self.deletes: List[dict] = []
+
+    async def _upsert(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        return list(chunks)
+
+    async def _query(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
+        raise NotImplementedError
+
+    async def _delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        self.deletes.append(
+            {"ids": ids, "document_id": filter.document_id if filter else None}
+        )
+        return True
+
+
+class BulkDeletingDataStore(RecordingDataStore):
+    async def _delete_documents(self, document_ids: List[str]) -> bool:
+        return await self._delete(ids=document_ids)
+
+
+@pytest.mark.asyncio
+async def test_delete_documents_falls_back_to_one_delete_per_document():
+    datastore = RecordingDataStore()
+    datastore.upsert_manifest = None
+
+    assert await datastore.delete_documents(["a", "b"])
+
+    assert datastore.deletes == [
+        {"ids": None, "document_id": "a"},
+        {"ids": None, "document_id": "b"},
+    ]
+
+
+@pytest.mark.asyncio
+async def test_delete_documents_uses_the_bulk_path_and_invalidates_the_manifest():
+    datastore = BulkDeletingDataStore()
+    datastore.upsert_manifest = MemoryUpsertManifest()
+    manifest = DocumentManifest(document_hash="hash", chunks={})
+    await datastore.upsert_manifest.set_many({"a": manifest, "c": manifest})
+
+    assert await datastore.delete_documents([])
+    assert datastore.deletes == []
+
+    assert await datastore.delete_documents(["a", "b"])
+
+    assert datastore.deletes == [{"ids": ["a", "b"], "document_id": None}]
+    assert list(await datastore.upsert_manifest.get_many(["a", "b", "c"])) == ["c"]
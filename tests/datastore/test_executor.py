@@ -0,0 +1,55 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+import pytest
+
+from datastore.executor import BlockingExecutor, get_max_concurrency
+
+request_id: contextvars.ContextVar[str] = contextvars.ContextVar("request_id")
+
+
+@pytest.mark.asyncio
+async def test_blocking_calls_run_in_parallel_up_to_the_limit():
+    executor = BlockingExecutor("test", max_concurrency=2)
+    lock = threading.Lock()
+    running = 0
+    peak = 0
+
+    def blocking_call(i: int) -> int:
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.05)
+        with lock:
+            running -= 1
+        return i
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[executor.run(blocking_call, i) for i in range(4)])
+
+    assert results == [0, 1, 2, 3]
+    assert peak == 2
+    # Two rounds of two calls rather than four calls in a row
+    assert time.perf_counter() - start < 0.15
+
+
+@pytest.mark.asyncio
+async def test_blocking_calls_keep_the_context_and_raise_their_errors():
+    executor = BlockingExecutor("test", max_concurrency=1)
+
+    def fail(message: str) -> None:
+        raise ValueError(f"{message} for {request_id.get()}")
+
+    request_id.set("request-1")
+    with pytest.raises(ValueError, match="lookup failed for request-1"):
+        await executor.run(fail, message="lookup failed")
+
+
+def test_max_concurrency_per_provider(monkeypatch):
+    monkeypatch.setenv("PINECONE_MAX_CONCURRENCY", "3")
+
+    assert get_max_concurrency("pinecone") == 3
+    assert get_max_concurrency("chroma") == 1
@@ -0,0 +1,198 @@
+from typing import Dict, List, Optional
+
+import pytest
+
+from datastore.datastore import DataStore
+from datastore.upsert_manifest import MemoryUpsertManifest, SQLiteUpsertManifest
+from models.models import (
+    Document,
+    DocumentChunk,
+    DocumentMetadataFilter,
+    QueryResult,
+    QueryWithEmbedding,
+)
+from services import chunks as chunks_service
+
+CHUNK_TOKEN_SIZE = 50
+
+
+class FakeDataStore(DataStore):
+    """
+    Keeps chunks in a dictionary and records every write.
+    """
+
+    def __init__(self):
+        self.chunks: Dict[str, DocumentChunk] = {}
+        self.written: List[str] = []
+
+    async def _upsert(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        for doc_chunks in chunks.values():
+            for chunk in doc_chunks:
+                assert chunk.embedding is not None
+                self.chunks[chunk.id] = chunk
+                self.written.append(chunk.id)
+        return list(chunks.keys())
+
+    async def _query(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
+        raise NotImplementedError
+
+    async def _delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        document_ids = set(ids or [])
+        if filter and filter.document_id:
+            document_ids.add(filter.document_id)
+        self.chunks = {
+            chunk_id: chunk
+            for chunk_id, chunk in self.chunks.items()
+            if not delete_all and chunk.metadata.document_id not in document_ids
+        }
+        return True
+
+    def texts(self, document_id: str) -> List[str]:
+        return sorted(
+            chunk.text
+            for chunk in self.chunks.values()
+            if chunk.metadata.document_id == document_id
+        )
+
+
+class ChunkDeletingDataStore(FakeDataStore):
+    async def _delete_chunks(self, chunk_ids: Dict[str, List[str]]) -> bool:
+        for doc_chunk_ids in chunk_ids.values():
+            for chunk_id in doc_chunk_ids:
+                del self.chunks[chunk_id]
+        return True
+
+
+def paragraphs(*names: str) -> str:
+    return " ".join(
+        f"This is the paragraph about {name}. " * 8 + f"It ends the {name} part."
+        for name in names
+    )
+
+
+async def expected_texts(text: str) -> List[str]:
+    chunks = await chunks_service.create_all_document_chunks(
+        [Document(id="expected", text=text)], CHUNK_TOKEN_SIZE
+    )
+    return sorted(chunk.text for chunk in chunks["expected"])
+
+
+@pytest.fixture(autouse=True)
+def fake_embeddings(monkeypatch):
+    embedded: List[str] = []
+
+    async def get_embeddings_in_batches(texts: List[str]) -> List[List[float]]:
+        embedded.extend(texts)
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(
+        chunks_service, "get_embeddings_in_batches", get_embeddings_in_batches
+    )
+    return embedded
+
+
+@pytest.fixture
+def datastore() -> FakeDataStore:
+    datastore = ChunkDeletingDataStore()
+    datastore.upsert_manifest = MemoryUpsertManifest()
+    return datastore
+
+
+@pytest.mark.asyncio
+async def test_unchanged_documents_are_skipped(datastore, fake_embeddings):
+    documents = [Document(id="doc", text=paragraphs("apples", "pears"))]
+
+    assert await datastore.upsert(documents, CHUNK_TOKEN_SIZE) == ["doc"]
+    num_written = len(datastore.written)
+    num_embedded = len(fake_embeddings)
+    assert num_written > 1
+
+    assert await datastore.upsert(documents, CHUNK_TOKEN_SIZE) == ["doc"]
+    assert len(datastore.written) == num_written
+    assert len(fake_embeddings) == num_embedded
+
+
+@pytest.mark.asyncio
+async def test_only_changed_chunks_are_written(datastore, fake_embeddings):
+    text = paragraphs("apples", "pears", "plums", "figs")
+    await datastore.upsert([Document(id="doc", text=text)], CHUNK_TOKEN_SIZE)
+    old_chunk_ids = set(datastore.chunks)
+    datastore.written.clear()
+    fake_embeddings.clear()
+
+    new_text = paragraphs("apples", "pears", "cherries", "figs")
+    await datastore.upsert([Document(id="doc", text=new_text)], CHUNK_TOKEN_SIZE)
+
+    assert datastore.texts("doc") == await expected_texts(new_text)
+    assert 0 < len(datastore.written) < len(datastore.chunks)
+    assert fake_embeddings == [datastore.chunks[id].text for id in datastore.written]
+    # Writing a new chunk never overwrites a chunk that is kept
+    assert not set(datastore.written) & old_chunk_ids
+
+
+@pytest.mark.asyncio
+async def test_repeated_chunks_are_matched_one_to_one(datastore):
+    await datastore.upsert(
+        [Document(id="doc", text=paragraphs("apples", "apples", "pears"))],
+        CHUNK_TOKEN_SIZE,
+    )
+    new_text = paragraphs("apples", "apples", "apples")
+    await datastore.upsert([Document(id="doc", text=new_text)], CHUNK_TOKEN_SIZE)
+
+    assert datastore.texts("doc") == await expected_texts(new_text)
+
+
+@pytest.mark.asyncio
+async def test_providers_without_chunk_deletes_rewrite_changed_documents(
+    fake_embeddings,
+):
+    datastore = FakeDataStore()
+    datastore.upsert_manifest = MemoryUpsertManifest()
+    await datastore.upsert(
+        [Document(id="doc", text=paragraphs("apples", "pears"))], CHUNK_TOKEN_SIZE
+    )
+    datastore.written.clear()
+
+    new_text = paragraphs("apples", "plums")
+    await datastore.upsert([Document(id="doc", text=new_text)], CHUNK_TOKEN_SIZE)
+
+    assert datastore.texts("doc") == await expected_texts(new_text)
+    assert len(datastore.written) == len(datastore.chunks)
+
+
+@pytest.mark.asyncio
+async def test_delete_invalidates_the_manifest(datastore, fake_embeddings):
+    documents = [
+        Document(id="first", text=paragraphs("apples")),
+        Document(id="second", text=paragraphs("pears")),
+    ]
+    await datastore.upsert(documents, CHUNK_TOKEN_SIZE)
+
+    await datastore.delete(ids=["first"])
+    await datastore.upsert(documents, CHUNK_TOKEN_SIZE)
+    assert datastore.texts("first") == await expected_texts(paragraphs("apples"))
+
+    await datastore.delete(delete_all=True)
+    await datastore.upsert(documents, CHUNK_TOKEN_SIZE)
+    assert datastore.texts("second") == await expected_texts(paragraphs("pears"))
+
+
+@pytest.mark.asyncio
+async def test_sqlite_manifest_round_trips(tmp_path):
+    manifest = SQLiteUpsertManifest(path=str(tmp_path / "manifest.sqlite3"))
+    datastore = ChunkDeletingDataStore()
+    datastore.upsert_manifest = manifest
+    documents = [Document(id="doc", text=paragraphs("apples", "pears"))]
+    await datastore.upsert(documents, CHUNK_TOKEN_SIZE)
+
+    manifests = await manifest.get_many(["doc", "missing"])
+    assert list(manifests) == ["doc"]
+    assert set(manifests["doc"].chunks) == set(datastore.chunks)
+
+    await manifest.delete_many(["doc"])
+    assert await manifest.get_many(["doc"]) == {}
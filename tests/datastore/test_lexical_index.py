@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from datastore.lexical_index import BM25Index, LexicalIndex, tokenize
+from models.models import DocumentChunk, DocumentChunkMetadata, DocumentMetadataFilter
+
+
+def make_chunk(id: str, text: str, document_id: str = "doc") -> DocumentChunk:
+    return DocumentChunk(
+        id=id, text=text, metadata=DocumentChunkMetadata(document_id=document_id)
+    )
+
+
+def test_tokenize_keeps_codes_whole():
+    assert tokenize("Error ABC-123 in v2.1") == [
+        "error",
+        "abc-123",
+        "abc",
+        "123",
+        "in",
+        "v2.1",
+        "v2",
+        "1",
+    ]
+
+
+def test_bm25_ranks_exact_code_first():
+    index = BM25Index()
+    index.add("a", "the part number is ABC-124", DocumentChunkMetadata())
+    index.add("b", "order ABC-123 shipped with part ABC-124", DocumentChunkMetadata())
+    index.add("c", "nothing to see here", DocumentChunkMetadata())
+
+    matches = index.search("ABC-123", 3)
+
+    assert matches[0][0] == "b"
+    assert "c" not in [id for id, _ in matches]
+
+
+def test_maxscore_search_matches_exhaustive_scoring():
+    rng = np.random.default_rng(0)
+    words = [f"w{i}" for i in range(300)]
+    # A Zipf-like vocabulary, so that some terms have long posting lists
+    weights = 1 / np.arange(1, len(words) + 1)
+    weights /= weights.sum()
+    index = BM25Index()
+    for i in range(2000):
+        index.add(
+            str(i), " ".join(rng.choice(words, size=30, p=weights)), DocumentChunkMetadata()
+        )
+    index.remove([str(i) for i in range(0, 2000, 7)])
+
+    for query in ["w0 w1 w250", "w3 w40 w41 w299", "w5"]:
+        matches = index.search(query, 10)
+        # A filter that matches everything turns off the pruning
+        exhaustive = index.search(query, 10, DocumentMetadataFilter())
+        assert [id for id, _ in matches] == [id for id, _ in exhaustive]
+        assert np.allclose([s for _, s in matches], [s for _, s in exhaustive])
+        assert all(int(id) % 7 for id, _ in matches)
+
+
+@pytest.mark.asyncio
+async def test_lexical_index_follows_deletes_and_reloads(tmp_path):
+    path = str(tmp_path / "lexical.sqlite3")
+    index = LexicalIndex(path)
+    await index.chunks_written(
+        {
+            "doc1": [make_chunk("doc1_0", "apples and pears", "doc1")],
+            "doc2": [
+                make_chunk("doc2_0", "apples and plums", "doc2"),
+                make_chunk("doc2_1", "only plums", "doc2"),
+            ],
+        }
+    )
+
+    results = await index.search("apples", 5, DocumentMetadataFilter(document_id="doc2"))
+    assert [chunk.id for chunk in results] == ["doc2_0"]
+    assert results[0].text == "apples and plums"
+
+    await index.chunks_deleted({"doc2": ["doc2_1"]})
+    await index.deleted(ids=["doc1"])
+    assert [chunk.id for chunk in await index.search("apples plums", 5)] == ["doc2_0"]
+
+    reloaded = LexicalIndex(path)
+    assert reloaded.index.size == 1
+    assert [chunk.id for chunk in await reloaded.search("apples", 5)] == ["doc2_0"]
+
+    await reloaded.deleted(delete_all=True)
+    assert await reloaded.search("apples", 5) == []
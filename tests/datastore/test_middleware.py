@@ -0,0 +1,301 @@
+import asyncio
+from typing import Dict, List, Optional
+
+import pytest
+
+from datastore import middleware as middleware_module
+from datastore.datastore import DataStore
+from datastore.lexical_index import LexicalIndex
+from datastore.middleware import (
+    DeadlineMiddleware,
+    HybridSearchMiddleware,
+    MetricsMiddleware,
+    RetryMiddleware,
+    apply_middleware,
+    reciprocal_rank_fusion,
+)
+from models.models import (
+    Document,
+    DocumentChunk,
+    DocumentChunkMetadata,
+    DocumentChunkWithScore,
+    DocumentMetadataFilter,
+    Query,
+    QueryResult,
+    QueryWithEmbedding,
+)
+
+
+class FlakyDataStore(DataStore):
+    """
+    Fails the first few calls to query and delete, and can be made slow.
+    """
+
+    def __init__(
+        self,
+        failures: int = 0,
+        delay: float = 0.0,
+        error: Exception = ConnectionError("transient failure"),
+    ):
+        self.failures = failures
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.client = "provider client"
+
+    async def _call(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.calls <= self.failures:
+            raise self.error
+
+    async def query(self, queries: List[Query]) -> List[QueryResult]:
+        await self._call()
+        return [QueryResult(query=query.query, results=[]) for query in queries]
+
+    async def _upsert(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        return list(chunks)
+
+    async def _query(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
+        raise NotImplementedError
+
+    async def _delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        await self._call()
+        return True
+
+
+def test_apply_middleware_stacks_outermost_first(monkeypatch):
+    monkeypatch.setattr(middleware_module, "get_query_result_cache", lambda: None)
+    provider = FlakyDataStore()
+
+    datastore = apply_middleware(provider, "cache, metrics,retry")
+
+    # The cache is skipped when it is disabled
+    assert isinstance(datastore, MetricsMiddleware)
+    assert isinstance(datastore.inner, RetryMiddleware)
+    assert datastore.inner.inner is provider
+    # Attributes of the provider are still reachable
+    assert datastore.client == "provider client"
+
+    assert apply_middleware(provider, "") is provider
+    with pytest.raises(ValueError):
+        apply_middleware(provider, "unknown")
+
+
+@pytest.mark.asyncio
+async def test_metrics_middleware_counts_calls_and_errors():
+    datastore = MetricsMiddleware(FlakyDataStore(failures=1), provider="flaky")
+
+    with pytest.raises(ConnectionError):
+        await datastore.query([Query(query="apples")])
+    await datastore.query([Query(query="apples")])
+    await datastore.delete(ids=["doc"])
+
+    stats = datastore.stats()
+    assert stats["query"]["calls"] == 2
+    assert stats["query"]["errors"] == 1
+    assert stats["delete"]["calls"] == 1
+    assert stats["delete"]["errors"] == 0
+    assert stats["query"]["seconds"] >= 0
+
+    slow = MetricsMiddleware(FlakyDataStore(delay=1), provider="flaky")
+    call = asyncio.ensure_future(slow.query([Query(query="apples")]))
+    await asyncio.sleep(0.01)
+    call.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await call
+    assert slow.stats()["query"]["calls"] == 3
+    assert slow.stats()["query"]["errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_middleware_retries_transient_failures(monkeypatch):
+    # Don't wait between attempts
+    monkeypatch.setattr(
+        middleware_module, "wait_random_exponential", lambda **kwargs: lambda _: 0
+    )
+    provider = FlakyDataStore(failures=2)
+
+    results = await RetryMiddleware(provider, attempts=3).query([Query(query="apples")])
+
+    assert results[0].query == "apples"
+    assert provider.calls == 3
+
+    with pytest.raises(ConnectionError):
+        await RetryMiddleware(FlakyDataStore(failures=5), attempts=2).delete(
+            ids=["doc"]
+        )
+
+
+class ProviderError(Exception):
+    def __init__(self, status: int):
+        super().__init__(f"status {status}")
+        self.status = status
+
+
+@pytest.mark.asyncio
+async def test_retry_middleware_raises_permanent_failures_at_once(monkeypatch):
+    monkeypatch.setattr(
+        middleware_module, "wait_random_exponential", lambda **kwargs: lambda _: 0
+    )
+    provider = FlakyDataStore(failures=5, error=ValueError("invalid filter"))
+
+    with pytest.raises(ValueError):
+        await RetryMiddleware(provider, attempts=3).query([Query(query="apples")])
+    assert provider.calls == 1
+
+    # Provider errors are retried by status: rate limits and server errors only
+    provider = FlakyDataStore(failures=1, error=ProviderError(429))
+    await RetryMiddleware(provider, attempts=3).query([Query(query="apples")])
+    assert provider.calls == 2
+    provider = FlakyDataStore(failures=5, error=ProviderError(400))
+    with pytest.raises(ProviderError):
+        await RetryMiddleware(provider, attempts=3).delete(ids=["doc"])
+    assert provider.calls == 1
+
+
+class RecordingDataStore(FlakyDataStore):
+    """
+    Records the document ids of each upsert attempt.
+    """
+
+    def __init__(self, failures: int = 0, delay: float = 0.0):
+        super().__init__(failures, delay)
+        self.upserted: List[List[Optional[str]]] = []
+
+    async def upsert(
+        self, documents: List[Document], chunk_token_size: Optional[int] = None
+    ) -> List[str]:
+        self.upserted.append([doc.id for doc in documents])
+        await self._call()
+        return [doc.id or "" for doc in documents]
+
+
+@pytest.mark.asyncio
+async def test_retry_middleware_upserts_the_same_ids_on_every_attempt(monkeypatch):
+    monkeypatch.setattr(
+        middleware_module, "wait_random_exponential", lambda **kwargs: lambda _: 0
+    )
+    provider = RecordingDataStore(failures=1)
+
+    ids = await RetryMiddleware(provider, attempts=3).upsert(
+        [Document(text="no id"), Document(id="doc", text="with id")]
+    )
+
+    assert len(provider.upserted) == 2
+    assert provider.upserted[0] == provider.upserted[1] == ids
+    assert ids[0] and ids[1] == "doc"
+
+
+@pytest.mark.asyncio
+async def test_retry_middleware_does_not_retry_writes_past_their_deadline(monkeypatch):
+    monkeypatch.setattr(
+        middleware_module, "wait_random_exponential", lambda **kwargs: lambda _: 0
+    )
+    provider = RecordingDataStore(delay=0.2)
+    datastore = RetryMiddleware(
+        DeadlineMiddleware(
+            provider, query_timeout=0.01, upsert_timeout=0.01, delete_timeout=0.01
+        ),
+        attempts=3,
+    )
+
+    with pytest.raises(asyncio.TimeoutError):
+        await datastore.upsert([Document(id="doc", text="text")])
+    with pytest.raises(asyncio.TimeoutError):
+        await datastore.delete(ids=["doc"])
+    assert len(provider.upserted) == 1
+    assert provider.calls == 2
+
+    # Queries don't write, they are retried
+    with pytest.raises(asyncio.TimeoutError):
+        await datastore.query([Query(query="apples")])
+    assert provider.calls == 5
+
+
+@pytest.mark.asyncio
+async def test_deadline_middleware_times_out_slow_calls():
+    datastore = DeadlineMiddleware(
+        FlakyDataStore(delay=0.2), query_timeout=0.01, delete_timeout=0
+    )
+
+    with pytest.raises(asyncio.TimeoutError):
+        await datastore.query([Query(query="apples")])
+    # A timeout of 0 means no deadline
+    assert await datastore.delete(ids=["doc"])
+
+
+class RankedDataStore(FlakyDataStore):
+    """
+    Returns the same ranking of the chunks written to it for every query.
+    """
+
+    def __init__(self, ranking: List[str]):
+        super().__init__()
+        self.ranking = ranking
+        self.top_k: List[Optional[int]] = []
+
+    async def _upsert(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        self.chunks = {
+            chunk.id: chunk for doc_chunks in chunks.values() for chunk in doc_chunks
+        }
+        return list(chunks)
+
+    async def query(self, queries: List[Query]) -> List[QueryResult]:
+        self.top_k.extend(query.top_k for query in queries)
+        return [
+            QueryResult(
+                query=query.query,
+                results=[
+                    DocumentChunkWithScore(**self.chunks[id].dict(), score=1.0)
+                    for id in self.ranking[: query.top_k]
+                ],
+            )
+            for query in queries
+        ]
+
+
+def test_reciprocal_rank_fusion_favors_chunks_ranked_by_both():
+    def ranking(ids):
+        return [
+            DocumentChunkWithScore(id=id, text=id, metadata=DocumentChunkMetadata(), score=0)
+            for id in ids
+        ]
+
+    fused = reciprocal_rank_fusion([ranking(["a", "b", "c"]), ranking(["c", "d"])], 3, k=60)
+
+    assert [chunk.id for chunk in fused] == ["c", "a", "b"]
+    assert fused[0].score == pytest.approx(1 / 63 + 1 / 61)
+
+
+@pytest.mark.asyncio
+async def test_hybrid_middleware_fuses_lexical_and_vector_results(tmp_path):
+    provider = RankedDataStore(["doc_0", "doc_1", "doc_2"])
+    datastore = HybridSearchMiddleware(
+        provider, LexicalIndex(str(tmp_path / "lexical.sqlite3")), candidates=10
+    )
+    texts = ["a report on apples", "a report on pears", "ticket ABC-123 is fixed"]
+    await datastore.inner._write_chunks(
+        {
+            "doc": [
+                DocumentChunk(
+                    id=f"doc_{i}", text=text, metadata=DocumentChunkMetadata(document_id="doc")
+                )
+                for i, text in enumerate(texts)
+            ]
+        }
+    )
+
+    results = await datastore.query([Query(query="ABC-123", top_k=2)])
+
+    # The vector search is asked for the candidates, the results are cut to top_k
+    assert provider.top_k == [10]
+    assert [chunk.id for chunk in results[0].results] == ["doc_2", "doc_0"]
+
+    await datastore.delete(delete_all=True)
+    assert await datastore.index.search("ABC-123", 2) == []
@@ -0,0 +1,142 @@
+import asyncio
+from typing import Dict, List, Optional
+
+import pytest
+
+import datastore.datastore as datastore_module
+from datastore.datastore import DataStore
+from datastore.middleware import QueryResultCacheMiddleware
+from datastore.result_cache import QueryResultCache
+from services.metrics import QUERY_RESULT_CACHE_HITS, REGISTRY
+from models.models import (
+    DocumentChunk,
+    DocumentChunkMetadata,
+    DocumentChunkWithScore,
+    DocumentMetadataFilter,
+    Query,
+    QueryResult,
+    QueryWithEmbedding,
+)
+
+
+class CountingDataStore(DataStore):
+    """
+    Answers every query with a single chunk tagged with the number of searches so far.
+    """
+
+    def __init__(self):
+        self.searches = 0
+        self.query_delay = 0.0
+
+    async def _upsert(self, chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        return list(chunks)
+
+    async def _query(self, queries: List[QueryWithEmbedding]) -> List[QueryResult]:
+        await asyncio.sleep(self.query_delay)
+        results = []
+        for query in queries:
+            self.searches += 1
+            results.append(
+                QueryResult(
+                    query=query.query,
+                    results=[
+                        DocumentChunkWithScore(
+                            id=f"search-{self.searches}",
+                            text=query.query,
+                            metadata=DocumentChunkMetadata(),
+                            score=1.0,
+                        )
+                    ],
+                )
+            )
+        return results
+
+    async def _delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = None,
+    ) -> bool:
+        return True
+
+
+@pytest.fixture
+def datastore(monkeypatch) -> QueryResultCacheMiddleware:
+    async def get_query_embeddings(queries: List[str]) -> List[List[float]]:
+        return [[0.0] for _ in queries]
+
+    monkeypatch.setattr(datastore_module, "get_query_embeddings", get_query_embeddings)
+
+    inner = CountingDataStore()
+    inner.upsert_manifest = None
+    return QueryResultCacheMiddleware(inner, QueryResultCache(max_size=10, ttl=None))
+
+
+def result_ids(results: List[QueryResult]) -> List[str]:
+    return [result.results[0].id for result in results]
+
+
+@pytest.mark.asyncio
+async def test_repeated_queries_are_served_from_the_cache(datastore):
+    hits = QUERY_RESULT_CACHE_HITS.labels()
+    count = hits.value
+    first = await datastore.query([Query(query="apples", top_k=3)])
+    again = await datastore.query(
+        [Query(query="  apples ", top_k=3), Query(query="pears", top_k=3)]
+    )
+
+    assert datastore.searches == 2
+    assert result_ids(again) == result_ids(first) + ["search-2"]
+    # A hit still echoes the query text of the caller
+    assert again[0].query == "  apples "
+    assert hits.value == count + 1
+    exposition = REGISTRY.expose()
+    assert "retrieval_query_result_cache_misses_total " in exposition
+    assert "retrieval_query_result_cache_hit_rate " in exposition
+
+
+@pytest.mark.asyncio
+async def test_filter_and_top_k_are_part_of_the_key(datastore):
+    await datastore.query([Query(query="apples", top_k=3)])
+    await datastore.query([Query(query="apples", top_k=4)])
+    await datastore.query(
+        [
+            Query(
+                query="apples",
+                top_k=3,
+                filter=DocumentMetadataFilter(document_id="doc"),
+            )
+        ]
+    )
+
+    assert datastore.searches == 3
+
+
+@pytest.mark.asyncio
+async def test_writes_invalidate_the_cache(datastore):
+    query = Query(query="apples", top_k=3)
+    await datastore.query([query])
+
+    await datastore.delete(ids=["doc"])
+    await datastore.query([query])
+    assert datastore.searches == 2
+
+    await datastore.delete_documents(["doc"])
+    await datastore.query([query])
+    assert datastore.searches == 3
+    assert "retrieval_query_result_cache_generation 2.0\n" in REGISTRY.expose()
+
+
+@pytest.mark.asyncio
+async def test_results_computed_during_a_write_are_not_cached(datastore):
+    query = Query(query="apples", top_k=3)
+    datastore.inner.query_delay = 0.02
+
+    in_flight = asyncio.ensure_future(datastore.query([query]))
+    await asyncio.sleep(0.01)
+    await datastore.delete(ids=["doc"])
+    await in_flight
+
+    datastore.inner.query_delay = 0
+    await datastore.query([query])
+    assert datastore.searches == 2
@@ -0,0 +1,119 @@
+import asyncio
+from typing import Dict, List
+
+import pytest
+
+from datastore.upsert_pipeline import group_documents, run_upsert_pipeline
+from models.models import Document, DocumentChunk
+from services import chunks as chunks_service
+
+
+@pytest.fixture
+def events(monkeypatch) -> List[str]:
+    events: List[str] = []
+
+    async def get_embeddings_in_batches(texts: List[str]) -> List[List[float]]:
+        events.append(f"embed {texts[0].split()[0]}")
+        await asyncio.sleep(0.01)
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(
+        chunks_service, "get_embeddings_in_batches", get_embeddings_in_batches
+    )
+    return events
+
+
+def make_documents(n: int) -> List[Document]:
+    return [
+        Document(id=f"doc{i}", text=f"doc{i} is a short document number {i}.")
+        for i in range(n)
+    ]
+
+
+def test_group_documents_respects_max_chars():
+    documents = [Document(text="a" * size) for size in [3, 3, 5, 1, 10]]
+
+    groups = group_documents(documents, max_chars=6)
+
+    assert [[len(doc.text) for doc in group] for group in groups] == [
+        [3, 3],
+        [5, 1],
+        [10],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_overlaps_stages_and_keeps_order(events):
+    async def delete(ids: List[str]) -> None:
+        events.append(f"delete {','.join(ids)}")
+
+    async def write(chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        for doc_chunks in chunks.values():
+            assert all(chunk.embedding is not None for chunk in doc_chunks)
+        events.append(f"write {','.join(chunks)}")
+        await asyncio.sleep(0.05)
+        return list(chunks)
+
+    documents = make_documents(4)
+    doc_ids = await run_upsert_pipeline(
+        documents, None, delete=delete, write=write, batch_chars=1, queue_size=1
+    )
+
+    assert doc_ids == ["doc0", "doc1", "doc2", "doc3"]
+    # Every group is deleted before it is written, and groups are written in order
+    for i in range(4):
+        assert events.index(f"delete doc{i}") < events.index(f"write doc{i}")
+    assert [event for event in events if event.startswith("write")] == [
+        f"write doc{i}" for i in range(4)
+    ]
+    # The next group is embedded while the previous one is being written
+    assert events.index("embed doc1") < events.index("write doc0") + 2
+
+
+@pytest.mark.asyncio
+async def test_pipeline_keeps_the_last_version_of_repeated_document_ids(events):
+    deleted: List[List[str]] = []
+    written: Dict[str, List[str]] = {}
+
+    async def delete(ids: List[str]) -> None:
+        deleted.append(ids)
+
+    async def write(chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        for doc_id, doc_chunks in chunks.items():
+            written[doc_id] = [chunk.text for chunk in doc_chunks]
+        return list(chunks)
+
+    documents = [
+        Document(id="doc0", text="The first version. " * 200),
+        Document(id="doc1", text="Another document."),
+        Document(text="A document without an id."),
+        Document(id="doc0", text="The second version."),
+    ]
+    doc_ids = await run_upsert_pipeline(
+        documents, None, delete=delete, write=write, batch_chars=1
+    )
+
+    assert doc_ids[0] == "doc1" and doc_ids[2] == "doc0"
+    assert deleted == [["doc1"], [], ["doc0"]]
+    # Only the chunks of the last version are written
+    assert written["doc0"] == ["The second version."]
+
+
+@pytest.mark.asyncio
+async def test_pipeline_propagates_errors_and_stops(events):
+    writes: List[str] = []
+
+    async def delete(ids: List[str]) -> None:
+        pass
+
+    async def write(chunks: Dict[str, List[DocumentChunk]]) -> List[str]:
+        writes.extend(chunks)
+        raise RuntimeError("write failed")
+
+    with pytest.raises(RuntimeError, match="write failed"):
+        await run_upsert_pipeline(
+            make_documents(10), None, delete=delete, write=write, batch_chars=1
+        )
+
+    assert writes == ["doc0"]
+    assert len(events) < 10
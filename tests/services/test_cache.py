@@ -0,0 +1,61 @@
+import time
+
+from services.cache import LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache: LRUCache[int] = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {
+        "size": 2,
+        "bytes": 0,
+        "hits": 3,
+        "misses": 1,
+        "hit_rate": 0.75,
+    }
+
+
+def test_lru_cache_expires_entries(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr(time, "monotonic", lambda: now)
+
+    cache: LRUCache[int] = LRUCache(max_size=10, ttl=5)
+    cache.set("a", 1)
+    now += 4
+    assert cache.get("a") == 1
+    now += 2
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_disabled_with_zero_size():
+    cache: LRUCache[int] = LRUCache(max_size=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_lru_cache_bounded_by_bytes():
+    cache: LRUCache[str] = LRUCache(max_size=10, max_bytes=10, sizeof=len)
+    cache.set("a", "xxxx")
+    cache.set("b", "yyyy")
+    assert cache.get("a") == "xxxx"
+    cache.set("c", "zzzz")
+
+    assert cache.get("b") is None
+    assert cache.bytes == 8
+
+    # Replacing an entry doesn't count its old value
+    cache.set("c", "zz")
+    assert cache.bytes == 6
+
+    # A value larger than the whole cache is not stored
+    cache.set("d", "w" * 11)
+    assert cache.get("d") is None
+    assert cache.get("a") == "xxxx"
@@ -0,0 +1,191 @@
+import asyncio
+import random
+from typing import List, Optional
+
+import pytest
+
+from models.models import Document
+from services import chunks as chunks_service
+
+
+@pytest.mark.asyncio
+async def test_get_embeddings_in_batches_keeps_order_and_bounds_concurrency(
+    monkeypatch,
+):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # finish later batches first to make sure order doesn't depend on completion
+        await asyncio.sleep(0.01 / (1 + int(texts[0])))
+        in_flight -= 1
+        return [[float(text)] for text in texts]
+
+    monkeypatch.setattr(chunks_service, "aget_embeddings", aget_embeddings)
+
+    texts = [str(i) for i in range(100)]
+    embeddings = await chunks_service.get_embeddings_in_batches(
+        texts, max_batch_size=7, max_concurrency=3
+    )
+
+    assert embeddings == [[float(i)] for i in range(100)]
+    assert max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_get_document_chunks_assigns_embeddings(monkeypatch):
+    async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(chunks_service, "aget_embeddings", aget_embeddings)
+
+    documents = [
+        Document(id="first-doc", text="The first document. " * 200),
+        Document(id="second-doc", text="The second document."),
+    ]
+    chunks = await chunks_service.get_document_chunks(documents, None)
+
+    assert list(chunks.keys()) == ["first-doc", "second-doc"]
+    assert len(chunks["first-doc"]) > 1
+    for doc_chunks in chunks.values():
+        for chunk in doc_chunks:
+            assert chunk.embedding == [float(len(chunk.text))]
+
+
+def test_get_embedding_batches_respects_token_budget_and_item_cap():
+    texts = ["word " * 10, "word " * 30, "word", "word " * 50, "word " * 5, "word"]
+    token_counts = [
+        len(chunks_service.tokenizer.encode(text, disallowed_special=()))
+        for text in texts
+    ]
+
+    batches = chunks_service.get_embedding_batches(
+        texts, max_batch_tokens=45, max_batch_size=2
+    )
+
+    assert [text for batch in batches for text in batch] == texts
+    for batch in batches:
+        assert len(batch) <= 2
+        if len(batch) > 1:
+            assert sum(token_counts[texts.index(text)] for text in batch) <= 45
+    # the text longer than the budget is sent on its own
+    assert [texts[3]] in batches
+    assert len(batches) == 4
+
+
+def legacy_get_text_chunks(text: str, chunk_token_size: Optional[int]) -> List[str]:
+    # The original quadratic implementation of get_text_chunks, kept as the reference
+    # for the chunk boundaries of the linear one
+    tokenizer = chunks_service.tokenizer
+    if not text or text.isspace():
+        return []
+    tokens = tokenizer.encode(text, disallowed_special=())
+    chunks = []
+    chunk_size = chunk_token_size or chunks_service.CHUNK_SIZE
+    num_chunks = 0
+    while tokens and num_chunks < chunks_service.MAX_NUM_CHUNKS:
+        chunk = tokens[:chunk_size]
+        chunk_text = tokenizer.decode(chunk)
+        if not chunk_text or chunk_text.isspace():
+            tokens = tokens[len(chunk) :]
+            continue
+        last_punctuation = max(
+            chunk_text.rfind("."),
+            chunk_text.rfind("?"),
+            chunk_text.rfind("!"),
+            chunk_text.rfind("\n"),
+        )
+        if (
+            last_punctuation != -1
+            and last_punctuation > chunks_service.MIN_CHUNK_SIZE_CHARS
+        ):
+            chunk_text = chunk_text[: last_punctuation + 1]
+        chunk_text_to_append = chunk_text.replace("\n", " ").strip()
+        if len(chunk_text_to_append) > chunks_service.MIN_CHUNK_LENGTH_TO_EMBED:
+            chunks.append(chunk_text_to_append)
+        tokens = tokens[len(tokenizer.encode(chunk_text, disallowed_special=())) :]
+        num_chunks += 1
+    if tokens:
+        remaining_text = tokenizer.decode(tokens).replace("\n", " ").strip()
+        if len(remaining_text) > chunks_service.MIN_CHUNK_LENGTH_TO_EMBED:
+            chunks.append(remaining_text)
+    return chunks
+
+
+def random_text(rng: random.Random, num_words: int) -> str:
+    words = ["lorem", "ipsum", "dolor", "Übergröße", "日本語の文章", "🙂🙃", "x" * 40]
+    separators = [" ", " ", " ", ". ", "? ", "!", "\n", "\n\n", "   ", "\t"]
+    return "".join(
+        rng.choice(words) + rng.choice(separators) for _ in range(num_words)
+    )
+
+
+@pytest.mark.parametrize("chunk_token_size", [None, 17, 64, 500])
+def test_get_text_chunks_matches_legacy_implementation(chunk_token_size):
+    rng = random.Random(chunk_token_size)
+    texts = [
+        "",
+        "   \n ",
+        "short",
+        "A single sentence without punctuation " * 100,
+        "\n" * 300 + "text after a long run of newlines. " * 50,
+    ] + [random_text(rng, rng.randint(1, 3000)) for _ in range(20)]
+
+    for text in texts:
+        assert chunks_service.get_text_chunks(
+            text, chunk_token_size
+        ) == legacy_get_text_chunks(text, chunk_token_size)
+
+
+def test_get_text_chunks_matches_legacy_implementation_past_max_chunks(monkeypatch):
+    monkeypatch.setattr(chunks_service, "MAX_NUM_CHUNKS", 5)
+    text = random_text(random.Random(0), 2000)
+
+    chunks = chunks_service.get_text_chunks(text, None)
+    assert chunks == legacy_get_text_chunks(text, None)
+    assert len(chunks) == 6
+
+
+@pytest.mark.asyncio
+async def test_get_all_text_chunks_in_process_pool_matches_inline(monkeypatch):
+    rng = random.Random(1)
+    texts = [random_text(rng, rng.randint(0, 3000)) for _ in range(8)] + [""]
+    inline = [chunks_service.get_text_chunks(text, 100) for text in texts]
+
+    monkeypatch.setattr(chunks_service, "CHUNKING_PROCESSES", 2)
+    monkeypatch.setattr(chunks_service, "CHUNKING_PROCESS_MIN_CHARS", 0)
+    try:
+        assert await chunks_service.get_all_text_chunks(texts, 100) == inline
+        assert chunks_service._process_pool is not None
+    finally:
+        chunks_service.shutdown_process_pool()
+
+
+@pytest.mark.asyncio
+async def test_get_embeddings_in_batches_bounds_concurrency_across_calls(monkeypatch):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return [[0.0] for _ in texts]
+
+    monkeypatch.setattr(chunks_service, "aget_embeddings", aget_embeddings)
+
+    await asyncio.gather(
+        *[
+            chunks_service.get_embeddings_in_batches(
+                ["text"] * 10, max_batch_size=1, max_concurrency=2
+            )
+            for _ in range(5)
+        ]
+    )
+
+    assert max_in_flight == 2
@@ -0,0 +1,72 @@
+from typing import List
+
+import pytest
+
+from services.embedding_cache import SQLiteEmbeddingCache, embedding_cache_key
+from services.metrics import EMBEDDING_CACHE_HITS, EMBEDDING_CACHE_MISSES, REGISTRY
+
+
+@pytest.fixture
+def cache(tmp_path) -> SQLiteEmbeddingCache:
+    return SQLiteEmbeddingCache(path=str(tmp_path / "cache.sqlite3"), max_entries=3)
+
+
+def embed_calls():
+    calls: List[List[str]] = []
+
+    async def embed(texts: List[str]) -> List[List[float]]:
+        calls.append(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    return calls, embed
+
+
+def test_cache_key_depends_on_model_and_text():
+    assert embedding_cache_key("ada", "text") == embedding_cache_key("ada", "text")
+    assert embedding_cache_key("ada", "text") != embedding_cache_key("other", "text")
+    assert embedding_cache_key("ada", "text") != embedding_cache_key("ada", "text ")
+
+
+@pytest.mark.asyncio
+async def test_get_or_embed_only_embeds_misses(cache):
+    calls, embed = embed_calls()
+    hits = EMBEDDING_CACHE_HITS.labels("sqlite")
+    misses = EMBEDDING_CACHE_MISSES.labels("sqlite")
+    counts = hits.value, misses.value
+
+    assert await cache.get_or_embed(["a", "bb", "a"], embed) == [
+        [1.0, 0.5],
+        [2.0, 0.5],
+        [1.0, 0.5],
+    ]
+    assert calls == [["a", "bb"]]
+
+    assert await cache.get_or_embed(["bb", "ccc"], embed) == [[2.0, 0.5], [3.0, 0.5]]
+    assert calls == [["a", "bb"], ["ccc"]]
+
+    assert cache.stats() == {"hits": 1, "misses": 4, "hit_rate": 0.2}
+    assert (hits.value, misses.value) == (counts[0] + 1, counts[1] + 4)
+    assert 'retrieval_embedding_cache_hits_total{backend="sqlite"}' in REGISTRY.expose()
+
+
+@pytest.mark.asyncio
+async def test_cache_persists_across_instances(cache, tmp_path):
+    _, embed = embed_calls()
+    await cache.get_or_embed(["persisted"], embed)
+
+    reopened = SQLiteEmbeddingCache(path=str(tmp_path / "cache.sqlite3"))
+    assert len(reopened) == 1
+    calls, embed = embed_calls()
+    assert await reopened.get_or_embed(["persisted"], embed) == [[9.0, 0.5]]
+    assert calls == []
+
+
+@pytest.mark.asyncio
+async def test_cache_evicts_least_recently_used(cache):
+    await cache.set_many({"a": [1.0], "b": [2.0], "c": [3.0]})
+    # touch "a" and "c" so that "b" is the least recently used entry
+    await cache.get_many(["a", "c"])
+    await cache.set_many({"d": [4.0]})
+
+    assert len(cache) == 3
+    assert await cache.get_many(["a", "b", "c", "d"]) == [[1.0], None, [3.0], [4.0]]
@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from services.metrics import (
+    EVENT_LOOP_LAG_SECONDS,
+    STAGE_SECONDS,
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    current_endpoint,
+    monitor_event_loop_lag,
+    time_stage,
+)
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency.", ["op"], buckets=[0.1, 1.0])
+    for value in [0.05, 0.1, 0.5, 2.0]:
+        histogram.labels("query").observe(value)
+
+    assert histogram.expose().splitlines() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{op="query",le="0.1"} 2',
+        'latency_seconds_bucket{op="query",le="1.0"} 3',
+        'latency_seconds_bucket{op="query",le="+Inf"} 4',
+        'latency_seconds_sum{op="query"} 2.65',
+        'latency_seconds_count{op="query"} 4',
+    ]
+
+
+def test_registry_exposes_counters_and_gauges():
+    registry = Registry()
+    errors = registry.register(Counter("errors", "Errors.", ["path"]))
+    in_flight = registry.register(Gauge("in_flight", "In flight."))
+    errors.labels('a "quoted"\\path').inc(2)
+    in_flight.labels().inc()
+    in_flight.labels().dec()
+
+    exposition = registry.expose()
+    assert 'errors_total{path="a \\"quoted\\"\\\\path"} 2.0\n' in exposition
+    assert "in_flight 0.0\n" in exposition
+
+    with pytest.raises(ValueError):
+        errors.labels("a", "b")
+
+
+def test_time_stage_records_the_stage():
+    stage = STAGE_SECONDS.labels("test_stage", "test_provider", "none")
+    count = stage.count
+
+    with time_stage("test_stage", "test_provider"):
+        pass
+    with pytest.raises(RuntimeError):
+        with time_stage("test_stage", "test_provider"):
+            raise RuntimeError
+
+    assert stage.count == count + 2
+
+
+@pytest.mark.asyncio
+async def test_time_stage_labels_the_current_endpoint():
+    query = STAGE_SECONDS.labels("test_stage", "test_provider", "/query")
+    upsert = STAGE_SECONDS.labels("test_stage", "test_provider", "/upsert")
+    query_count, upsert_count = query.count, upsert.count
+
+    async def serve(endpoint: str) -> None:
+        token = current_endpoint.set(endpoint)
+        try:
+            await asyncio.sleep(0)
+            # Tasks started by the request inherit its endpoint
+            await asyncio.ensure_future(stage())
+        finally:
+            current_endpoint.reset(token)
+
+    async def stage() -> None:
+        with time_stage("test_stage", "test_provider"):
+            await asyncio.sleep(0)
+
+    await asyncio.gather(serve("/query"), serve("/upsert"), serve("/query"))
+
+    assert query.count == query_count + 2
+    assert upsert.count == upsert_count + 1
+    assert current_endpoint.get() == "none"
+    assert 'endpoint="/query"' in STAGE_SECONDS.expose()
+
+
+@pytest.mark.asyncio
+async def test_monitor_event_loop_lag_observes_blocked_loop():
+    lag = EVENT_LOOP_LAG_SECONDS.labels()
+    count = lag.count
+
+    monitor = asyncio.ensure_future(monitor_event_loop_lag(interval=0.01))
+    await asyncio.sleep(0.05)
+    monitor.cancel()
+
+    assert lag.count > count
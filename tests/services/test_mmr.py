@@ -0,0 +1,71 @@
+import numpy as np
+
+from models.models import (
+    DocumentChunkMetadata,
+    DocumentChunkWithScore,
+    QueryResult,
+    QueryWithEmbedding,
+)
+from services.mmr import diversify_result, maximal_marginal_relevance
+
+
+def test_mmr_skips_near_duplicates():
+    query = np.array([1.0, 0.0, 0.0])
+    embeddings = np.array(
+        [
+            [0.9, 0.1, 0.0],
+            [0.9, 0.11, 0.0],  # a near duplicate of the first candidate
+            [0.7, 0.0, 0.7],
+        ]
+    )
+
+    assert maximal_marginal_relevance(query, embeddings, 2, diversity=0.0) == [0, 1]
+    assert maximal_marginal_relevance(query, embeddings, 2, diversity=0.7) == [0, 2]
+    assert maximal_marginal_relevance(query, embeddings, 5, diversity=0.7) == [0, 2, 1]
+
+
+def test_mmr_matches_reference_implementation():
+    rng = np.random.default_rng(0)
+    query = rng.normal(size=16)
+    embeddings = rng.normal(size=(40, 16))
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    relevance = unit @ (query / np.linalg.norm(query))
+
+    # The textbook greedy loop, one candidate at a time
+    expected = []
+    for _ in range(10):
+        best, best_score = -1, -np.inf
+        for i in range(len(unit)):
+            if i in expected:
+                continue
+            redundancy = max([max(unit[i] @ unit[j], 0) for j in expected], default=0)
+            score = 0.7 * relevance[i] - 0.3 * redundancy
+            if score > best_score:
+                best, best_score = i, score
+        expected.append(best)
+
+    assert maximal_marginal_relevance(query, embeddings, 10, diversity=0.3) == expected
+
+
+def test_diversify_result_drops_embeddings_and_keeps_order_without_them():
+    def chunk(id, embedding):
+        return DocumentChunkWithScore(
+            id=id,
+            text=id,
+            metadata=DocumentChunkMetadata(),
+            embedding=embedding,
+            score=1.0,
+        )
+
+    query = QueryWithEmbedding(query="q", top_k=2, diversity=0.7, embedding=[1.0, 0.0])
+    result = QueryResult(
+        query="q",
+        results=[chunk("a", [1.0, 0.0]), chunk("b", [1.0, 0.01]), chunk("c", [0.6, 0.8])],
+    )
+
+    diversified = diversify_result(result, query)
+    assert [chunk.id for chunk in diversified.results] == ["a", "c"]
+    assert all(chunk.embedding is None for chunk in diversified.results)
+
+    result.results[1].embedding = None
+    assert [chunk.id for chunk in diversify_result(result, query).results] == ["a", "b"]
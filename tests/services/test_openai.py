@@ -0,0 +1,71 @@
+import asyncio
+from typing import List
+
+import openai
+import pytest
+
+from services import openai as openai_service
+
+
+def fake_response(texts: List[str]) -> dict:
+    return {"data": [{"embedding": [float(len(text)), 0.0]} for text in texts]}
+
+
+@pytest.fixture(autouse=True)
+async def close_session():
+    yield
+    await openai_service.close_session()
+
+
+@pytest.mark.asyncio
+async def test_aget_embeddings_reuses_pooled_session(monkeypatch):
+    sessions = []
+
+    async def acreate(input, **kwargs):
+        sessions.append(openai.aiosession.get())
+        return fake_response(input)
+
+    monkeypatch.setattr(openai.Embedding, "acreate", acreate)
+
+    assert await openai_service.aget_embeddings(["a", "bb"]) == [
+        [1.0, 0.0],
+        [2.0, 0.0],
+    ]
+    await openai_service.aget_embeddings(["ccc"])
+
+    assert sessions[0] is not None
+    assert sessions[0] is sessions[1]
+    # the session is only set for the duration of the request
+    assert openai.aiosession.get() is None
+
+
+@pytest.mark.asyncio
+async def test_aget_embeddings_does_not_block_event_loop(monkeypatch):
+    async def acreate(input, **kwargs):
+        await asyncio.sleep(0.05)
+        return fake_response(input)
+
+    monkeypatch.setattr(openai.Embedding, "acreate", acreate)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    results = await asyncio.gather(
+        *[openai_service.aget_embeddings([str(i)]) for i in range(20)]
+    )
+    assert len(results) == 20
+    assert loop.time() - start < 0.5
+
+
+@pytest.mark.asyncio
+async def test_aget_embeddings_uses_azure_deployment(monkeypatch):
+    calls = []
+
+    async def acreate(input, **kwargs):
+        calls.append(kwargs)
+        return fake_response(input)
+
+    monkeypatch.setattr(openai.Embedding, "acreate", acreate)
+    monkeypatch.setenv("OPENAI_EMBEDDINGMODEL_DEPLOYMENTID", "my-deployment")
+
+    await openai_service.aget_embeddings(["a"])
+    assert calls == [{"deployment_id": "my-deployment"}]
@@ -0,0 +1,118 @@
+import asyncio
+from typing import List
+
+import pytest
+
+from services import query_embeddings
+from services.metrics import QUERY_EMBEDDING_CACHE_HITS, REGISTRY
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    query_embeddings.query_embedding_cache.clear()
+    yield
+    query_embeddings.query_embedding_cache.clear()
+
+
+@pytest.mark.asyncio
+async def test_get_query_embeddings_serves_repeated_queries_from_cache(monkeypatch):
+    calls: List[List[str]] = []
+
+    async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+        calls.append(texts)
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(query_embeddings, "aget_embeddings", aget_embeddings)
+
+    assert await query_embeddings.get_query_embeddings(
+        ["what is x", "what  is x ", "y"]
+    ) == [[9.0], [9.0], [1.0]]
+    assert calls == [["what is x", "y"]]
+
+    assert await query_embeddings.get_query_embeddings(["y", " what is x"]) == [
+        [1.0],
+        [9.0],
+    ]
+    assert calls == [["what is x", "y"]]
+
+
+@pytest.mark.asyncio
+async def test_query_embedding_cache_stats_are_exposed(monkeypatch):
+    async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(query_embeddings, "aget_embeddings", aget_embeddings)
+    hits = QUERY_EMBEDDING_CACHE_HITS.labels()
+    count = hits.value
+
+    await query_embeddings.get_query_embeddings(["stats query"])
+    await query_embeddings.get_query_embeddings(["stats query", "stats query"])
+
+    assert hits.value == count + 1
+    exposition = REGISTRY.expose()
+    assert "retrieval_query_embedding_cache_hits_total " in exposition
+    assert "retrieval_query_embedding_cache_misses_total " in exposition
+    hit_rate = query_embeddings.query_embedding_cache.stats()["hit_rate"]
+    assert f"retrieval_query_embedding_cache_hit_rate {hit_rate!r}\n" in exposition
+
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_are_embedded_in_one_request(monkeypatch):
+    calls: List[List[str]] = []
+
+    async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+        calls.append(texts)
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(query_embeddings, "aget_embeddings", aget_embeddings)
+
+    results = await asyncio.gather(
+        query_embeddings.get_query_embeddings(["a", "bb"]),
+        query_embeddings.get_query_embeddings(["ccc"]),
+        query_embeddings.get_query_embeddings(["bb", "dddd"]),
+    )
+
+    assert results == [[[1.0], [2.0]], [[3.0]], [[2.0], [4.0]]]
+    assert calls == [["a", "bb", "ccc", "dddd"]]
+
+
+@pytest.mark.asyncio
+async def test_batcher_sends_full_batches_early_and_propagates_errors(monkeypatch):
+    calls: List[List[str]] = []
+
+    async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+        calls.append(texts)
+        if "boom" in texts:
+            raise ValueError("boom")
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(query_embeddings, "aget_embeddings", aget_embeddings)
+
+    batcher = query_embeddings.QueryEmbeddingBatcher(window_ms=10_000, max_batch_size=2)
+    assert await asyncio.wait_for(batcher.embed(["a", "bb"]), timeout=1) == [
+        [1.0],
+        [2.0],
+    ]
+
+    with pytest.raises(ValueError):
+        await asyncio.wait_for(batcher.embed(["boom", "c"]), timeout=1)
+    assert calls == [["a", "bb"], ["boom", "c"]]
+
+
+@pytest.mark.asyncio
+async def test_batcher_splits_requests_larger_than_a_batch(monkeypatch):
+    calls: List[List[str]] = []
+
+    async def aget_embeddings(texts: List[str]) -> List[List[float]]:
+        calls.append(texts)
+        await asyncio.sleep(0)
+        return [[float(len(text))] for text in texts]
+
+    monkeypatch.setattr(query_embeddings, "aget_embeddings", aget_embeddings)
+
+    batcher = query_embeddings.QueryEmbeddingBatcher(window_ms=10_000, max_batch_size=2)
+    texts = ["a", "bb", "ccc", "dddd", "eeeee"]
+    embeddings = await asyncio.wait_for(batcher.embed(texts), timeout=1)
+
+    assert embeddings == [[float(len(text))] for text in texts]
+    assert calls == [["a", "bb"], ["ccc", "dddd"], ["eeeee"]]
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from openai.error import RateLimitError
+
+from services.rate_limiter import RateLimiter, get_retry_after
+
+
+def rate_limit_error(headers: dict) -> RateLimitError:
+    return RateLimitError("Rate limit reached", headers=headers)
+
+
+def test_get_retry_after_reads_headers():
+    assert get_retry_after(rate_limit_error({"retry-after": "2"})) == 2.0
+    assert get_retry_after(rate_limit_error({"retry-after-ms": "1500"})) == 1.5
+    assert get_retry_after(rate_limit_error({})) is None
+    assert get_retry_after(ValueError()) is None
+
+
+def test_reserve_paces_requests_and_tokens():
+    rate_limiter = RateLimiter(requests_per_minute=60, tokens_per_minute=600)
+
+    # a full minute of capacity is available up front
+    assert rate_limiter.reserve(tokens=300) == 0
+    assert rate_limiter.reserve(tokens=300) == 0
+    # the tokens bucket is empty, and refills at 10 tokens per second
+    assert rate_limiter.reserve(tokens=100) == pytest.approx(10, abs=0.1)
+
+
+def test_rate_limited_requests_pause_callers_and_halve_concurrency():
+    rate_limiter = RateLimiter(max_concurrency=8)
+
+    rate_limiter.on_rate_limited(retry_after=5)
+    assert rate_limiter.concurrency == 4
+    assert rate_limiter.reserve(tokens=1) == pytest.approx(5, abs=0.1)
+
+    for _ in range(10):
+        rate_limiter.on_success()
+    assert rate_limiter.concurrency == 5
+
+
+@pytest.mark.asyncio
+async def test_limit_bounds_concurrency():
+    rate_limiter = RateLimiter(max_concurrency=3)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def request():
+        nonlocal in_flight, max_in_flight
+        async with rate_limiter.limit(tokens=1):
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+    await asyncio.gather(*[request() for _ in range(10)])
+    assert max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_limit_records_rate_limited_requests():
+    rate_limiter = RateLimiter(max_concurrency=4)
+
+    with pytest.raises(RateLimitError):
+        async with rate_limiter.limit(tokens=1):
+            raise rate_limit_error({"retry-after": "0"})
+
+    assert rate_limiter.concurrency == 2